@@ -0,0 +1,239 @@
+"""Times the hot paths of the checkers engine and compares them against a saved baseline.
+
+Run with run_benchmarks.sh. The first run saves the baseline. Later runs fail if any benchmark
+is slower than the baseline by more than the threshold percentage.
+
+Timings on a busy machine can differ by almost half from one run to the next, so the whole set is run
+several times and each benchmark keeps the median of its best times. The baseline depends on the machine,
+so it is not checked in.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import timeit
+
+from components.checkerboard import Checkerboard
+from components.checkerboard import CheckerGame
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIRECTORY, "benchmark_baseline.json")
+
+# Positions with jumps, multijumps and kings.
+TACTICAL_POSITIONS = [
+    # White can jump twice, choosing the second jump.
+    {
+        18: {"color": "white", "type": "man"},
+        15: {"color": "black", "type": "man"},
+        8: {"color": "black", "type": "man"},
+        7: {"color": "black", "type": "man"},
+    },
+    # White can choose between two jumps.
+    {
+        11: {"color": "white", "type": "man"},
+        7: {"color": "black", "type": "man"},
+        8: {"color": "black", "type": "man"},
+    },
+    # Kings in the middle of a crowded board.
+    {
+        14: {"color": "white", "type": "king"},
+        19: {"color": "white", "type": "king"},
+        10: {"color": "black", "type": "man"},
+        11: {"color": "black", "type": "man"},
+        18: {"color": "black", "type": "man"},
+        23: {"color": "black", "type": "king"},
+        26: {"color": "white", "type": "man"},
+        6: {"color": "black", "type": "man"},
+    },
+    # A long jump across the board.
+    {
+        29: {"color": "white", "type": "man"},
+        25: {"color": "black", "type": "man"},
+        18: {"color": "black", "type": "man"},
+        10: {"color": "black", "type": "man"},
+        2: {"color": "black", "type": "man"},
+    },
+]
+
+def play_random_game(seed, max_plies=200):
+    """Play a random game from the start until a side can't move or the ply limit is reached.
+    Returns the number of plies played.
+    """
+    move_picker = random.Random(seed)
+    game = CheckerGame()
+    for ply in range(max_plies):
+        legal_moves = game.get_current_legal_moves()
+        if not legal_moves:
+            return ply
+        game.apply_move(move_picker.choice(legal_moves), validate=False)
+    return max_plies
+
+def load_terminal_module():
+    """terminal-checkers.py can't be imported by name, so load it from its path.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "terminal_checkers",
+        os.path.join(BENCHMARK_DIRECTORY, "terminal-checkers.py"),
+    )
+    terminal_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(terminal_module)
+    return terminal_module
+
+def build_benchmarks():
+    """Returns a dict mapping each benchmark name to a function that runs it once.
+    """
+    board = Checkerboard()
+    coordinates = [board.location_to_coordinates(location) for location in range(1, 32 + 1)]
+
+    tactical_games = []
+    for position in TACTICAL_POSITIONS:
+        game = CheckerGame()
+        game.board.arrange_board(position)
+        tactical_games.append(game)
+
+    terminal_module = load_terminal_module()
+
+    def location_to_coordinates():
+        for location in range(1, 32 + 1):
+            board.location_to_coordinates(location)
+
+    def coordinates_to_location():
+        for coordinate in coordinates:
+            board.coordinates_to_location(coordinate)
+
+    def peek():
+        for location in range(1, 32 + 1):
+            board.peek(location, "blackright", 1)
+            board.peek(location, "whiteleft", 2)
+
+    def get_piece():
+        for location in range(1, 32 + 1):
+            board.get_piece(location)
+
+    def opening_move_generation():
+        CheckerGame().get_current_legal_moves()
+
+    def tactical_move_generation():
+        for game in tactical_games:
+            game.get_current_legal_moves()
+
+    def random_playouts():
+        for seed in range(4):
+            play_random_game(seed)
+
+    def render_game():
+        board_state = terminal_module.CheckerboardState()
+        display = terminal_module.CheckerboardDisplay(
+            board_state = board_state,
+            output = io.StringIO(),
+        )
+        move_picker = random.Random(0)
+        for ply in range(40):
+            legal_moves = board_state.get_legal_moves()
+            if not legal_moves:
+                break
+            board_state.apply_move(move_picker.choice(legal_moves))
+            display.draw_board()
+
+    return {
+        "board.location_to_coordinates": location_to_coordinates,
+        "board.coordinates_to_location": coordinates_to_location,
+        "board.peek": peek,
+        "board.get_piece": get_piece,
+        "movegen.opening": opening_move_generation,
+        "movegen.tactical": tactical_move_generation,
+        "playout.random_games": random_playouts,
+        "render.full_game": render_game,
+    }
+
+def time_benchmark(function, repeat=5):
+    """Returns the best time, in seconds, for one call of the function.
+    """
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def run_benchmarks(name_filter=None, repeat=5, runs=3):
+    """Run every benchmark whose name contains the filter, runs times over.
+    The runs take turns, so a slow moment on the machine doesn't land on one benchmark every time.
+    Returns a dict mapping the name to the median of its runs, in seconds per call.
+    """
+    benchmarks = [
+        (name, function) for name, function in build_benchmarks().items()
+        if not name_filter or name_filter in name
+    ]
+    timings = dict((name, []) for name, function in benchmarks)
+    for run in range(runs):
+        for name, function in benchmarks:
+            timings[name].append(time_benchmark(function, repeat=repeat))
+    return dict((name, statistics.median(seconds)) for name, seconds in timings.items())
+
+def find_regressions(results, baseline, threshold_percent):
+    """Compare results against the baseline.
+    Returns a list of (name, baseline seconds, result seconds, percent change) for every benchmark
+    slower than the baseline by more than the threshold.
+    """
+    regressions = []
+    for name, seconds in results.items():
+        if not name in baseline:
+            continue
+        change = (seconds - baseline[name]) / baseline[name] * 100
+        if change > threshold_percent:
+            regressions.append((name, baseline[name], seconds, change))
+    return regressions
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as baseline_file:
+        return json.load(baseline_file)["results"]
+
+def save_baseline(path, results):
+    with open(path, "w") as baseline_file:
+        json.dump({"python": sys.version.split()[0], "results": results}, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark the checkers engine.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON file with the baseline results.")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Fail if a benchmark is this many percent slower than the baseline.")
+    parser.add_argument("--save", action="store_true", help="Save these results as the new baseline.")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this text.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing repeats in a run. The best one is kept.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs of every benchmark. The median is kept.")
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(name_filter=arguments.filter, repeat=arguments.repeat, runs=arguments.runs)
+    baseline = load_baseline(arguments.baseline)
+
+    for name, seconds in results.items():
+        line = "{name:32} {micro:12.2f} us".format(name=name, micro=seconds * 1e6)
+        if baseline and name in baseline:
+            line += " {change:+7.1f}%".format(change=(seconds - baseline[name]) / baseline[name] * 100)
+        print (line)
+
+    if arguments.save or baseline is None:
+        # Keep the baseline for benchmarks that were filtered out.
+        merged_results = dict(baseline or {})
+        merged_results.update(results)
+        save_baseline(arguments.baseline, merged_results)
+        print ("Saved baseline to {path}".format(path=arguments.baseline))
+        return 0
+
+    regressions = find_regressions(results, baseline, arguments.threshold)
+    for name, baseline_seconds, seconds, change in regressions:
+        print ("REGRESSION {name}: {before:.2f} us -> {after:.2f} us ({change:+.1f}%)".format(
+            name = name,
+            before = baseline_seconds * 1e6,
+            after = seconds * 1e6,
+            change = change,
+        ))
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import asyncio
+import struct
+
+# Every frame is its length followed by its body. The body starts with a type byte.
+FRAME_HEADER = struct.Struct("<H")
+
+# Frame types.
+STATE_FRAME = b"S"
+MOVE_FRAME = b"M"
+
+# ply, board size, turn (0 White, 1 Black). The packed board follows.
+STATE_HEADER = struct.Struct("<IBB")
+
+# ply, start, end, 1 if the piece was promoted, number of captures. The captured locations follow, one byte each.
+MOVE_HEADER = struct.Struct("<IBBBB")
+
+def encode_state_frame(game):
+    """Returns a frame with the whole board, for new spectators and after takebacks.
+    """
+    body = STATE_FRAME + STATE_HEADER.pack(
+        game.get_ply_count(),
+        game.board.geometry.size,
+        0 if game.get_current_turn() == "White" else 1,
+    ) + game.board.pack()
+    return FRAME_HEADER.pack(len(body)) + body
+
+def encode_move_frame(game, move):
+    """Returns a frame describing the move just applied to the game: the piece that moved,
+    the squares it captured and whether it was promoted.
+    """
+    ply_count = game.get_ply_count()
+    is_promotion = game.history.get_record(ply_count - 1)[2]
+    captures = move.get("jumps_over", ())
+    body = MOVE_FRAME + MOVE_HEADER.pack(
+        ply_count - 1,
+        move["start"],
+        move["end"],
+        1 if is_promotion else 0,
+        len(captures),
+    ) + bytes(captures)
+    return FRAME_HEADER.pack(len(body)) + body
+
+def decode_frame(body):
+    """Returns a dict describing a frame body (the frame without its length).
+    State frames have ply, size, turn and packed_board.
+    Move frames have ply, start, end, promoted and captures.
+    Raises a KeyError if the frame type is unknown.
+    """
+    frame_type = body[:1]
+    if frame_type == STATE_FRAME:
+        ply, size, turn = STATE_HEADER.unpack_from(body, 1)
+        return {
+            "type": "state",
+            "ply": ply,
+            "size": size,
+            "turn": "White" if turn == 0 else "Black",
+            "packed_board": body[1 + STATE_HEADER.size:],
+        }
+    if frame_type == MOVE_FRAME:
+        ply, start, end, promoted, capture_count = MOVE_HEADER.unpack_from(body, 1)
+        captures_offset = 1 + MOVE_HEADER.size
+        return {
+            "type": "move",
+            "ply": ply,
+            "start": start,
+            "end": end,
+            "promoted": bool(promoted),
+            "captures": list(body[captures_offset:captures_offset + capture_count]),
+        }
+    raise KeyError("Frame type is invalid, {frame_type}".format(frame_type=frame_type))
+
+async def read_frame(reader):
+    """Read one frame from an asyncio stream. Returns the decoded frame, or None at the end of the stream.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        body = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    except asyncio.IncompleteReadError:
+        return None
+    return decode_frame(body)
+
+class Spectator(object):
+    """One connection watching the game. Frames wait in a bounded queue until the connection takes them.
+    """
+    def __init__(self, writer, *args, **kwargs):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=kwargs.get("max_queued_frames", 256))
+        self.sender = None
+        self.closed = False
+
+    async def send_frames(self):
+        """Write queued frames until the spectator is closed.
+        Waiting for drain lets the connection's own buffer push back before the queue fills.
+        """
+        try:
+            while True:
+                frame = await self.queue.get()
+                self.writer.write(frame)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.sender is not None and self.sender is not asyncio.current_task():
+            self.sender.cancel()
+        self.writer.close()
+
+class SpectatorBroadcast(object):
+    """Sends every move of a game to any number of spectators.
+
+    Each move is encoded once into a small frame, and the same bytes are queued for every spectator.
+    A spectator whose queue fills up is too slow to keep up and is disconnected,
+    so one slow connection never holds up the game or the other spectators.
+
+    Moves must be applied on the thread running the event loop.
+
+    Options:
+    max_queued_frames: the most frames waiting for each spectator before it is dropped.
+    """
+    def __init__(self, game, *args, **kwargs):
+        self.game = game
+        self.max_queued_frames = kwargs.get("max_queued_frames", 256)
+        self.spectators = []
+        self.frames_sent = 0
+        self.spectators_dropped = 0
+        self.server = None
+
+        game.add_move_listener(self.publish_event)
+
+    def subscribe(self, writer):
+        """Start sending frames to an asyncio stream writer, beginning with the current board.
+        Returns the Spectator.
+        """
+        spectator = Spectator(writer, max_queued_frames=self.max_queued_frames)
+        spectator.queue.put_nowait(encode_state_frame(self.game))
+        spectator.sender = asyncio.ensure_future(spectator.send_frames())
+        self.spectators.append(spectator)
+        return spectator
+
+    def publish_event(self, game, event, details):
+        """Move listener that encodes the change once and queues it for every spectator.
+        Takebacks and new positions send the whole board.
+        """
+        if event == "move":
+            frame = encode_move_frame(game, details)
+        else:
+            frame = encode_state_frame(game)
+        self.publish(frame)
+
+    def publish(self, frame):
+        slow_spectators = []
+        for spectator in self.spectators:
+            if spectator.closed:
+                slow_spectators.append(spectator)
+                continue
+            try:
+                spectator.queue.put_nowait(frame)
+                self.frames_sent += 1
+            except asyncio.QueueFull:
+                slow_spectators.append(spectator)
+                self.spectators_dropped += 1
+
+        for spectator in slow_spectators:
+            spectator.close()
+            self.spectators.remove(spectator)
+
+    async def handle_connection(self, reader, writer):
+        """Connection handler for asyncio.start_server. Spectators only listen, so anything they send is ignored.
+        """
+        spectator = self.subscribe(writer)
+        try:
+            await spectator.sender
+        except asyncio.CancelledError:
+            pass
+
+    async def start_server(self, host="127.0.0.1", port=0):
+        """Listen for spectators. Returns the asyncio server.
+        """
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        """Stop listening, disconnect every spectator and stop following the game.
+        """
+        self.game.remove_move_listener(self.publish_event)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for spectator in self.spectators:
+            spectator.close()
+        self.spectators = []
@@ -1,3 +1,12 @@
+from array import array
+
+from components.geometry import BoardGeometry
+from components.history import MoveHistory
+from components.instrumentation import Instrumentation
+
+class IllegalMoveException(Exception):
+    pass
+
 class Checker(object):
     """Also called a draught, this is an individual piece on the board.
     """
@@ -43,43 +52,63 @@ class Checker(object):
             return "King"
         return "Man"
 
+    def copy(self):
+        """Returns a new checker with the same color and status.
+        """
+        new_checker = Checker()
+        new_checker.color = self.color
+        new_checker.is_captured = self.is_captured
+        new_checker.is_king = self.is_king
+        return new_checker
+
 class Checkerboard(object):
     """ Checkerboard contains multiple Checkers.
     - knows the size of the board
     - knows checker locations
+
+    The board is 8x8 unless a different size is given (for example, size=10 for international draughts).
     """
     def __init__(self, *args, **kwargs):
+        self.geometry = BoardGeometry.for_size(kwargs.get("size", 8))
         self.columns = None
         self.rows = None
         self.pieces_by_location = {}
+        self.locations_by_color = {"White": set(), "Black": set()}
+        # The same locations as bits, bit n set for location n.
+        self.occupancy_by_color = {"White": 0, "Black": 0}
+        self.position_hash = 0
         self.reset_board()
         self.all_checkers = []
 
     def reset_board(self):
         """Reset all of the pieces on the board.
         """
-        # Set the board to 8 rows and 8 columns.
-        self.columns = 8
-        self.rows = 8
+        # Set the board to the geometry's rows and columns.
+        self.columns = self.geometry.columns
+        self.rows = self.geometry.rows
         self.pieces_by_location = {}
         self.all_checkers = []
 
         # Create the Black pieces
-        # They inhabit locations 1-12.
-        for loc in range(1, 12+1):
+        # They inhabit the first locations (1-12 on an 8x8 board).
+        for loc in self.geometry.black_starting_locations:
             newchecker = Checker()
             newchecker.set_color("black")
             self.pieces_by_location[loc] = newchecker
             self.all_checkers.append(newchecker)
 
         # Create the White pieces
-        # They inhabit locations 21-32.
-        for loc in range(21, 32+1):
+        # They inhabit the last locations (21-32 on an 8x8 board).
+        for loc in self.geometry.white_starting_locations:
             newchecker = Checker()
             newchecker.set_color("white")
             self.pieces_by_location[loc] = newchecker
             self.all_checkers.append(newchecker)
 
+        self.position_hash = self.compute_position_hash()
+        self.locations_by_color = self.compute_locations_by_color()
+        self.occupancy_by_color = self.compute_occupancy_by_color()
+
     def arrange_board(self, piece_by_location):
         """Reset the board and rearrange the pieces.
         The key is the location.
@@ -109,6 +138,106 @@ class Checkerboard(object):
             # Set the piece location
             self.pieces_by_location[location] = cap_piece
 
+        self.position_hash = self.compute_position_hash()
+        self.locations_by_color = self.compute_locations_by_color()
+        self.occupancy_by_color = self.compute_occupancy_by_color()
+
+    def pack(self):
+        """Returns the pieces as bytes, two locations per byte.
+        Each location is 4 bits: 0 for empty, or 1 plus the piece's index in BoardGeometry.PIECE_KINDS.
+        """
+        piece_kinds = self.geometry.PIECE_KINDS
+        nibbles = bytearray(self.geometry.squares + 2)
+        for location, checker in self.pieces_by_location.items():
+            nibbles[location] = piece_kinds.index((checker.color, checker.get_type())) + 1
+
+        # Location 1 goes in the low bits of the first byte.
+        return bytes(
+            nibbles[location] | (nibbles[location + 1] << 4)
+            for location in range(1, self.geometry.squares + 1, 2)
+        )
+
+    def unpack(self, packed_board):
+        """Replace every piece with the ones in bytes made by pack.
+        Raises a KeyError if the bytes are for a different board size.
+        """
+        if len(packed_board) * 2 != self.geometry.squares:
+            raise KeyError("Packed board is the wrong size, {length}".format(length=len(packed_board)))
+
+        piece_kinds = self.geometry.PIECE_KINDS
+        self.all_checkers = []
+        self.pieces_by_location = {}
+        for index, packed_byte in enumerate(packed_board):
+            for location, nibble in ((index * 2 + 1, packed_byte & 0xf), (index * 2 + 2, packed_byte >> 4)):
+                if not nibble:
+                    continue
+                color, checker_type = piece_kinds[nibble - 1]
+                checker = Checker()
+                checker.set_color(color)
+                checker.change_is_king(checker_type == "King")
+                self.pieces_by_location[location] = checker
+                self.all_checkers.append(checker)
+
+        self.position_hash = self.compute_position_hash()
+        self.locations_by_color = self.compute_locations_by_color()
+        self.occupancy_by_color = self.compute_occupancy_by_color()
+
+    def compute_locations_by_color(self):
+        """Returns a dict mapping each color to the set of locations its pieces are on.
+        The board keeps locations_by_color up to date as pieces move, so this is only needed after rearranging.
+        """
+        locations_by_color = {"White": set(), "Black": set()}
+        for location, checker in self.pieces_by_location.items():
+            locations_by_color[checker.color].add(location)
+        return locations_by_color
+
+    def compute_occupancy_by_color(self):
+        """Returns a dict mapping each color to a bitmask of the locations its pieces are on, bit n for location n.
+        Like locations_by_color, the board keeps occupancy_by_color up to date as pieces move.
+        """
+        occupancy_by_color = {"White": 0, "Black": 0}
+        for location, checker in self.pieces_by_location.items():
+            occupancy_by_color[checker.color] |= 1 << location
+        return occupancy_by_color
+
+    def copy(self):
+        """Returns a new board with copies of every piece, sharing the same geometry.
+        """
+        new_board = Checkerboard.__new__(Checkerboard)
+        new_board.geometry = self.geometry
+        new_board.columns = self.columns
+        new_board.rows = self.rows
+        new_board.pieces_by_location = {
+            location: checker.copy() for location, checker in self.pieces_by_location.items()
+        }
+        new_board.all_checkers = list(new_board.pieces_by_location.values())
+        new_board.locations_by_color = {
+            color: set(locations) for color, locations in self.locations_by_color.items()
+        }
+        new_board.occupancy_by_color = dict(self.occupancy_by_color)
+        new_board.position_hash = self.position_hash
+        return new_board
+
+    def get_piece_count(self, color):
+        """Returns the number of pieces the given color has on the board.
+        """
+        return len(self.locations_by_color[color])
+
+    def compute_position_hash(self):
+        """Hash every piece on the board from scratch.
+        The board keeps position_hash up to date as pieces move, so this is only needed after rearranging.
+        """
+        hash_keys = self.geometry.hash_keys
+        position_hash = 0
+        for location, checker in self.pieces_by_location.items():
+            position_hash ^= hash_keys[(checker.color, checker.get_type())][location]
+        return position_hash
+
+    def get_position_hash(self):
+        """Returns a 64 bit hash of the pieces on the board.
+        """
+        return self.position_hash
+
     def get_all_pieces_by_location(self):
         """Returns a dict mapping locations with checkers
         to a dict descibing them.
@@ -130,26 +259,16 @@ class Checkerboard(object):
 
     def location_to_coordinates(self, location):
         """Convert location to coordinates.
-        row is 1-8 (Row 1 is on Black's side, Row 8 is on White's side)
+        row is 1-8 (Row 1 is on White's side, Row 8 is on Black's side)
         column is 1-8
+        Larger boards have more rows and columns.
         """
 
-        # If the location is not between 1-32, raise an exception
-        if location < 1 or location > 32:
+        # If the location is not on the board, raise an exception
+        if location < 1 or location > self.geometry.squares:
             raise KeyError("Location is invalid, {loc}".format(loc=location))
 
-        # Divide by 8 and add 1 to get the row.
-        row = 8 - int((location - 1) / 4)
-
-        # Mod by 4 to get the column position.
-        column_position = (location-1) % 4
-
-        # Get the column offset based on the row number.
-        if row % 2 == 0:
-            column = (column_position * 2) + 2
-        else:
-            column = (column_position * 2) + 1
-
+        row, column = self.geometry.coordinates_by_location[location]
         return {
             "row": row,
             "column": column,
@@ -159,32 +278,10 @@ class Checkerboard(object):
         """Convert coordinates to location.
         Returns None if there is no possible location.
         """
-        row = coordinates["row"]
-        col = coordinates["column"]
-
-        # Make sure the row and columns are within the rows and columns.
-        if row < 1 or row > self.rows:
-            return None
-
-        if col < 1 or col > self.columns:
-            return None
-
-        # If the row is even, make sure the column is even
-        if row % 2 == 0 and col % 2 != 0:
-            return None
-
-        # If the row is odd, make sure the column is odd
-        if row % 2 != 0 and col % 2 == 0:
-            return None
-
-        # Figure out the location range based on the row.
-        location = (8 - row) * 4
-
-        # Convert the column to a range from 0-3 and add it to the row location range.
-        location += int((col - 1)  / 2) + 1
-
-        # Return the location.
-        return location
+        return self.geometry.location_by_coordinates.get(
+            (coordinates["row"], coordinates["column"]),
+            None
+        )
 
     def get_piece(self, location):
         """Returns a dict describing the checker found at the given location.
@@ -204,6 +301,80 @@ class Checkerboard(object):
         # return the description
         return found_checker
 
+    def move_piece(self, start, end):
+        """Move the piece at the start location to the end location.
+        Returns True if successful.
+        """
+        # A jump can end on the square it started from.
+        if start == end:
+            return start in self.pieces_by_location
+
+        # Is there a piece at the start, and is the end free?
+        if not start in self.pieces_by_location or end in self.pieces_by_location:
+            return False
+
+        checker = self.pieces_by_location.pop(start)
+        self.pieces_by_location[end] = checker
+
+        color_locations = self.locations_by_color[checker.color]
+        color_locations.discard(start)
+        color_locations.add(end)
+        self.occupancy_by_color[checker.color] ^= (1 << start) | (1 << end)
+
+        hash_keys = self.geometry.hash_keys[(checker.color, checker.get_type())]
+        self.position_hash ^= hash_keys[start] ^ hash_keys[end]
+        return True
+
+    def promote_piece(self, location):
+        """Promote the piece at the given location to a king.
+        Returns True if successful.
+        """
+        if not location in self.pieces_by_location:
+            return False
+
+        checker = self.pieces_by_location[location]
+        if checker.is_king:
+            return True
+
+        self.position_hash ^= self.geometry.hash_keys[(checker.color, "Man")][location]
+        checker.promote_to_king()
+        self.position_hash ^= self.geometry.hash_keys[(checker.color, "King")][location]
+        return True
+
+    def demote_piece(self, location):
+        """Turn the king at the given location back into a man. Used to take back a move.
+        Returns True if successful.
+        """
+        if not location in self.pieces_by_location:
+            return False
+
+        checker = self.pieces_by_location[location]
+        if not checker.is_king:
+            return True
+
+        self.position_hash ^= self.geometry.hash_keys[(checker.color, "King")][location]
+        checker.change_is_king(False)
+        self.position_hash ^= self.geometry.hash_keys[(checker.color, "Man")][location]
+        return True
+
+    def add_piece(self, location, color, checker_type):
+        """Put a new piece on an empty location. Used to take back a capture.
+        Returns True if successful.
+        """
+        if location in self.pieces_by_location:
+            return False
+
+        checker = Checker()
+        checker.set_color(color)
+        checker.change_is_king(checker_type.lower() == "king")
+
+        self.pieces_by_location[location] = checker
+        self.all_checkers.append(checker)
+        self.locations_by_color[checker.color].add(location)
+        self.occupancy_by_color[checker.color] |= 1 << location
+        self.position_hash ^= self.geometry.hash_keys[(checker.color, checker.get_type())][location]
+        return True
+
     def capture_piece(self, location):
         """Capture the piece found at the given location.
         Returns True if successful.
@@ -215,6 +386,9 @@ class Checkerboard(object):
         # Mark the piece as captured.
         checker = self.pieces_by_location[location]
         checker.capture()
+        self.position_hash ^= self.geometry.hash_keys[(checker.color, checker.get_type())][location]
+        self.locations_by_color[checker.color].discard(location)
+        self.occupancy_by_color[checker.color] &= ~(1 << location)
 
         # Remove from the board.
         del[self.pieces_by_location[location]]
@@ -242,32 +416,20 @@ class Checkerboard(object):
             "location": None,
         }
 
-        # Validate the direction.
-        vertical = {
-            "blackright": 1,
-            "blackleft": 1,
-            "whiteright": -1,
-            "whiteleft": -1,
-        }
-        look_up = vertical[direction]
-
-        horizontal = {
-            "blackright": 1,
-            "blackleft": -1,
-            "whiteright": 1,
-            "whiteleft": -1,
-        }
-        look_right = horizontal[direction]
-
-        # Convert the location to coordinates.
-        coordinates = self.location_to_coordinates(location)
-
-        # Based on the direction, change coordinates to the number of squares.
-        coordinates["row"] += look_up * spaces
-        coordinates["column"] += look_right * spaces
+        # Validate the direction and location.
+        rays = self.geometry.rays[direction]
+        if location < 1 or location > self.geometry.squares:
+            raise KeyError("Location is invalid, {loc}".format(loc=location))
 
-        # Convert back to a location.
-        new_location = self.coordinates_to_location(coordinates)
+        # Walk along the precomputed diagonal.
+        if spaces > 0:
+            ray = rays[location]
+            new_location = ray[spaces - 1] if spaces <= len(ray) else None
+        elif spaces == 0:
+            new_location = location
+        else:
+            ray = self.geometry.rays[self.get_opposite_direction(direction)][location]
+            new_location = ray[-spaces - 1] if -spaces <= len(ray) else None
 
         # Indicate if it's offscreen
         if new_location == None:
@@ -277,10 +439,10 @@ class Checkerboard(object):
         peek_description["location"] = new_location
 
         # If there is a piece, fill in the color and type.
-        all_pieces = self.get_all_pieces_by_location()
-        if new_location in all_pieces:
-            peek_description["color"] = all_pieces[new_location]["color"]
-            peek_description["type"] = all_pieces[new_location]["type"]
+        checker = self.pieces_by_location.get(new_location, None)
+        if checker is not None:
+            peek_description["color"] = checker.get_color()
+            peek_description["type"] = checker.get_type()
             return peek_description
 
         # Otherwise return an empty space.
@@ -309,20 +471,151 @@ class Checkerboard(object):
 
 class CheckerGame(object):
     """A Game of Checkers tracks the board, the turn and determines valid moves.
+    Pass size to play on a larger board, like size=10 for international draughts.
+    Pass flying_kings=True to let kings move and jump any distance along a diagonal.
+    The history saves the board every checkpoint_interval plies so seek can rebuild any earlier position quickly.
+    Pass a MoveCache as move_cache to remember the legal moves of positions that are asked about again.
     """
+
+    # Directions each type of piece can move in.
+    DIRECTIONS_BY_DESCRIPTION = {
+        "White Man": ('blackright', 'blackleft'),
+        "White King": ('blackright', 'blackleft', 'whiteright', 'whiteleft'),
+        "Black Man": ('whiteright', 'whiteleft'),
+        "Black King": ('whiteright', 'whiteleft', 'blackright', 'blackleft', )
+    }
+
+    # Methods that are counted when instrumentation is enabled.
+    # The checker and flying king methods call themselves for each further jump, so their max_depth is the longest jump.
+    INSTRUMENTED_GAME_METHODS = (
+        "get_current_legal_moves",
+        "generate_legal_moves",
+        "get_legal_moves_for_checker",
+        "get_flying_king_jumps",
+        "apply_move",
+        "undo_move",
+    )
+
     def __init__(self, *args, **kwargs):
-        self.board = Checkerboard()
+        self.board = Checkerboard(size=kwargs.get("size", 8))
+        self.flying_kings = kwargs.get("flying_kings", False)
         self.current_turn = None
-        self.move_history = []
+
+        # Packed moves, with what each captured and whether it promoted, so they can be taken back.
+        self.history = MoveHistory(checkpoint_interval=kwargs.get("checkpoint_interval", 32))
+
+        # The game is drawn after this many moves per side without a capture or a man moving.
+        # Use None to turn the rule off.
+        self.draw_move_limit = kwargs.get("draw_move_limit", 40)
+
+        # Hash of every position since the first move, and the index of the last one reached by a capture or a man moving.
+        self.position_hashes = array("Q")
+        self.last_irreversible_index = 0
+        self.instrumentation = None
+        self.move_cache = kwargs.get("move_cache", None)
+
+        # Functions called as listener(game, event, details) when the position changes.
+        # "move" passes the applied move, "seek" the number of moves left after taking some back,
+        # and "position" is sent when the game starts over from a new position.
+        self.move_listeners = []
 
         self.reset_game()
 
+        if kwargs.get("instrumentation", None):
+            self.enable_instrumentation(kwargs["instrumentation"])
+
+    def copy(self, move_cache=None):
+        """Returns a new game in the same position with the same rules and history.
+        Enabled instrumentation is carried over, so the searchers' work on copies adds to the same counts.
+        Move listeners are not copied. Neither is the move cache, so searching a copy
+        never fills the cache with search positions or touches it from another thread.
+        Pass move_cache to give the copy one.
+        """
+        new_game = CheckerGame.__new__(CheckerGame)
+        new_game.board = self.board.copy()
+        new_game.flying_kings = self.flying_kings
+        new_game.current_turn = self.current_turn
+        new_game.history = self.history.copy()
+        new_game.draw_move_limit = self.draw_move_limit
+        new_game.position_hashes = array("Q", self.position_hashes)
+        new_game.last_irreversible_index = self.last_irreversible_index
+        new_game.instrumentation = None
+        new_game.move_cache = move_cache
+        new_game.move_listeners = []
+        if self.instrumentation is not None:
+            new_game.enable_instrumentation(self.instrumentation)
+        return new_game
+
+    def enable_instrumentation(self, instrumentation=None):
+        """Count calls and time spent in the move generation primitives for this game and its copies.
+        Returns the Instrumentation object holding the counts.
+        """
+        if self.instrumentation is not None:
+            self.disable_instrumentation()
+
+        self.instrumentation = instrumentation or Instrumentation()
+
+        # Shadow the methods on this instance. Other games keep calling the originals.
+        for method_name in self.INSTRUMENTED_GAME_METHODS:
+            setattr(self, method_name, self.instrumentation.wrap(
+                "CheckerGame." + method_name,
+                getattr(self, method_name),
+            ))
+
+        return self.instrumentation
+
+    def disable_instrumentation(self):
+        """Stop counting calls. Returns the Instrumentation object with the final counts.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return None
+
+        for method_name in self.INSTRUMENTED_GAME_METHODS:
+            self.__dict__.pop(method_name, None)
+
+        self.instrumentation = None
+        return instrumentation
+
+    def add_move_listener(self, listener):
+        """Call listener(game, event, details) whenever a move is applied or taken back,
+        or the game starts over. See move_listeners.
+        """
+        self.move_listeners.append(listener)
+
+    def remove_move_listener(self, listener):
+        if listener in self.move_listeners:
+            self.move_listeners.remove(listener)
+
+    def notify_move_listeners(self, event, details):
+        for listener in self.move_listeners:
+            listener(self, event, details)
+
     def reset_game(self):
         """Resets the game.
         """
         self.current_turn = "White"
-        self.move_history = []
         self.board.reset_board()
+        self.clear_history()
+        self.notify_move_listeners("position", None)
+
+    def clear_history(self):
+        """Forget every move, so the current position becomes the start of the game.
+        """
+        self.history.clear()
+        self.position_hashes = array("Q")
+        self.last_irreversible_index = 0
+
+    def set_position(self, piece_by_location, turn="White"):
+        """Start the game from the given pieces, with the given color to move.
+        piece_by_location is in the format Checkerboard.arrange_board takes.
+        Raises a KeyError if the turn is not White or Black.
+        """
+        current_turn = {"white": "White", "black": "Black"}[turn.lower()]
+        self.board.arrange_board(piece_by_location)
+        self.current_turn = current_turn
+        self.clear_history()
+        self.notify_move_listeners("position", None)
 
     def get_current_turn(self):
         return self.current_turn
@@ -336,26 +629,331 @@ class CheckerGame(object):
             self.current_turn = "White"
 
     def get_move_history(self):
-        return self.move_history
+        """Returns a list of every move played, as dicts.
+        """
+        return self.history.get_moves()
+
+    def get_ply_count(self):
+        """Returns the number of moves played so far, counting each player's move.
+        """
+        return len(self.history)
+
+    def find_legal_move(self, move):
+        """Look for the legal move matching the given move.
+        The move needs a start and an end. A move with lands or jumps_over is a jump, and only matches a jump
+        with the same landings and jumped pieces. A move with neither only matches a simple move,
+        so 11-15 is never taken as a capture.
+        Returns None if the move is not legal.
+        """
+        is_jump = "lands" in move or "jumps_over" in move
+        for legal_move in self.get_current_legal_moves():
+            if legal_move["start"] != move["start"] or legal_move["end"] != move["end"]:
+                continue
+
+            if ("jumps_over" in legal_move) != is_jump:
+                continue
+            if "lands" in move and legal_move["lands"] != move["lands"]:
+                continue
+            if "jumps_over" in move and legal_move["jumps_over"] != move["jumps_over"]:
+                continue
+
+            return legal_move
+
+        return None
+
+    def apply_move(self, move, validate=True):
+        """Move a piece, capture everything it jumped over and end the turn.
+        If validate is True, raises an IllegalMoveException if the move is not legal.
+        Returns the move that was applied.
+        """
+        if validate:
+            legal_move = self.find_legal_move(move)
+            if legal_move is None:
+                raise IllegalMoveException("Move is not legal, {move}".format(move=move))
+            move = legal_move
+
+        # Remember the position before the first move, and every so often after that.
+        if not self.position_hashes:
+            self.position_hashes.append(self.get_position_hash())
+        ply = len(self.history)
+        if self.history.needs_checkpoint(ply):
+            self.history.add_checkpoint(ply, self.board.pack(), self.current_turn)
+
+        # Captures and men moving can never be undone, so earlier positions can't repeat.
+        is_irreversible = "jumps_over" in move or not self.board.pieces_by_location[move["start"]].is_king
+
+        captured_kings, is_promotion = self.move_pieces(move)
+        self.history.append(move, captured_kings, is_promotion, is_irreversible)
+        self.end_turn()
+
+        self.position_hashes.append(self.get_position_hash())
+        if is_irreversible:
+            self.last_irreversible_index = len(self.position_hashes) - 1
+
+        if self.move_listeners:
+            self.notify_move_listeners("move", move)
+        return move
+
+    def move_pieces(self, move):
+        """Move a piece, capture everything it jumped over and promote it if it reached the far row.
+        Doesn't check the move, record it or end the turn.
+        Returns a list with True for each captured piece that was a king, and whether the piece was promoted.
+        """
+        start = move["start"]
+        end = move["end"]
+        pieces_by_location = self.board.pieces_by_location
+
+        # Move the piece and remove the pieces it jumped over, remembering what they were.
+        captured_kings = []
+        self.board.move_piece(start, end)
+        for jumped_location in move.get("jumps_over", ()):
+            captured_kings.append(pieces_by_location[jumped_location].is_king)
+            self.board.capture_piece(jumped_location)
+
+        # Men who reach the far row become kings.
+        # White heads towards row 8, Black heads towards row 1.
+        checker = pieces_by_location[end]
+        if not checker.is_king:
+            end_row = self.board.geometry.coordinates_by_location[end][0]
+            if (checker.color == "White" and end_row == self.board.rows) or (checker.color == "Black" and end_row == 1):
+                self.board.promote_piece(end)
+                return captured_kings, True
+
+        return captured_kings, False
+
+    def undo_move(self, notify=True):
+        """Take back the last move, putting back everything it captured.
+        Move listeners are told unless notify is False.
+        Returns the move that was taken back, or None if no moves have been made.
+        """
+        if not len(self.history):
+            return None
+
+        move, captured_kings, is_promotion, is_irreversible = self.history.pop()
+
+        if is_promotion:
+            self.board.demote_piece(move["end"])
+        self.board.move_piece(move["end"], move["start"])
+
+        # The captured pieces belonged to the player who didn't make the move.
+        captured_color = self.current_turn
+        for jumped_location, is_king in zip(move.get("jumps_over", ()), captured_kings):
+            self.board.add_piece(jumped_location, captured_color, "King" if is_king else "Man")
+
+        self.end_turn()
+        self.position_hashes.pop()
+        if is_irreversible:
+            self.last_irreversible_index = self.find_last_irreversible_index()
+
+        if notify and self.move_listeners:
+            self.notify_move_listeners("seek", len(self.history))
+        return move
+
+    def find_last_irreversible_index(self):
+        """Returns the index in position_hashes of the last position reached by a capture or a man moving.
+        """
+        history = self.history
+        for ply in range(len(history) - 1, -1, -1):
+            if history.is_irreversible(ply):
+                return ply + 1
+        return 0
+
+    def seek(self, ply):
+        """Go back to the position before the given ply (counting from 0), dropping the later moves.
+        Either takes back moves one at a time or rebuilds the board from the nearest checkpoint,
+        whichever needs fewer moves.
+        Raises a KeyError if the ply is not between 0 and the number of moves played.
+        """
+        ply_count = len(self.history)
+        if ply < 0 or ply > ply_count:
+            raise KeyError("Ply is invalid, {ply}".format(ply=ply))
+
+        checkpoint = self.history.get_checkpoint(ply)
+        if checkpoint is None or ply_count - ply <= ply - checkpoint[0]:
+            for undo_count in range(ply_count - ply):
+                self.undo_move(notify=False)
+        else:
+            checkpoint_ply, packed_board, turn = checkpoint
+            self.board.unpack(packed_board)
+            self.current_turn = turn
+            for replay_ply in range(checkpoint_ply, ply):
+                self.move_pieces(self.history.get_move(replay_ply))
+                self.end_turn()
+
+            self.history.truncate(ply)
+            del self.position_hashes[ply + 1:]
+            self.last_irreversible_index = self.find_last_irreversible_index()
+
+        if ply != ply_count:
+            self.notify_move_listeners("seek", ply)
+
+    def takeback(self, plies=1):
+        """Take back the last few moves. Returns the number of moves taken back.
+        """
+        plies = min(plies, len(self.history))
+        self.seek(len(self.history) - plies)
+        return plies
+
+    def position_at(self, ply):
+        """Returns a new game in the position before the given ply, leaving this game alone.
+        Raises a KeyError if the ply is not between 0 and the number of moves played.
+        """
+        game = self.copy()
+        game.seek(ply)
+        return game
+
+    def get_position_hash(self):
+        """Returns a 64 bit hash of the pieces on the board and whose turn it is.
+        """
+        if self.current_turn == "Black":
+            return self.board.position_hash ^ self.board.geometry.black_to_move_hash_key
+        return self.board.position_hash
+
+    def get_repetition_count(self):
+        """Returns how many times the current position has been reached, counting this time.
+        Only looks back as far as the last capture or man move.
+        """
+        if not self.position_hashes:
+            return 1
+
+        # The same player must be moving, so only check every other position.
+        position_hashes = self.position_hashes
+        current_hash = position_hashes[-1]
+        repetitions = 1
+        for index in range(len(position_hashes) - 3, self.last_irreversible_index - 1, -2):
+            if position_hashes[index] == current_hash:
+                repetitions += 1
+        return repetitions
+
+    def get_plies_without_progress(self):
+        """Returns the number of plies since the last capture or man move.
+        """
+        if not self.position_hashes:
+            return 0
+        return len(self.position_hashes) - 1 - self.last_irreversible_index
+
+    def get_draw_reason(self):
+        """Returns why the game is drawn, or None if it isn't.
+        "repetition" - the same position has been reached three times with the same player to move.
+        "move limit" - neither side has captured or moved a man for draw_move_limit moves each.
+        """
+        if self.get_repetition_count() >= 3:
+            return "repetition"
+
+        if self.draw_move_limit is not None and self.get_plies_without_progress() >= self.draw_move_limit * 2:
+            return "move limit"
+
+        return None
+
+    def is_draw(self):
+        return self.get_draw_reason() is not None
+
+    def get_opponent(self, color):
+        if color == "White":
+            return "Black"
+        return "White"
+
+    def has_any_move(self, color=None):
+        """Returns True if the given color (or the current player) can make at least one move.
+        Stops at the first move it finds, so it is much cheaper than generating every legal move.
+        """
+        color = color or self.current_turn
+        pieces_by_location = self.board.pieces_by_location
+        neighbors = self.board.geometry.neighbors
+        jumps = self.board.geometry.jumps
+
+        for location in self.board.locations_by_color[color]:
+            checker = pieces_by_location[location]
+            for direction in self.DIRECTIONS_BY_DESCRIPTION[color + " " + checker.get_type()]:
+                neighbor_location = neighbors[direction][location]
+                if not neighbor_location:
+                    continue
+
+                # An empty neighbor is a move, even for flying kings.
+                neighbor_checker = pieces_by_location.get(neighbor_location, None)
+                if neighbor_checker is None:
+                    return True
+
+                # An opponent with an empty square behind it can be jumped.
+                if neighbor_checker.color != color:
+                    landing_location = jumps[direction][location]
+                    if landing_location and not landing_location in pieces_by_location:
+                        return True
+
+        return False
+
+    def get_winner(self):
+        """Returns the color that won, or None if nobody has won yet.
+        A player with no pieces, or no legal moves on their turn, loses.
+        """
+        current_turn = self.current_turn
+        opponent = self.get_opponent(current_turn)
+
+        if self.board.get_piece_count(current_turn) == 0:
+            return opponent
+        if self.board.get_piece_count(opponent) == 0:
+            return current_turn
+        if not self.has_any_move(current_turn):
+            return opponent
+        return None
+
+    def get_result(self):
+        """Returns "White" or "Black" if that color won, "Draw" if the game is drawn,
+        or None if the game is still going.
+        """
+        winner = self.get_winner()
+        if winner is not None:
+            return winner
+        if self.is_draw():
+            return "Draw"
+        return None
+
+    def is_game_over(self):
+        return self.get_result() is not None
 
     def get_current_legal_moves(self):
         """Look at the current turn and the board to determine all of the legal moves on the board.
+        Uses the move cache if the game has one.
         Returns a list of dicts.
         start - Integer containing the start location
         end - Integer containing the end location
         """
+        move_cache = self.move_cache
+        if move_cache is None:
+            return self.generate_legal_moves()
+
+        key = (self.get_position_hash(), self.current_turn, self.board.geometry.size, self.flying_kings)
+        legal_moves = move_cache.get(key)
+        if legal_moves is None:
+            legal_moves = self.generate_legal_moves()
+            move_cache.put(key, legal_moves)
+
+        # Callers may reorder or shuffle the list, so give them their own.
+        return list(legal_moves)
+
+    def generate_legal_moves(self):
+        """Generate every legal move for the current turn, without the move cache.
+        See get_current_legal_moves.
+        """
         # Whose turn is it, again?
         current_turn = self.current_turn
 
         # Ask the board for all of the pieces with that color.
-        all_pieces = self.board.get_all_pieces_by_location()
-        matching_pieces = [ v for k,v in all_pieces.items() if v["color"] == current_turn ]
+        pieces_by_location = self.board.pieces_by_location
+        matching_locations = self.board.locations_by_color[current_turn]
 
         # For each piece
         all_legal_moves = []
-        for checker_info in matching_pieces:
+        for location in matching_locations:
+            checker = pieces_by_location[location]
+            checker_info = {
+                "location": location,
+                "color": checker.color,
+                "type": checker.get_type(),
+            }
+
             # Ask each piece for its legal moves
-            legal_moves_for_piece = self.get_legal_moves_for_checker(checker_info, all_pieces)
+            legal_moves_for_piece = self.get_legal_moves_for_checker(checker_info, pieces_by_location)
 
             # Add all of those locations to the results
             all_legal_moves += legal_moves_for_piece
@@ -363,8 +961,9 @@ class CheckerGame(object):
         # Return all results.
         return all_legal_moves
 
-    def get_legal_moves_for_checker(self, checker_info, all_pieces_info, previous_jump_direction = None):
+    def get_legal_moves_for_checker(self, checker_info, all_pieces_info, previous_jump_direction = None, jumped_locations = ()):
         """Looks at the legal moves for the checker at the given location.
+        jumped_locations lists the pieces already jumped during this move. They can't be jumped again.
         Returns a list of dicts. See get_current_legal_moves for a description.
         """
 
@@ -374,51 +973,57 @@ class CheckerGame(object):
         start_location = checker_info["location"]
         checker_desc = color + " " + checker_type
 
-        # Generate directions for this piece.
-        directions_by_description = {
-            "White Man": ['blackright', 'blackleft'],
-            "White King": ['blackright', 'blackleft', 'whiteright', 'whiteleft'],
-            "Black Man": ['whiteright', 'whiteleft'],
-            "Black King": ['whiteright', 'whiteleft', 'blackright', 'blackleft', ]
-        }
+        if self.flying_kings and checker_type == "King":
+            return self.get_legal_moves_for_flying_king(checker_info)
 
         # Remove any directions you've already jumped from.
-        directions = directions_by_description[checker_desc]
+        directions = self.DIRECTIONS_BY_DESCRIPTION[checker_desc]
 
         if previous_jump_direction:
             opposite_jump_direction = self.board.get_opposite_direction(previous_jump_direction)
             directions = [d for d in directions if d != opposite_jump_direction]
 
+        # Look up the neighboring squares in the board's precomputed tables.
+        pieces_by_location = self.board.pieces_by_location
+        neighbors = self.board.geometry.neighbors
+        jumps = self.board.geometry.jumps
+
         # For each direction
         legal_moves_without_jumps = []
         legal_moves_with_jumps = []
         for direction in directions:
-            # Peek 1 square.
-            info = self.board.peek(start_location, direction, 1)
-
-            # If the square is unoccupied and on the board, add this move to the list and move on.
-            if info["empty"] and not info["offboard"]:
+            # Look 1 square ahead. Skip it if it's off the board.
+            neighbor_location = neighbors[direction][start_location]
+            if not neighbor_location:
+                continue
+
+            # If the square is unoccupied, add this move to the list and move on.
+            neighbor_checker = pieces_by_location.get(neighbor_location, None)
+            if neighbor_checker is None:
                 legal_moves_without_jumps.append({
                     "start": start_location,
-                    "end": info["location"],
+                    "end": neighbor_location,
                 })
+                continue
 
             # If the square belongs to a different color, we may be able to jump!
-            if not(info["offboard"] or info["empty"]) and info["color"] != color:
-                # Peek 2 squares away and make sure it's an empty space you can land on.
-                two_square_info = self.board.peek(start_location, direction, 2)
+            # Each piece can only be jumped once per move.
+            if neighbor_checker.color != color and not neighbor_location in jumped_locations:
+                # Look 2 squares away and make sure it's an empty space you can land on.
+                landing_location = jumps[direction][start_location]
 
-                if two_square_info["empty"] and not two_square_info["offboard"]:
+                if landing_location and not landing_location in pieces_by_location:
                     # We need to check for multiple jumps.
                     # Recursively call this function, and pass in this direction as the previous jump direction so there is no infinite jump loop.
                     other_jumps = self.get_legal_moves_for_checker(
                         checker_info = {
                             "color" : color,
                             "type" : checker_type,
-                            "location" : two_square_info["location"],
+                            "location" : landing_location,
                         },
                         all_pieces_info = all_pieces_info,
                         previous_jump_direction = direction,
+                        jumped_locations = jumped_locations + (neighbor_location,),
                     )
 
                     # Only keep legal actions that have a jump.
@@ -427,9 +1032,9 @@ class CheckerGame(object):
                     # If there are no other jumps, then add this move as a jump.
                     initial_jump = {
                         "start": start_location,
-                        "jumps_over": [ info["location"] ],
-                        "lands" : [ two_square_info["location"] ],
-                        "end": two_square_info["location"],
+                        "jumps_over": [ neighbor_location ],
+                        "lands" : [ landing_location ],
+                        "end": landing_location,
                     }
 
                     if not other_jumps:
@@ -448,8 +1053,8 @@ class CheckerGame(object):
 
                         # If there is no jump listing, then create one with the end point
                         if not "jumps_over" in new_multi_jump:
-                            new_multi_jump["jumps_over"] = [ info["location"] ]
-                            new_multi_jump["lands"] = [ two_square_info["location"] ]
+                            new_multi_jump["jumps_over"] = [ neighbor_location ]
+                            new_multi_jump["lands"] = [ landing_location ]
 
                         # Append new jump onto current list of jumps
                         new_multi_jump["jumps_over"].extend(j["jumps_over"])
@@ -465,7 +1070,108 @@ class CheckerGame(object):
             return legal_moves_with_jumps
         return legal_moves_without_jumps
 
+    def get_legal_moves_for_flying_king(self, checker_info):
+        """Looks at the legal moves for a king that can move any distance along a diagonal.
+        It can jump an opposing piece any distance away and land on any empty square beyond it.
+        Returns a list of dicts. See get_current_legal_moves for a description.
+        """
+        color = checker_info["color"]
+        start_location = checker_info["location"]
+        occupancy_by_color = self.board.occupancy_by_color
+
+        # The king's own square is empty once it starts moving.
+        opponent_occupied = occupancy_by_color[self.get_opponent(color)]
+        occupied = (occupancy_by_color[color] | opponent_occupied) & ~(1 << start_location)
+
+        legal_moves_without_jumps = []
+        for direction in self.DIRECTIONS_BY_DESCRIPTION[color + " King"]:
+            ray = self.board.geometry.rays[direction][start_location]
+            blockers = self.board.geometry.ray_masks[direction][start_location] & occupied
+            nearest = self.board.geometry.get_nearest_on_ray(direction, blockers)
+
+            # Every square before the first blocker is a legal move.
+            if nearest:
+                empty_squares = ray[:self.board.geometry.ray_indexes[direction][start_location][nearest]]
+            else:
+                empty_squares = ray
+            for end_location in empty_squares:
+                legal_moves_without_jumps.append({
+                    "start": start_location,
+                    "end": end_location,
+                })
+
+        legal_moves_with_jumps = self.get_flying_king_jumps(
+            start_location = start_location,
+            occupied = occupied,
+            opponent_occupied = opponent_occupied,
+            previous_jump_direction = None,
+            jumped_locations = (),
+            lands = (),
+        )
+
+        # If any moves have a jump in it, you must remove all non-jump moves.
+        if len(legal_moves_with_jumps) > 0:
+            for move in legal_moves_with_jumps:
+                move["start"] = start_location
+            return legal_moves_with_jumps
+        return legal_moves_without_jumps
+
+    def get_flying_king_jumps(self, start_location, occupied, opponent_occupied, previous_jump_direction, jumped_locations, lands):
+        """Returns every jump sequence a flying king can make from the start location.
+        Jumped pieces stay on the board until the move ends, so they block the king but can't be jumped again.
+        """
+        geometry = self.board.geometry
+        directions = self.DIRECTIONS_BY_DESCRIPTION["White King"]
+        if previous_jump_direction:
+            opposite_jump_direction = self.board.get_opposite_direction(previous_jump_direction)
+            directions = [d for d in directions if d != opposite_jump_direction]
+
+        legal_moves_with_jumps = []
+        for direction in directions:
+            ray = geometry.rays[direction][start_location]
+            ray_indexes = geometry.ray_indexes[direction][start_location]
+            blockers = geometry.ray_masks[direction][start_location] & occupied
+
+            # The first piece on the ray must be an opponent we haven't jumped yet.
+            jumped_location = geometry.get_nearest_on_ray(direction, blockers)
+            if not jumped_location or not (opponent_occupied >> jumped_location) & 1 or jumped_location in jumped_locations:
+                continue
+
+            # The king can land on any empty square between the jumped piece and the next blocker.
+            next_blocker = geometry.get_nearest_on_ray(direction, blockers & ~(1 << jumped_location))
+            first_landing_index = ray_indexes[jumped_location] + 1
+            if next_blocker:
+                landing_locations = ray[first_landing_index:ray_indexes[next_blocker]]
+            else:
+                landing_locations = ray[first_landing_index:]
+
+            for landing_location in landing_locations:
+                new_jumped_locations = jumped_locations + (jumped_location,)
+                new_lands = lands + (landing_location,)
+
+                # Keep jumping if possible. Otherwise the move ends here.
+                other_jumps = self.get_flying_king_jumps(
+                    start_location = landing_location,
+                    occupied = occupied,
+                    opponent_occupied = opponent_occupied,
+                    previous_jump_direction = direction,
+                    jumped_locations = new_jumped_locations,
+                    lands = new_lands,
+                )
+
+                if other_jumps:
+                    legal_moves_with_jumps += other_jumps
+                else:
+                    legal_moves_with_jumps.append({
+                        "start": start_location,
+                        "jumps_over": list(new_jumped_locations),
+                        "lands": list(new_lands),
+                        "end": landing_location,
+                    })
+
+        return legal_moves_with_jumps
+
 # - knows whose turn it is
-# - knows who won
+# - knows who won (get_winner, get_result)
 # - knows move history
 # - knows valid moves
@@ -0,0 +1,128 @@
+import random
+
+class BoardGeometry(object):
+    """Precomputed tables describing the playable squares of a square board.
+
+    Locations are numbered from 1, starting at the top left playable square on the top row
+    (the row farthest from White) and reading left to right, top to bottom.
+    Rows are numbered 1 (White's side) to size (Black's side). Columns are numbered 1 to size.
+
+    Use BoardGeometry.for_size to share one set of tables between every board of the same size.
+    """
+
+    # Row and column change for each direction. This assumes Black is on top and White is on the bottom.
+    DIRECTION_OFFSETS = {
+        "blackright": (1, 1),
+        "blackleft": (1, -1),
+        "whiteright": (-1, 1),
+        "whiteleft": (-1, -1),
+    }
+
+    # Every kind of piece, as color and type.
+    PIECE_KINDS = (("White", "Man"), ("White", "King"), ("Black", "Man"), ("Black", "King"))
+
+    # Geometry for each board size that has been used so far.
+    geometry_by_size = {}
+
+    @classmethod
+    def for_size(cls, size):
+        """Returns the geometry for a board with the given number of rows and columns.
+        Raises a KeyError if the size is not an even number of at least 4.
+        """
+        geometry = cls.geometry_by_size.get(size, None)
+        if geometry is None:
+            geometry = cls(size)
+            cls.geometry_by_size[size] = geometry
+        return geometry
+
+    def __init__(self, size):
+        if size < 4 or size % 2 != 0:
+            raise KeyError("Board size is invalid, {size}".format(size=size))
+
+        self.size = size
+        self.rows = size
+        self.columns = size
+        self.squares_per_row = size // 2
+        self.squares = self.squares_per_row * size
+
+        # Each side starts with every square of its rows filled, leaving two empty rows in the middle.
+        self.starting_rows = (size - 2) // 2
+        starting_squares = self.starting_rows * self.squares_per_row
+        self.black_starting_locations = tuple(range(1, starting_squares + 1))
+        self.white_starting_locations = tuple(range(self.squares - starting_squares + 1, self.squares + 1))
+
+        # Index 0 is unused so the tables can be indexed by location.
+        self.coordinates_by_location = [None]
+        self.location_by_coordinates = {}
+        for location in range(1, self.squares + 1):
+            # Count rows down from the top.
+            row = size - ((location - 1) // self.squares_per_row)
+
+            # Playable squares are in even columns on even rows, and odd columns on odd rows.
+            column_position = (location - 1) % self.squares_per_row
+            if row % 2 == 0:
+                column = (column_position * 2) + 2
+            else:
+                column = (column_position * 2) + 1
+
+            self.coordinates_by_location.append((row, column))
+            self.location_by_coordinates[(row, column)] = location
+        self.coordinates_by_location = tuple(self.coordinates_by_location)
+
+        # For every direction and location, the locations along the diagonal moving away from it.
+        # neighbors and jumps hold the first and second locations, or 0 if that is off the board.
+        # ray_masks hold the same locations as bits (bit N is location N) so blockers can be found with bit tricks.
+        # ray_indexes map each location on a ray to its position in the ray.
+        self.rays = {}
+        self.neighbors = {}
+        self.jumps = {}
+        self.ray_masks = {}
+        self.ray_indexes = {}
+        for direction, (row_offset, column_offset) in self.DIRECTION_OFFSETS.items():
+            rays = [()]
+            for location in range(1, self.squares + 1):
+                row, column = self.coordinates_by_location[location]
+                ray = []
+                while True:
+                    row += row_offset
+                    column += column_offset
+                    next_location = self.location_by_coordinates.get((row, column), None)
+                    if next_location is None:
+                        break
+                    ray.append(next_location)
+                rays.append(tuple(ray))
+
+            self.rays[direction] = tuple(rays)
+            self.neighbors[direction] = tuple(ray[0] if len(ray) > 0 else 0 for ray in rays)
+            self.jumps[direction] = tuple(ray[1] if len(ray) > 1 else 0 for ray in rays)
+            self.ray_masks[direction] = tuple(sum(1 << ray_location for ray_location in ray) for ray in rays)
+            self.ray_indexes[direction] = tuple(
+                {ray_location: index for index, ray_location in enumerate(ray)} for ray in rays
+            )
+
+        # Random keys for hashing positions. Each piece kind on each location gets a key, and so does Black's turn.
+        # The keys are seeded by the size so every process computes the same hashes.
+        key_generator = random.Random(size)
+        self.hash_keys = {
+            piece_kind: tuple([0] + [key_generator.getrandbits(64) for location in range(self.squares)])
+            for piece_kind in self.PIECE_KINDS
+        }
+        self.black_to_move_hash_key = key_generator.getrandbits(64)
+
+        # Moving towards Black lowers the location number, so the nearest square on the ray is the highest bit.
+        self.nearest_is_highest_bit = {
+            direction: row_offset > 0 for direction, (row_offset, column_offset) in self.DIRECTION_OFFSETS.items()
+        }
+
+    def is_valid_location(self, location):
+        return 1 <= location <= self.squares
+
+    def get_nearest_on_ray(self, direction, blockers):
+        """Given a bitmask of occupied locations on one ray, return the location closest to the ray's start.
+        Returns 0 if there are no blockers.
+        """
+        if not blockers:
+            return 0
+        if self.nearest_is_highest_bit[direction]:
+            return blockers.bit_length() - 1
+        return (blockers & -blockers).bit_length() - 1
@@ -0,0 +1,170 @@
+from array import array
+
+class MoveHistory(object):
+    """The moves of a game, packed into one 64 bit integer each, with periodic copies of the board.
+
+    Each move code holds, from the lowest bit up:
+    7 bits   start location
+    7 bits   end location
+    1 bit    the man was promoted
+    1 bit    the move can't be undone by a later move (a capture, or a man moving)
+    2 bits   number of jumps, 0 to 3
+    15 bits  per jump: the jumped location (7 bits), the landing (7 bits), and 1 if the jumped piece was a king
+
+    Moves that don't fit (more than 3 jumps, or a board with more than 127 squares) are kept whole in
+    overflow_moves, and their code is -1.
+
+    Every checkpoint_interval plies the packed board is saved, so any earlier position can be rebuilt
+    from one checkpoint and a few moves instead of replaying the whole game.
+    """
+    MAX_PACKED_JUMPS = 3
+    MAX_PACKED_LOCATION = 127
+
+    def __init__(self, *args, **kwargs):
+        self.checkpoint_interval = kwargs.get("checkpoint_interval", 32)
+        self.clear()
+
+    def clear(self):
+        self.codes = array("q")
+        self.overflow_moves = {}
+        # Ply mapped to (packed board, color to move) for the position before that ply's move.
+        self.checkpoints = {}
+
+    def copy(self):
+        new_history = MoveHistory.__new__(MoveHistory)
+        new_history.checkpoint_interval = self.checkpoint_interval
+        new_history.codes = array("q", self.codes)
+        new_history.overflow_moves = dict(self.overflow_moves)
+        new_history.checkpoints = dict(self.checkpoints)
+        return new_history
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def encode_move(cls, move, captured_kings, is_promotion, is_irreversible):
+        """Returns the code for a move, or None if it doesn't fit in one.
+        captured_kings has True for each jumped piece that was a king.
+        """
+        start = move["start"]
+        end = move["end"]
+        jumps_over = move.get("jumps_over", ())
+        if len(jumps_over) > cls.MAX_PACKED_JUMPS or start > cls.MAX_PACKED_LOCATION or end > cls.MAX_PACKED_LOCATION:
+            return None
+
+        code = start | (end << 7) | (is_promotion << 14) | (is_irreversible << 15) | (len(jumps_over) << 16)
+        shift = 18
+        for jumped_location, landing_location, captured_king in zip(jumps_over, move.get("lands", ()), captured_kings):
+            if jumped_location > cls.MAX_PACKED_LOCATION or landing_location > cls.MAX_PACKED_LOCATION:
+                return None
+            code |= (jumped_location | (landing_location << 7) | (captured_king << 14)) << shift
+            shift += 15
+        return code
+
+    @staticmethod
+    def decode_move(code):
+        """Returns the move dict, a list with True for each jumped piece that was a king,
+        whether the man was promoted, and whether the move was irreversible.
+        """
+        move = {
+            "start": code & 0x7f,
+            "end": (code >> 7) & 0x7f,
+        }
+        captured_kings = []
+        jump_count = (code >> 16) & 0x3
+        if jump_count:
+            jumps_over = []
+            lands = []
+            shift = 18
+            for jump in range(jump_count):
+                jump_code = code >> shift
+                jumps_over.append(jump_code & 0x7f)
+                lands.append((jump_code >> 7) & 0x7f)
+                captured_kings.append(bool((jump_code >> 14) & 0x1))
+                shift += 15
+            move["jumps_over"] = jumps_over
+            move["lands"] = lands
+
+        return move, captured_kings, bool((code >> 14) & 0x1), bool((code >> 15) & 0x1)
+
+    def append(self, move, captured_kings, is_promotion, is_irreversible):
+        """Add a move to the end of the history.
+        """
+        code = self.encode_move(move, captured_kings, is_promotion, is_irreversible)
+        if code is None:
+            self.overflow_moves[len(self.codes)] = (
+                {key: list(value) if isinstance(value, list) else value for key, value in move.items()},
+                list(captured_kings),
+                is_promotion,
+                is_irreversible,
+            )
+            code = -1
+        self.codes.append(code)
+
+    def get_record(self, ply):
+        """Returns the move played at the given ply (counting from 0), with the same values as decode_move.
+        """
+        code = self.codes[ply]
+        if code == -1:
+            move, captured_kings, is_promotion, is_irreversible = self.overflow_moves[ply]
+            return dict(move), list(captured_kings), is_promotion, is_irreversible
+        return self.decode_move(code)
+
+    def get_move(self, ply):
+        return self.get_record(ply)[0]
+
+    def get_moves(self):
+        """Returns every move as a list of dicts.
+        """
+        return [self.get_record(ply)[0] for ply in range(len(self.codes))]
+
+    def is_irreversible(self, ply):
+        code = self.codes[ply]
+        if code == -1:
+            return self.overflow_moves[ply][3]
+        return bool((code >> 15) & 0x1)
+
+    def pop(self):
+        """Remove the last move. Returns it with the same values as decode_move.
+        """
+        code = self.codes.pop()
+        ply = len(self.codes)
+
+        # Only the checkpoint after the last move can be newer than the moves left.
+        self.checkpoints.pop(ply + 1, None)
+
+        if code == -1:
+            return self.overflow_moves.pop(ply)
+        return self.decode_move(code)
+
+    def truncate(self, ply_count):
+        """Drop every move from the given ply on, and the checkpoints after it.
+        """
+        if ply_count >= len(self.codes):
+            return
+        del self.codes[ply_count:]
+        for ply in [ply for ply in self.overflow_moves if ply >= ply_count]:
+            del self.overflow_moves[ply]
+        for ply in [ply for ply in self.checkpoints if ply > ply_count]:
+            del self.checkpoints[ply]
+
+    def needs_checkpoint(self, ply):
+        """Returns True if the position before the given ply should be saved.
+        The position before the first move is always saved.
+        """
+        return ply % self.checkpoint_interval == 0 and not ply in self.checkpoints
+
+    def add_checkpoint(self, ply, packed_board, turn):
+        self.checkpoints[ply] = (packed_board, turn)
+
+    def get_checkpoint(self, ply):
+        """Returns the latest checkpoint at or before the given ply, as (ply, packed board, turn).
+        Returns None if there isn't one.
+        """
+        checkpoint_ply = ply - ply % self.checkpoint_interval
+        while checkpoint_ply >= 0:
+            checkpoint = self.checkpoints.get(checkpoint_ply, None)
+            if checkpoint is not None:
+                return checkpoint_ply, checkpoint[0], checkpoint[1]
+            checkpoint_ply -= self.checkpoint_interval
+        return None
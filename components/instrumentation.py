@@ -0,0 +1,117 @@
+import json
+import marshal
+import time
+
+class Instrumentation(object):
+    """Counts calls and cumulative time for the functions it wraps.
+
+    Nothing is wrapped until you ask, so a game without instrumentation pays nothing.
+    Recursive calls are counted, but only the outermost call adds to the cumulative time.
+    """
+    def __init__(self, *args, **kwargs):
+        self.counters = {}
+
+    def get_counter(self, name):
+        """Returns the counter for the given name, creating it if needed.
+
+        calls: number of times the function was called, including recursive calls
+        primitive_calls: number of calls that were not recursive
+        seconds: cumulative time spent in the outermost calls
+        max_depth: deepest recursion seen, 1 means the function never called itself
+        """
+        if not name in self.counters:
+            self.counters[name] = {
+                "calls": 0,
+                "primitive_calls": 0,
+                "seconds": 0.0,
+                "max_depth": 0,
+                "active_depth": 0,
+                "code": None,
+            }
+        return self.counters[name]
+
+    def wrap(self, name, function):
+        """Returns a function that calls the given function and updates the named counter.
+        """
+        counter = self.get_counter(name)
+        counter["code"] = getattr(function, "__code__", None)
+        perf_counter = time.perf_counter
+
+        def instrumented(*args, **kwargs):
+            depth = counter["active_depth"] + 1
+            counter["calls"] += 1
+            counter["active_depth"] = depth
+            if depth > counter["max_depth"]:
+                counter["max_depth"] = depth
+
+            # Recursive calls are already being timed by the outermost call.
+            if depth > 1:
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    counter["active_depth"] = depth - 1
+
+            start_time = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counter["seconds"] += perf_counter() - start_time
+                counter["primitive_calls"] += 1
+                counter["active_depth"] = 0
+
+        instrumented.__wrapped__ = function
+        return instrumented
+
+    def reset(self):
+        """Clear all of the counts.
+        """
+        for counter in self.counters.values():
+            counter["calls"] = 0
+            counter["primitive_calls"] = 0
+            counter["seconds"] = 0.0
+            counter["max_depth"] = 0
+
+    def to_dict(self):
+        """Returns a dict mapping each name to its calls, primitive_calls, seconds and max_depth.
+        """
+        return {
+            name: {
+                "calls": counter["calls"],
+                "primitive_calls": counter["primitive_calls"],
+                "seconds": counter["seconds"],
+                "max_depth": counter["max_depth"],
+            }
+            for name, counter in self.counters.items()
+        }
+
+    def to_json(self, **kwargs):
+        """Returns the counts as a JSON string. Keyword arguments are passed to json.dumps.
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_pstats_dict(self):
+        """Returns the counts in the format the pstats module reads.
+        We only measure cumulative time, so it is reported as the internal time too.
+        """
+        stats = {}
+        for name, counter in self.counters.items():
+            code = counter["code"]
+            if code is None:
+                key = ("~", 0, name)
+            else:
+                key = (code.co_filename, code.co_firstlineno, name)
+
+            stats[key] = (
+                counter["primitive_calls"],
+                counter["calls"],
+                counter["seconds"],
+                counter["seconds"],
+                {},
+            )
+        return stats
+
+    def dump_stats(self, filename):
+        """Write the counts to a file that can be loaded with pstats.Stats(filename).
+        """
+        with open(filename, "wb") as stats_file:
+            marshal.dump(self.to_pstats_dict(), stats_file)
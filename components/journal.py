@@ -0,0 +1,319 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from components.checkerboard import CheckerGame
+from components.history import MoveHistory
+
+class JournalException(Exception):
+    pass
+
+# Every record is framed by its length and a CRC32 of its body. The body starts with a type byte.
+RECORD_HEADER = struct.Struct("<II")
+
+# Record types.
+STATE_RECORD = b"S"
+MOVE_RECORD = b"M"
+LONG_MOVE_RECORD = b"J"
+SEEK_RECORD = b"T"
+
+MOVE_CODE = struct.Struct("<q")
+SEEK_PLY = struct.Struct("<I")
+
+# journal offset, size, flying kings, draw move limit (-1 for none), turn (0 White, 1 Black),
+# checkpoint interval, last irreversible index, number of moves, number of position hashes.
+STATE_HEADER = struct.Struct("<QBBhBHIII")
+
+def frame_record(body):
+    """Returns the body with its length and CRC32 in front.
+    """
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+def read_records(record_file):
+    """Yields (body, offset after the record) for every whole record from the file's current position.
+    Stops at the end of the file, or at the first record that was cut short or doesn't match its CRC.
+    """
+    while True:
+        header = record_file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, crc = RECORD_HEADER.unpack(header)
+        body = record_file.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return
+        yield body, record_file.tell()
+
+def to_little_endian(values):
+    """Returns the bytes of an array, little endian on every machine.
+    """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def encode_game_state(game, journal_offset=0):
+    """Returns a record body holding everything needed to rebuild the game: the rules, the board,
+    the whole move history and the position hashes used to find repetitions.
+    journal_offset is where the journal continues after this state.
+    """
+    history = game.history
+    board_bytes = game.board.pack()
+    extra = json.dumps({
+        "overflow_moves": {str(ply): record for ply, record in history.overflow_moves.items()},
+        "checkpoints": {str(ply): [packed.hex(), turn] for ply, (packed, turn) in history.checkpoints.items()},
+    }).encode("utf-8")
+
+    return b"".join([
+        STATE_RECORD,
+        STATE_HEADER.pack(
+            journal_offset,
+            game.board.geometry.size,
+            1 if game.flying_kings else 0,
+            -1 if game.draw_move_limit is None else game.draw_move_limit,
+            0 if game.get_current_turn() == "White" else 1,
+            history.checkpoint_interval,
+            game.last_irreversible_index,
+            len(history.codes),
+            len(game.position_hashes),
+        ),
+        board_bytes,
+        to_little_endian(history.codes),
+        to_little_endian(game.position_hashes),
+        extra,
+    ])
+
+def decode_game_state(body):
+    """Rebuild a game from a body made by encode_game_state.
+    Returns the game and the journal offset.
+    Raises a JournalException if the body is not a game state.
+    """
+    if body[:1] != STATE_RECORD or len(body) < 1 + STATE_HEADER.size:
+        raise JournalException("Record is not a game state")
+
+    (journal_offset, size, flying_kings, draw_move_limit, turn, checkpoint_interval,
+        last_irreversible_index, move_count, hash_count) = STATE_HEADER.unpack_from(body, 1)
+
+    game = CheckerGame(
+        size = size,
+        flying_kings = bool(flying_kings),
+        draw_move_limit = None if draw_move_limit < 0 else draw_move_limit,
+        checkpoint_interval = checkpoint_interval,
+    )
+
+    offset = 1 + STATE_HEADER.size
+    board_length = game.board.geometry.squares // 2
+    game.board.unpack(body[offset:offset + board_length])
+    offset += board_length
+    game.current_turn = "White" if turn == 0 else "Black"
+
+    game.history.codes = from_little_endian("q", body[offset:offset + move_count * 8])
+    offset += move_count * 8
+    game.position_hashes = from_little_endian("Q", body[offset:offset + hash_count * 8])
+    offset += hash_count * 8
+    game.last_irreversible_index = last_irreversible_index
+
+    extra = json.loads(body[offset:].decode("utf-8"))
+    game.history.overflow_moves = {
+        int(ply): tuple(record) for ply, record in extra["overflow_moves"].items()
+    }
+    game.history.checkpoints = {
+        int(ply): (bytes.fromhex(packed), checkpoint_turn) for ply, (packed, checkpoint_turn) in extra["checkpoints"].items()
+    }
+    return game, journal_offset
+
+class GameJournal(object):
+    """Saves every move of a game to an append-only file so it can be brought back after a crash.
+
+    The journal starts with the game's state, followed by one small record per move.
+    Records are written as they happen but only fsynced every sync_interval records, or when sync is called.
+    After a crash, moves written since the last sync may be lost, but the journal is never left unreadable:
+    a record that was cut short is detected by its length and CRC and dropped when the journal is resumed.
+
+    Every snapshot_interval moves the whole state is written to a separate snapshot file, replacing
+    the old one atomically. Resuming loads the snapshot and only replays the moves after it.
+
+    Options:
+    sync_interval: records to write between fsyncs.
+    snapshot_interval: moves to write between snapshots. None turns snapshots off.
+    """
+    SNAPSHOT_SUFFIX = ".snapshot"
+
+    def __init__(self, path, game, *args, **kwargs):
+        self.path = path
+        self.snapshot_path = path + self.SNAPSHOT_SUFFIX
+        self.game = game
+        self.sync_interval = kwargs.get("sync_interval", 32)
+        self.snapshot_interval = kwargs.get("snapshot_interval", 256)
+
+        self.unsynced_records = 0
+        self.moves_since_snapshot = 0
+
+        # A new journal replaces any old one.
+        if kwargs.get("journal_file", None) is None:
+            self.journal_file = open(path, "wb")
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+            self.write_record(encode_game_state(game))
+            self.sync()
+        else:
+            self.journal_file = kwargs["journal_file"]
+
+        game.add_move_listener(self.record_event)
+
+    @classmethod
+    def resume(cls, path, **kwargs):
+        """Rebuild the game saved in the journal at the given path, and keep journaling it.
+        Starts from the snapshot if there is a good one, then replays the moves after it.
+        Returns the GameJournal. The game is its game attribute.
+        Raises a JournalException if the journal can't be read.
+        """
+        journal_file = open(path, "r+b")
+        try:
+            game, offset = cls.load_snapshot(path + cls.SNAPSHOT_SUFFIX, journal_file)
+            if game is None:
+                journal_file.seek(0)
+                records = read_records(journal_file)
+                first_record = next(records, None)
+                if first_record is None:
+                    raise JournalException("Journal has no game state, {path}".format(path=path))
+                game, ignored_offset = decode_game_state(first_record[0])
+                offset = first_record[1]
+
+            # Replay the moves after the state. Stop at the first record that wasn't written completely.
+            # The replayed moves count toward the next snapshot, so the next restart doesn't replay even more.
+            replayed_moves = 0
+            journal_file.seek(offset)
+            for body, end_offset in read_records(journal_file):
+                cls.replay_record(game, body)
+                if body[:1] in (MOVE_RECORD, LONG_MOVE_RECORD):
+                    replayed_moves += 1
+                offset = end_offset
+
+            # Drop anything after the last good record so new records follow it.
+            journal_file.seek(offset)
+            journal_file.truncate()
+        except Exception:
+            journal_file.close()
+            raise
+
+        journal = cls(path, game, journal_file=journal_file, **kwargs)
+        journal.moves_since_snapshot = replayed_moves
+        return journal
+
+    @staticmethod
+    def load_snapshot(snapshot_path, journal_file):
+        """Returns the game in the snapshot and the journal offset it was taken at,
+        or (None, None) if there is no usable snapshot.
+        """
+        if not os.path.exists(snapshot_path):
+            return None, None
+
+        with open(snapshot_path, "rb") as snapshot_file:
+            record = next(read_records(snapshot_file), None)
+        if record is None:
+            return None, None
+
+        game, offset = decode_game_state(record[0])
+
+        # A snapshot that points past the end of the journal can't be trusted.
+        journal_file.seek(0, os.SEEK_END)
+        if offset > journal_file.tell():
+            return None, None
+        return game, offset
+
+    @staticmethod
+    def replay_record(game, body):
+        """Apply one journal record to the game.
+        """
+        record_type = body[:1]
+        if record_type == MOVE_RECORD:
+            move = MoveHistory.decode_move(MOVE_CODE.unpack_from(body, 1)[0])[0]
+            game.apply_move(move, validate=False)
+        elif record_type == LONG_MOVE_RECORD:
+            game.apply_move(json.loads(body[1:].decode("utf-8")), validate=False)
+        elif record_type == SEEK_RECORD:
+            game.seek(SEEK_PLY.unpack_from(body, 1)[0])
+        elif record_type == STATE_RECORD:
+            new_game, ignored_offset = decode_game_state(body)
+            game.board = new_game.board
+            game.current_turn = new_game.current_turn
+            game.history = new_game.history
+            game.position_hashes = new_game.position_hashes
+            game.last_irreversible_index = new_game.last_irreversible_index
+        else:
+            raise JournalException("Record type is invalid, {record_type}".format(record_type=record_type))
+
+    def record_event(self, game, event, details):
+        """Move listener that writes a record for every change to the game.
+        """
+        if event == "move":
+            # The history has already packed the move, so reuse its code.
+            code = game.history.codes[-1]
+            if code == -1:
+                self.write_record(LONG_MOVE_RECORD + json.dumps(details).encode("utf-8"))
+            else:
+                self.write_record(MOVE_RECORD + MOVE_CODE.pack(code))
+
+            self.moves_since_snapshot += 1
+            if self.snapshot_interval is not None and self.moves_since_snapshot >= self.snapshot_interval:
+                self.write_snapshot()
+        elif event == "seek":
+            self.write_record(SEEK_RECORD + SEEK_PLY.pack(details))
+        elif event == "position":
+            self.write_record(encode_game_state(game))
+
+    def write_record(self, body):
+        self.journal_file.write(frame_record(body))
+        self.unsynced_records += 1
+        if self.unsynced_records >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Make sure every record written so far is on disk.
+        """
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.unsynced_records = 0
+
+    def write_snapshot(self):
+        """Save the whole state, so resuming only needs the moves written after this.
+        The snapshot is written to a temporary file and renamed over the old one, so there is always one good snapshot.
+        """
+        self.sync()
+        body = encode_game_state(self.game, journal_offset=self.journal_file.tell())
+
+        temporary_path = self.snapshot_path + ".tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(frame_record(body))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+
+        # The rename itself is only durable once the directory is synced. Not every platform allows that.
+        if hasattr(os, "O_DIRECTORY"):
+            directory = os.open(os.path.dirname(os.path.abspath(self.snapshot_path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+        self.moves_since_snapshot = 0
+
+    def close(self):
+        """Sync the journal, stop listening to the game and close the file.
+        """
+        if self.journal_file.closed:
+            return
+        self.sync()
+        self.game.remove_move_listener(self.record_event)
+        self.journal_file.close()
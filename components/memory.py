@@ -0,0 +1,152 @@
+import sys
+import tracemalloc
+import types
+from collections import deque
+
+# Objects that belong to the program rather than to any one game.
+SHARED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+def is_shared(value):
+    """Returns True for values the interpreter keeps one copy of, no matter who refers to them:
+    None, True, False and the small integers.
+    """
+    if value is None or value is True or value is False:
+        return True
+    if type(value) is int:
+        return -5 <= value <= 256
+    return isinstance(value, SHARED_TYPES)
+
+def get_deep_size(value, exclude=()):
+    """Returns the bytes used by the value and everything it refers to, using sys.getsizeof.
+    Each object is counted once, however many times it is referred to.
+    Objects in exclude, and everything only they refer to, are not counted.
+    """
+    seen = set(id(item) for item in exclude)
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or is_shared(item):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        # Arrays, bytes, strings and numbers hold no other objects. getsizeof already counts their contents.
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+
+        item_dict = getattr(item, "__dict__", None)
+        if item_dict is not None:
+            stack.append(item_dict)
+        for slot in getattr(type(item), "__slots__", ()):
+            if hasattr(item, slot):
+                stack.append(getattr(item, slot))
+    return size
+
+def get_board_memory(board):
+    """Returns a dict with the bytes used by a Checkerboard.
+    pieces: the checkers, and the map from each location to its checker
+    index: the locations of each color
+    total: everything the board holds, except the geometry every board of its size shares
+    """
+    exclude = (board.geometry,)
+    return {
+        "pieces": get_deep_size([board.pieces_by_location, board.all_checkers], exclude),
+        "index": get_deep_size(board.locations_by_color, exclude),
+        "total": get_deep_size(board, exclude),
+    }
+
+def get_game_memory(game):
+    """Returns a dict with the bytes used by a CheckerGame.
+    board: the board's total, see get_board_memory
+    moves: the packed move history, including moves too long to pack
+    checkpoints: the copies of the board saved along the history
+    position_hashes: the hashes kept to find repeated positions
+    total: everything the game holds, except what can be shared with other games:
+        the board geometry, the move cache, the instrumentation and the move listeners
+    plies: the number of moves played
+    """
+    exclude = (game.board.geometry, game.move_cache, game.instrumentation, game.move_listeners)
+    history = game.history
+    return {
+        "board": get_deep_size(game.board, exclude),
+        "moves": get_deep_size([history.codes, history.overflow_moves], exclude),
+        "checkpoints": get_deep_size(history.checkpoints, exclude),
+        "position_hashes": get_deep_size(game.position_hashes, exclude),
+        "total": get_deep_size(game, exclude),
+        "plies": game.get_ply_count(),
+    }
+
+def get_table_memory(table):
+    """Returns a dict with the entries in a table, such as a transposition table or an opening book,
+    the bytes it uses, and the bytes per entry.
+    """
+    size = get_deep_size(table)
+    return {
+        "entries": len(table),
+        "bytes": size,
+        "bytes_per_entry": size / len(table) if len(table) else 0.0,
+    }
+
+def get_search_memory(searcher):
+    """Returns get_table_memory for an AlphaBetaSearch's transposition table, with its maximum entries.
+    """
+    memory = get_table_memory(searcher.transposition_table)
+    memory["max_entries"] = searcher.max_table_entries
+    return memory
+
+def get_move_cache_memory(move_cache):
+    """Returns get_table_memory for a MoveCache, with its maximum entries.
+    The cached moves are counted here, not in the games that share the cache.
+    """
+    memory = get_table_memory(move_cache.entries)
+    memory["max_entries"] = move_cache.max_entries
+    return memory
+
+def measure_allocations(function, *args, **kwargs):
+    """Call the function while tracemalloc traces allocations.
+    Returns a dict.
+    result: what the function returned
+    allocated: bytes allocated during the call that were still allocated after it
+    peak: the most bytes allocated at once during the call, above what was allocated before it
+    top: the five source lines that kept the most bytes, as (file:line, bytes) tuples
+    Tracing slows everything down, so only use this to measure.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_size = tracemalloc.get_traced_memory()[0]
+
+        result = function(*args, **kwargs)
+
+        end_size, peak_size = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    # Leave out the allocations tracemalloc makes for itself.
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    statistics = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    top = [
+        ("{file}:{line}".format(file=statistic.traceback[0].filename, line=statistic.traceback[0].lineno), statistic.size_diff)
+        for statistic in statistics[:5]
+    ]
+    return {
+        "result": result,
+        "allocated": end_size - start_size,
+        "peak": peak_size - start_size,
+        "top": top,
+    }
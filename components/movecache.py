@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+class MoveCache(object):
+    """Remembers the legal moves of recently seen positions, dropping the least recently used ones.
+
+    Positions are keyed by their 64 bit hash, the color to move and the rules, so one cache can be
+    shared by every game on a server. Two positions with the same hash would share moves, which is
+    very unlikely with 64 bit hashes.
+
+    The cached move lists and dicts are shared, so callers must not change them.
+    """
+    def __init__(self, *args, **kwargs):
+        self.max_entries = kwargs.get("max_entries", 4096)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the moves stored for the key, or None if there aren't any.
+        """
+        moves = self.entries.get(key, None)
+        if moves is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return moves
+
+    def put(self, key, moves):
+        """Store the moves for the key, dropping the least recently used entry if the cache is full.
+        """
+        self.entries[key] = moves
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_hit_rate(self):
+        """Returns the fraction of lookups that found their moves, or 0.0 before the first lookup.
+        """
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def get_statistics(self):
+        """Returns a dict with the entries, the maximum entries, hits, misses, evictions and hit rate.
+        """
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.get_hit_rate(),
+        }
@@ -0,0 +1,201 @@
+import sqlite3
+
+from components.symmetry import get_canonical_hash
+from components.symmetry import pack_canonical_board
+
+# SQLite integers are signed, so hashes at or above this are stored as negative numbers.
+SIGNED_LIMIT = 1 << 63
+
+# Keys per query when reading in bulk. Older SQLite builds allow at most 999 parameters.
+READ_CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER PRIMARY KEY,
+    board BLOB NOT NULL,
+    turn INTEGER NOT NULL,
+    occurrences INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    draws INTEGER NOT NULL,
+    losses INTEGER NOT NULL
+)
+"""
+
+UPSERT = """
+INSERT INTO positions (hash, board, turn, occurrences, wins, draws, losses) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (hash) DO UPDATE SET
+    occurrences = occurrences + excluded.occurrences,
+    wins = wins + excluded.wins,
+    draws = draws + excluded.draws,
+    losses = losses + excluded.losses
+"""
+
+COLUMNS = "hash, board, turn, occurrences, wins, draws, losses"
+
+def to_signed(position_hash):
+    if position_hash >= SIGNED_LIMIT:
+        return position_hash - (SIGNED_LIMIT << 1)
+    return position_hash
+
+def to_unsigned(stored_hash):
+    if stored_hash < 0:
+        return stored_hash + (SIGNED_LIMIT << 1)
+    return stored_hash
+
+def row_to_dict(row):
+    stored_hash, board, turn, occurrences, wins, draws, losses = row
+    return {
+        "hash": to_unsigned(stored_hash),
+        "board": board,
+        "turn": "White" if turn == 0 else "Black",
+        "occurrences": occurrences,
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+    }
+
+class PositionStore(object):
+    """A SQLite file of every position seen in a set of games, each stored once.
+
+    Positions are keyed by their 64 bit hash. Each row holds the packed board (see Checkerboard.pack),
+    the color to move, how often the position occurred, and how the games went from there:
+    wins, draws and losses for the player to move.
+
+    Positions are added to an in-memory batch, where repeats are merged. Once the batch holds batch_size
+    positions, it is written in one transaction with one prepared upsert, so replaying an archive
+    costs a few large transactions instead of one per position. Reading flushes the batch first.
+
+    With use_symmetry, positions with Black to move are stored as their White to move twin
+    (see components.symmetry), so a position and its twin share one row. Wins and losses are for the
+    player to move, so they mean the same thing for both twins.
+
+    Options:
+    batch_size: the most positions to hold in memory before writing them.
+    use_symmetry: store positions with Black to move as their White to move twin.
+    """
+    def __init__(self, path, *args, **kwargs):
+        self.path = path
+        self.batch_size = kwargs.get("batch_size", 100000)
+        self.use_symmetry = kwargs.get("use_symmetry", True)
+
+        self.connection = sqlite3.connect(path)
+        # Losing the last batch in a power cut is fine for building data sets. A corrupt file is not.
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+        # Hash mapped to [board, turn, occurrences, wins, draws, losses], waiting to be written.
+        self.batch = {}
+
+    def get_key(self, game):
+        """Returns the hash the game's position is stored under.
+        """
+        if self.use_symmetry:
+            return get_canonical_hash(game)
+        return game.get_position_hash()
+
+    def add_position(self, game, result=None):
+        """Count the game's current position. result is the color that won the game, "Draw", or None if unknown.
+        """
+        turn = game.get_current_turn()
+        key = self.get_key(game)
+        counts = self.batch.get(key, None)
+        if counts is None:
+            if self.use_symmetry:
+                counts = [pack_canonical_board(game), 0, 0, 0, 0, 0]
+            else:
+                counts = [game.board.pack(), 0 if turn == "White" else 1, 0, 0, 0, 0]
+            self.batch[key] = counts
+
+        counts[2] += 1
+        if result == "Draw":
+            counts[4] += 1
+        elif result == turn:
+            counts[3] += 1
+        elif result is not None:
+            counts[5] += 1
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def add_game(self, game, result=None):
+        """Count every position the game went through, from its first position to its current one.
+        The game is left as it was. result defaults to the game's own result.
+        """
+        if result is None:
+            result = game.get_result()
+
+        replay = game.position_at(0)
+        self.add_position(replay, result)
+        for ply in range(game.get_ply_count()):
+            replay.apply_move(game.history.get_move(ply), validate=False)
+            self.add_position(replay, result)
+
+    def flush(self):
+        """Write the batch in one transaction.
+        """
+        if not self.batch:
+            return
+
+        rows = (
+            (to_signed(key), board, turn, occurrences, wins, draws, losses)
+            for key, (board, turn, occurrences, wins, draws, losses) in self.batch.items()
+        )
+        with self.connection:
+            self.connection.executemany(UPSERT, rows)
+        self.batch = {}
+
+    def get(self, game):
+        """Returns a dict describing the game's current position, or None if it hasn't been stored.
+        hash, board, turn, occurrences, wins, draws, losses
+        With use_symmetry, the board and turn are the White to move twin's.
+        """
+        key = self.get_key(game)
+        return self.get_many([key]).get(key, None)
+
+    def get_many(self, keys):
+        """Returns a dict mapping each stored key to a dict like get returns. Keys that aren't stored are left out.
+        """
+        self.flush()
+        keys = list(keys)
+        positions = {}
+        for start in range(0, len(keys), READ_CHUNK_SIZE):
+            chunk = [to_signed(key) for key in keys[start:start + READ_CHUNK_SIZE]]
+            cursor = self.connection.execute(
+                "SELECT {columns} FROM positions WHERE hash IN ({parameters})".format(
+                    columns = COLUMNS,
+                    parameters = ", ".join("?" * len(chunk)),
+                ),
+                chunk,
+            )
+            for row in cursor:
+                position = row_to_dict(row)
+                positions[position["hash"]] = position
+        return positions
+
+    def iterate_positions(self, min_occurrences=1, fetch_size=10000):
+        """Yields a dict like get returns for every stored position that occurred at least min_occurrences times.
+        Rows are fetched fetch_size at a time.
+        """
+        self.flush()
+        cursor = self.connection.execute(
+            "SELECT {columns} FROM positions WHERE occurrences >= ?".format(columns=COLUMNS),
+            (min_occurrences,),
+        )
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row_to_dict(row)
+
+    def get_position_count(self):
+        self.flush()
+        return self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def close(self):
+        """Write the batch and close the file.
+        """
+        self.flush()
+        self.connection.close()
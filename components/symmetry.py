@@ -0,0 +1,134 @@
+"""Color-flip symmetry of checkers positions.
+
+Turning the board around 180 degrees and swapping White and Black gives a position that plays exactly
+the same, with the other color to move. Every position with Black to move has a twin with White to move,
+so tables can store just the White to move version and look Black to move positions up through their twin.
+
+Mirroring the board left to right is not a symmetry of checkers: on an even sized board it moves the pieces
+onto the unplayable squares. Neither is flipping the board top to bottom, since men only move forward.
+"""
+
+# Flip tables for each board size that has been used so far.
+flip_tables_by_size = {}
+
+def get_flip_table(geometry):
+    """Returns a tuple mapping each location to the location it lands on when the board is turned around.
+    Index 0 is unused.
+    """
+    flip_table = flip_tables_by_size.get(geometry.size, None)
+    if flip_table is None:
+        flip_table = [0]
+        for location in range(1, geometry.squares + 1):
+            row, column = geometry.coordinates_by_location[location]
+            flip_table.append(geometry.location_by_coordinates[(geometry.rows + 1 - row, geometry.columns + 1 - column)])
+        flip_table = tuple(flip_table)
+        flip_tables_by_size[geometry.size] = flip_table
+    return flip_table
+
+# Hash keys for each board size, already flipped: a White man on a location uses the key of a Black man
+# on the flipped location, and so on. Indexed by color, then by 1 for kings and 0 for men, then by location.
+flipped_hash_keys_by_size = {}
+
+def get_flipped_hash_keys(geometry):
+    flipped_hash_keys = flipped_hash_keys_by_size.get(geometry.size, None)
+    if flipped_hash_keys is None:
+        flip_table = get_flip_table(geometry)
+        flipped_hash_keys = {}
+        for color, opposite_color in (("White", "Black"), ("Black", "White")):
+            flipped_hash_keys[color] = tuple(
+                tuple([0] + [geometry.hash_keys[(opposite_color, checker_type)][flip_table[location]] for location in range(1, geometry.squares + 1)])
+                for checker_type in ("Man", "King")
+            )
+        flipped_hash_keys_by_size[geometry.size] = flipped_hash_keys
+    return flipped_hash_keys
+
+def flip_location(location, geometry):
+    return get_flip_table(geometry)[location]
+
+def flip_move(move, geometry):
+    """Returns the move as it would be played on the turned around board.
+    """
+    flip_table = get_flip_table(geometry)
+    flipped_move = {
+        "start": flip_table[move["start"]],
+        "end": flip_table[move["end"]],
+    }
+    if "jumps_over" in move:
+        flipped_move["jumps_over"] = [flip_table[location] for location in move["jumps_over"]]
+    if "lands" in move:
+        flipped_move["lands"] = [flip_table[location] for location in move["lands"]]
+    return flipped_move
+
+def flip_pieces(piece_by_location, geometry):
+    """Returns pieces in the format Checkerboard.arrange_board takes, turned around with the colors swapped.
+    """
+    flip_table = get_flip_table(geometry)
+    opposite_colors = {"white": "black", "black": "white"}
+    return {
+        flip_table[location]: {
+            "color": opposite_colors[description["color"].lower()],
+            "type": description["type"].lower(),
+        }
+        for location, description in piece_by_location.items()
+    }
+
+def is_canonical(game):
+    """Positions with White to move are canonical.
+    """
+    return game.get_current_turn() == "White"
+
+def get_canonical_hash(game):
+    """Returns the hash of the position's White to move twin. Positions with White to move are their own twin.
+    The hash is the same as CheckerGame.get_position_hash would give for the twin.
+    """
+    if game.current_turn == "White":
+        return game.board.position_hash
+
+    flipped_hash_keys = get_flipped_hash_keys(game.board.geometry)
+    position_hash = 0
+    for location, checker in game.board.pieces_by_location.items():
+        position_hash ^= flipped_hash_keys[checker.color][checker.is_king][location]
+    return position_hash
+
+def pack_canonical_board(game):
+    """Returns the position's White to move twin packed the same way as Checkerboard.pack.
+    """
+    board = game.board
+    if is_canonical(game):
+        return board.pack()
+
+    geometry = board.geometry
+    flip_table = get_flip_table(geometry)
+    piece_kinds = geometry.PIECE_KINDS
+    opposite_colors = {"White": "Black", "Black": "White"}
+    nibbles = bytearray(geometry.squares + 2)
+    for location, checker in board.pieces_by_location.items():
+        nibbles[flip_table[location]] = piece_kinds.index((opposite_colors[checker.color], checker.get_type())) + 1
+
+    return bytes(
+        nibbles[location] | (nibbles[location + 1] << 4)
+        for location in range(1, geometry.squares + 1, 2)
+    )
+
+def canonicalize(game):
+    """Returns a dict describing the position's White to move twin.
+    pieces: in the format Checkerboard.arrange_board takes
+    turn: always "White"
+    flipped: True if the board was turned around. Moves for the twin need flip_move to be played in this game.
+    """
+    pieces = {
+        location: {
+            "color": description["color"].lower(),
+            "type": description["type"].lower(),
+        }
+        for location, description in game.board.get_all_pieces_by_location().items()
+    }
+    flipped = not is_canonical(game)
+    if flipped:
+        pieces = flip_pieces(pieces, game.board.geometry)
+
+    return {
+        "pieces": pieces,
+        "turn": "White",
+        "flipped": flipped,
+    }
@@ -0,0 +1,143 @@
+import collections
+import json
+import multiprocessing
+
+from components.checkerboard import CheckerGame
+from engine.search import AlphaBetaSearch
+from texthandling.input import InvalidPositionException
+from texthandling.input import TextInput
+from texthandling.output import TextOutput
+
+# Each worker process keeps one searcher and its options, so tables are built once per process.
+worker_settings = {}
+
+def parse_position_line(line, size=8):
+    """Given one line describing a position, return a dict with the turn and the pieces.
+    The line is either FEN, or JSON in the format Checkerboard.arrange_board takes.
+    The JSON can also be an object with "turn" and "pieces". Without a turn, White is to move.
+    Raises a InvalidPositionException if it fails.
+    """
+    line = line.strip()
+    if not line.startswith("{"):
+        return TextInput.parse_fen(line, size)
+
+    try:
+        description = json.loads(line)
+    except ValueError:
+        raise InvalidPositionException("Position is invalid, {line}".format(line=line))
+
+    if "pieces" in description:
+        turn = description.get("turn", "White")
+        raw_pieces = description["pieces"]
+    else:
+        turn = "White"
+        raw_pieces = description
+
+    # JSON keys are always strings.
+    try:
+        pieces = {int(location): piece for location, piece in raw_pieces.items()}
+    except (AttributeError, ValueError):
+        raise InvalidPositionException("Position is invalid, {line}".format(line=line))
+
+    return {
+        "turn": turn,
+        "pieces": pieces,
+    }
+
+def initialize_worker(depth=None, seconds=None, size=8, flying_kings=False, max_table_entries=1000000):
+    """Set up the searcher for this process.
+    """
+    worker_settings["searcher"] = AlphaBetaSearch(max_table_entries=max_table_entries)
+    worker_settings["depth"] = depth
+    worker_settings["seconds"] = seconds
+    worker_settings["size"] = size
+    worker_settings["flying_kings"] = flying_kings
+
+def analyze_line(line_number, line):
+    """Analyze one position with this process's searcher.
+    Returns a dict that can be written as JSON. Positions that can't be read get an error instead.
+    """
+    result = {"line": line_number}
+    try:
+        position = parse_position_line(line, worker_settings["size"])
+        game = CheckerGame(size=worker_settings["size"], flying_kings=worker_settings["flying_kings"])
+        game.set_position(position["pieces"], position["turn"])
+    except (InvalidPositionException, KeyError, TypeError) as error:
+        result["error"] = "cannot read position: {error}".format(error=error)
+        return result
+
+    search_result = worker_settings["searcher"].search(
+        game,
+        depth = worker_settings["depth"],
+        seconds = worker_settings["seconds"],
+    )
+
+    # The player to move has already lost.
+    if search_result is None:
+        result.update({
+            "move": None,
+            "score": None,
+            "pv": [],
+            "nodes": 0,
+            "depth": 0,
+            "result": game.get_opponent(game.get_current_turn()),
+        })
+        return result
+
+    result.update({
+        "move": TextOutput.format_move(search_result["move"]),
+        "score": search_result["score"],
+        "pv": [TextOutput.format_move(move) for move in search_result["pv"]],
+        "nodes": search_result["nodes"],
+        "depth": search_result["depth"],
+    })
+    return result
+
+def read_position_lines(lines):
+    """Yields (line number, line) for every line that holds a position.
+    Blank lines and lines starting with # are skipped.
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield line_number, line
+
+def analyze_positions(lines, output, depth=None, seconds=None, workers=1, size=8, flying_kings=False):
+    """Analyze every position in the lines and write one JSON result per line, in input order.
+    Results are written as soon as every earlier position is finished, so large inputs stream.
+    Returns the number of positions that couldn't be read.
+    """
+    settings = {
+        "depth": depth,
+        "seconds": seconds,
+        "size": size,
+        "flying_kings": flying_kings,
+    }
+    failed_positions = 0
+
+    def write_result(result):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        return 1 if "error" in result else 0
+
+    # One worker doesn't need another process.
+    if workers <= 1:
+        initialize_worker(**settings)
+        for line_number, line in read_position_lines(lines):
+            failed_positions += write_result(analyze_line(line_number, line))
+        return failed_positions
+
+    # Only keep a few positions per worker in flight, so the input is never read far ahead of the output.
+    pending = collections.deque()
+    max_pending = workers * 4
+    with multiprocessing.Pool(workers, initializer=initialize_worker, initargs=(depth, seconds, size, flying_kings)) as pool:
+        for line_number, line in read_position_lines(lines):
+            pending.append(pool.apply_async(analyze_line, (line_number, line)))
+            if len(pending) >= max_pending:
+                failed_positions += write_result(pending.popleft().get())
+
+        while pending:
+            failed_positions += write_result(pending.popleft().get())
+
+    return failed_positions
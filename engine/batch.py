@@ -0,0 +1,246 @@
+import numpy
+
+from components.geometry import BoardGeometry
+
+class BatchPlayout(object):
+    """Plays thousands of random games at once, advancing every game by one step in lockstep.
+
+    Boards are rows of a NumPy array, one column per location. Pieces are stored as numbers:
+    0 empty, 1 White man, 2 White king, -1 Black man, -2 Black king.
+    Each step, every unfinished game makes one jump or move, chosen at random from the legal ones.
+    A multijump takes one step per jump.
+
+    The rules match CheckerGame without flying kings: a piece that can jump must jump,
+    men move forward and kings move both ways. Jumped pieces are removed as soon as they are jumped.
+    Games are drawn after max_plies plies, or after draw_move_limit moves per side without a capture or a man moving.
+    """
+
+    # The same order as the tables, so a direction can be used as an index.
+    DIRECTIONS = ("blackright", "blackleft", "whiteright", "whiteleft")
+
+    def __init__(self, *args, **kwargs):
+        self.geometry = BoardGeometry.for_size(kwargs.get("size", 8))
+        self.max_plies = kwargs.get("max_plies", 200)
+        self.draw_move_limit = kwargs.get("draw_move_limit", 40)
+        self.random = numpy.random.default_rng(kwargs.get("seed", None))
+
+        # Column 0 is unused so columns match locations. The last column stands in for off the board.
+        squares = self.geometry.squares
+        self.off_board = squares + 1
+        self.width = squares + 2
+
+        self.neighbor_table = numpy.full((4, self.width), self.off_board, dtype=numpy.intp)
+        self.jump_table = numpy.full((4, self.width), self.off_board, dtype=numpy.intp)
+        for direction_index, direction in enumerate(self.DIRECTIONS):
+            for location in range(1, squares + 1):
+                if self.geometry.neighbors[direction][location]:
+                    self.neighbor_table[direction_index, location] = self.geometry.neighbors[direction][location]
+                if self.geometry.jumps[direction][location]:
+                    self.jump_table[direction_index, location] = self.geometry.jumps[direction][location]
+        self.neighbor_valid = self.neighbor_table != self.off_board
+        self.jump_valid = self.jump_table != self.off_board
+
+        # Men only move towards the other side. Index 0 is for White, 1 is for Black.
+        self.forward_directions = numpy.array([
+            [True, True, False, False],
+            [False, False, True, True],
+        ])
+
+        # Men are promoted when they reach the far row.
+        self.promotion_rows = numpy.zeros((2, self.width), dtype=bool)
+        self.promotion_rows[0, 1:self.geometry.squares_per_row + 1] = True
+        self.promotion_rows[1, squares - self.geometry.squares_per_row + 1:squares + 1] = True
+
+        self.locations = numpy.arange(self.width)
+
+    def encode_game(self, game):
+        """Returns the board of a CheckerGame as a row of numbers, and the side to move as 1 (White) or -1 (Black).
+        """
+        if game.flying_kings:
+            raise KeyError("Batch playouts don't support flying kings")
+        if game.board.geometry is not self.geometry:
+            raise KeyError("Board size does not match, {size}".format(size=game.board.geometry.size))
+
+        board = numpy.zeros(self.width, dtype=numpy.int8)
+        for location, checker in game.board.pieces_by_location.items():
+            value = 2 if checker.is_king else 1
+            board[location] = value if checker.color == "White" else -value
+        turn = 1 if game.get_current_turn() == "White" else -1
+        return board, turn
+
+    def play(self, start_games, games_per_position=1000):
+        """Play random games from each of the start positions.
+        Returns a list with a dict for each start position, counting the wins, draws and losses
+        for the player whose turn it is in that position.
+        """
+        encoded_games = [self.encode_game(game) for game in start_games]
+        position_count = len(encoded_games)
+        game_count = position_count * games_per_position
+
+        boards = numpy.repeat(
+            numpy.array([board for board, turn in encoded_games], dtype=numpy.int8).reshape(position_count, self.width),
+            games_per_position,
+            axis=0,
+        )
+        start_turns = numpy.repeat(numpy.array([turn for board, turn in encoded_games], dtype=numpy.int8), games_per_position)
+        quiet_plies = numpy.repeat(
+            numpy.array([game.get_plies_without_progress() for game in start_games], dtype=numpy.int32),
+            games_per_position,
+        )
+
+        results = self.play_boards(boards, start_turns.copy(), quiet_plies)
+
+        # Count results from the point of view of the player to move at the start.
+        relative_results = (results * start_turns).reshape(position_count, games_per_position)
+        return [
+            {
+                "wins": int(numpy.count_nonzero(position_results > 0)),
+                "draws": int(numpy.count_nonzero(position_results == 0)),
+                "losses": int(numpy.count_nonzero(position_results < 0)),
+            }
+            for position_results in relative_results
+        ]
+
+    def play_boards(self, boards, turns, quiet_plies=None):
+        """Play every board to the end. The arrays are changed in place.
+        boards: (games, width) int8 array of pieces
+        turns: (games,) int8 array, 1 if White is to move and -1 if Black is
+        quiet_plies: (games,) plies already played without a capture or a man moving
+        Returns a (games,) int8 array: 1 if White won, -1 if Black won and 0 for a draw.
+        """
+        game_count = boards.shape[0]
+        if quiet_plies is None:
+            quiet_plies = numpy.zeros(game_count, dtype=numpy.int32)
+
+        results = numpy.zeros(game_count, dtype=numpy.int8)
+        plies = numpy.zeros(game_count, dtype=numpy.int32)
+        continuing = numpy.zeros(game_count, dtype=numpy.intp)
+        active = numpy.ones(game_count, dtype=bool)
+        quiet_limit = None if self.draw_move_limit is None else self.draw_move_limit * 2
+
+        while True:
+            game_indexes = numpy.nonzero(active)[0]
+            if len(game_indexes) == 0:
+                break
+            self.step(boards, turns, continuing, plies, quiet_plies, results, active, game_indexes)
+
+            # Finish games that ran too long.
+            too_long = active & (plies >= self.max_plies)
+            if quiet_limit is not None:
+                too_long |= active & (quiet_plies >= quiet_limit) & (continuing == 0)
+            active &= ~too_long
+
+        return results
+
+    def get_move_masks(self, boards, turns, continuing):
+        """Returns (simple, jumps) boolean arrays shaped (games, 4, width).
+        simple[g, d, l] is True if the piece on location l can move one square in direction d.
+        jumps[g, d, l] is True if it can jump in direction d.
+        """
+        mine = boards * turns[:, None]
+        neighbors = mine[:, self.neighbor_table]
+        landings = mine[:, self.jump_table]
+
+        turn_index = (turns < 0).astype(numpy.intp)
+        forward = self.forward_directions[turn_index]
+        allowed = (mine == 2)[:, None, :] | ((mine == 1)[:, None, :] & forward[:, :, None])
+
+        simple = allowed & self.neighbor_valid[None] & (neighbors == 0)
+        jumps = allowed & self.jump_valid[None] & (neighbors < 0) & (landings == 0)
+
+        # A piece that can jump must jump.
+        simple &= ~jumps.any(axis=1)[:, None, :]
+
+        # In the middle of a multijump, only the jumping piece can keep jumping.
+        is_continuing = continuing > 0
+        if is_continuing.any():
+            simple[is_continuing] = False
+            jumps[is_continuing] &= (self.locations[None, None, :] == continuing[is_continuing][:, None, None])
+
+        return simple, jumps
+
+    def can_jump_from(self, boards, turns, locations):
+        """Returns a boolean array, True where the piece on each board's location can jump again.
+        """
+        rows = numpy.arange(len(locations))[:, None]
+        mine = boards * turns[:, None]
+        pieces = mine[rows[:, 0], locations]
+
+        turn_index = (turns < 0).astype(numpy.intp)
+        allowed = (pieces == 2)[:, None] | ((pieces == 1)[:, None] & self.forward_directions[turn_index])
+
+        neighbor_locations = self.neighbor_table[:, locations].T
+        landing_locations = self.jump_table[:, locations].T
+        return (
+            allowed
+            & (landing_locations != self.off_board)
+            & (mine[rows, neighbor_locations] < 0)
+            & (mine[rows, landing_locations] == 0)
+        ).any(axis=1)
+
+    def step(self, boards, turns, continuing, plies, quiet_plies, results, active, game_indexes):
+        """Make one move or jump in every active game.
+        """
+        board_rows = boards[game_indexes]
+        turn_rows = turns[game_indexes]
+        continuing_rows = continuing[game_indexes]
+
+        simple, jumps = self.get_move_masks(board_rows, turn_rows, continuing_rows)
+        candidates = numpy.stack([simple, jumps], axis=-1).reshape(len(game_indexes), -1)
+
+        # Pick a random legal move in every game at once.
+        priorities = self.random.random(candidates.shape)
+        priorities[~candidates] = -1.0
+        choices = priorities.argmax(axis=1)
+        has_move = candidates.any(axis=1)
+
+        # Players who can't move lose.
+        stuck = ~has_move
+        if stuck.any():
+            stuck_games = game_indexes[stuck]
+            results[stuck_games] = -turn_rows[stuck]
+            active[stuck_games] = False
+
+        moving = has_move
+        rows = numpy.nonzero(moving)[0]
+        if len(rows) == 0:
+            return
+        choices = choices[moving]
+
+        is_jump = (choices % 2) == 1
+        start_locations = (choices // 2) % self.width
+        direction_indexes = choices // (2 * self.width)
+        neighbor_locations = self.neighbor_table[direction_indexes, start_locations]
+        end_locations = numpy.where(is_jump, self.jump_table[direction_indexes, start_locations], neighbor_locations)
+
+        # Move the pieces and remove the jumped ones.
+        pieces = board_rows[rows, start_locations]
+        board_rows[rows, start_locations] = 0
+        board_rows[rows, end_locations] = pieces
+        jump_rows = rows[is_jump]
+        board_rows[jump_rows, neighbor_locations[is_jump]] = 0
+
+        # Jumps continue if the piece can jump again.
+        keeps_jumping = numpy.zeros(len(rows), dtype=bool)
+        if len(jump_rows):
+            keeps_jumping[is_jump] = self.can_jump_from(board_rows[jump_rows], turn_rows[jump_rows], end_locations[is_jump])
+
+        # Men reaching the far row at the end of their move are promoted.
+        ends_turn = ~keeps_jumping
+        turn_index = (turn_rows[rows] < 0).astype(numpy.intp)
+        is_man = (pieces == 1) | (pieces == -1)
+        promoted = ends_turn & is_man & self.promotion_rows[turn_index, end_locations]
+        board_rows[rows[promoted], end_locations[promoted]] = pieces[promoted] * 2
+
+        boards[game_indexes] = board_rows
+
+        moved_games = game_indexes[rows]
+        continuing[moved_games] = numpy.where(keeps_jumping, end_locations, 0)
+
+        # Captures and men moving reset the draw counter.
+        progress = is_jump | is_man
+        quiet_plies[moved_games] = numpy.where(progress, 0, quiet_plies[moved_games] + ends_turn)
+
+        finished_games = moved_games[ends_turn]
+        turns[finished_games] = -turns[finished_games]
+        plies[finished_games] += 1
@@ -0,0 +1,375 @@
+import math
+import random
+import time
+from array import array
+
+from components.history import MoveHistory
+
+def random_playout_policy(game, legal_moves, move_picker):
+    """Pick any legal move.
+    """
+    return legal_moves[move_picker.randrange(len(legal_moves))]
+
+def capture_playout_policy(game, legal_moves, move_picker):
+    """Pick one of the moves that jumps the most pieces. Falls back to a random move.
+    """
+    most_jumps = max(len(move.get("jumps_over", ())) for move in legal_moves)
+    if most_jumps == 0:
+        return legal_moves[move_picker.randrange(len(legal_moves))]
+
+    best_moves = [move for move in legal_moves if len(move.get("jumps_over", ())) == most_jumps]
+    return best_moves[move_picker.randrange(len(best_moves))]
+
+def uniform_prior_policy(game, legal_moves):
+    """Give every move the same prior probability.
+    """
+    return [1.0 / len(legal_moves)] * len(legal_moves)
+
+def encode_tree_move(move):
+    """Returns the move packed into one integer, or -1 if it doesn't fit. See MoveHistory.encode_move.
+    """
+    code = MoveHistory.encode_move(move, [False] * len(move.get("jumps_over", ())), False, False)
+    return -1 if code is None else code
+
+def moves_match(first_move, second_move):
+    """Returns True if both moves start, land and end on the same locations.
+    """
+    return (
+        first_move["start"] == second_move["start"]
+        and first_move["end"] == second_move["end"]
+        and first_move.get("lands", None) == second_move.get("lands", None)
+    )
+
+class MonteCarloTreeSearch(object):
+    """Chooses moves by playing many quick games from the current position.
+
+    The tree is stored as flat arrays indexed by node number instead of one object per node.
+    Even the moves are packed integers, decoded only when they are played, so a big tree holds
+    no Python objects per node for the garbage collector to walk.
+    The children of a node are stored next to each other, starting at first_child.
+    Every iteration plays its moves on the root game and takes them back afterwards, instead of copying it.
+    Once max_nodes nodes exist, the tree stops growing and only plays out from its leaves.
+
+    Options:
+    selection: "uct" or "puct".
+    exploration: how much to favor moves that haven't been tried much.
+    playout_policy: function(game, legal_moves, move_picker) returning the move to play during playouts.
+    prior_policy: function(game, legal_moves) returning a probability for each move. Only used by "puct".
+    max_nodes: the most nodes the tree will hold.
+    max_playout_plies: playouts longer than this are counted as draws.
+    seed: seed for the random number generator.
+    """
+    def __init__(self, *args, **kwargs):
+        self.selection = kwargs.get("selection", "uct")
+        if not self.selection in ("uct", "puct"):
+            raise KeyError("Selection is invalid, {selection}".format(selection=self.selection))
+
+        self.exploration = kwargs.get("exploration", math.sqrt(2))
+        self.playout_policy = kwargs.get("playout_policy", random_playout_policy)
+        self.prior_policy = kwargs.get("prior_policy", uniform_prior_policy)
+        self.max_nodes = kwargs.get("max_nodes", 200000)
+        self.max_playout_plies = kwargs.get("max_playout_plies", 200)
+        self.move_picker = random.Random(kwargs.get("seed", None))
+
+        self.playouts = 0
+        self.clear()
+
+    def clear(self):
+        """Forget the whole tree.
+        """
+        self.root_game = None
+        self.root_hash = None
+
+        # Node 0 is the root.
+        self.parents = array("i", [-1])
+        self.first_children = array("i", [-1])
+        self.child_counts = array("i", [0])
+        self.visits = array("i", [0])
+        # Total score for the player who made the move leading to the node. Wins are 1, draws 0.5.
+        self.scores = array("d", [0.0])
+        self.priors = array("d", [1.0])
+        # 0 if White made the move leading to the node, 1 if Black did.
+        self.movers = bytearray([0])
+        # Moves packed by encode_tree_move. Moves that don't fit are -1, and kept whole in overflow_moves by node.
+        self.moves = array("q", [-1])
+        self.overflow_moves = {}
+
+    def get_node_count(self):
+        return len(self.moves)
+
+    def get_move(self, node):
+        """Returns the move leading to the node, as a dict.
+        """
+        code = self.moves[node]
+        if code == -1:
+            return self.overflow_moves[node]
+        return MoveHistory.decode_move(code)[0]
+
+    def set_root(self, game):
+        """Search from the given game. Keeps the tree if it is already searching this position.
+        """
+        position_hash = game.get_position_hash()
+        if self.root_game is not None and position_hash == self.root_hash:
+            self.root_game = game.copy()
+            return
+
+        self.clear()
+        self.root_game = game.copy()
+        self.root_hash = position_hash
+        self.movers[0] = 1 if game.get_current_turn() == "White" else 0
+
+    def search(self, game, iterations=1000, seconds=None):
+        """Search the position for the given number of iterations, or for the given number of seconds.
+        Returns the move that was tried the most, or None if there are no legal moves.
+        """
+        self.set_root(game)
+
+        deadline = None
+        if seconds is not None:
+            deadline = time.perf_counter() + seconds
+            iterations = None
+
+        iteration = 0
+        while iterations is None or iteration < iterations:
+            self.run_iteration()
+            iteration += 1
+
+            # Checking the clock is slow compared to an iteration, so only do it now and then.
+            if deadline is not None and iteration % 16 == 0 and time.perf_counter() >= deadline:
+                break
+
+        return self.get_best_move()
+
+    def run_iteration(self):
+        """Select a leaf, expand it, play a game out from it and record the result.
+        """
+        game = self.root_game
+        root_ply_count = game.get_ply_count()
+        node = 0
+
+        try:
+            # Walk down the tree, picking the most promising child each time.
+            while self.child_counts[node] > 0:
+                node = self.select_child(node)
+                game.apply_move(self.get_move(node), validate=False)
+
+            # Grow the tree below leaves that have been visited before, unless it's full or the game is over.
+            legal_moves = game.get_current_legal_moves()
+            can_expand = (
+                legal_moves
+                and (node == 0 or self.visits[node] > 0)
+                and self.get_node_count() + len(legal_moves) <= self.max_nodes
+                and not game.is_draw()
+            )
+            if can_expand:
+                self.expand(node, game, legal_moves)
+                node = self.first_children[node]
+                game.apply_move(self.get_move(node), validate=False)
+                legal_moves = None
+
+            winner = self.play_out(game, legal_moves)
+        finally:
+            for ply in range(game.get_ply_count() - root_ply_count):
+                game.undo_move(notify=False)
+
+        self.back_propagate(node, winner)
+
+    def select_child(self, node):
+        """Returns the child with the best UCT or PUCT score.
+        Children that have never been visited are picked first.
+        """
+        first_child = self.first_children[node]
+        last_child = first_child + self.child_counts[node]
+        visits = self.visits
+        scores = self.scores
+
+        parent_visits = visits[node]
+        best_child = first_child
+        best_value = -1.0
+
+        if self.selection == "uct":
+            log_parent_visits = math.log(parent_visits) if parent_visits > 0 else 0.0
+            for child in range(first_child, last_child):
+                child_visits = visits[child]
+                if child_visits == 0:
+                    return child
+                value = scores[child] / child_visits + self.exploration * math.sqrt(log_parent_visits / child_visits)
+                if value > best_value:
+                    best_value = value
+                    best_child = child
+        else:
+            priors = self.priors
+            exploration = self.exploration * math.sqrt(parent_visits)
+            for child in range(first_child, last_child):
+                child_visits = visits[child]
+                mean_score = scores[child] / child_visits if child_visits else 0.5
+                value = mean_score + exploration * priors[child] / (1 + child_visits)
+                if value > best_value:
+                    best_value = value
+                    best_child = child
+
+        return best_child
+
+    def expand(self, node, game, legal_moves):
+        """Add a child for every legal move. The children are shuffled so unvisited ones are tried in random order.
+        """
+        legal_moves = list(legal_moves)
+        self.move_picker.shuffle(legal_moves)
+
+        priors = self.prior_policy(game, legal_moves) if self.selection == "puct" else None
+        mover = 0 if game.get_current_turn() == "White" else 1
+
+        self.first_children[node] = len(self.moves)
+        self.child_counts[node] = len(legal_moves)
+        for index, move in enumerate(legal_moves):
+            self.parents.append(node)
+            self.first_children.append(-1)
+            self.child_counts.append(0)
+            self.visits.append(0)
+            self.scores.append(0.0)
+            self.priors.append(priors[index] if priors else 1.0)
+            self.movers.append(mover)
+            code = encode_tree_move(move)
+            if code == -1:
+                self.overflow_moves[len(self.moves)] = move
+            self.moves.append(code)
+
+    def play_out(self, game, legal_moves=None):
+        """Play the game out with the playout policy.
+        Returns the winning color, or "Draw".
+        """
+        playout_policy = self.playout_policy
+        move_picker = self.move_picker
+        self.playouts += 1
+
+        for ply in range(self.max_playout_plies):
+            if legal_moves is None:
+                legal_moves = game.get_current_legal_moves()
+
+            # No moves (or no pieces) means the player to move has lost.
+            if not legal_moves:
+                return game.get_opponent(game.get_current_turn())
+            if game.is_draw():
+                return "Draw"
+
+            game.apply_move(playout_policy(game, legal_moves, move_picker), validate=False)
+            legal_moves = None
+
+        return "Draw"
+
+    def back_propagate(self, node, winner):
+        """Add the result to every node from the given node up to the root.
+        """
+        if winner == "Draw":
+            winning_mover = -1
+        else:
+            winning_mover = 0 if winner == "White" else 1
+
+        while node >= 0:
+            self.visits[node] += 1
+            if winning_mover == -1:
+                self.scores[node] += 0.5
+            elif self.movers[node] == winning_mover:
+                self.scores[node] += 1.0
+            node = self.parents[node]
+
+    def get_root_statistics(self):
+        """Returns a list of dicts for each move from the root, with its visits and average score.
+        """
+        statistics = []
+        first_child = self.first_children[0]
+        for child in range(first_child, first_child + self.child_counts[0]):
+            visits = self.visits[child]
+            statistics.append({
+                "move": self.get_move(child),
+                "visits": visits,
+                "score": self.scores[child] / visits if visits else 0.0,
+            })
+        return statistics
+
+    def get_best_move(self):
+        """Returns the move from the root that was visited the most.
+        """
+        best_child = None
+        best_visits = -1
+        first_child = self.first_children[0]
+        for child in range(first_child, first_child + self.child_counts[0]):
+            if self.visits[child] > best_visits:
+                best_visits = self.visits[child]
+                best_child = child
+        if best_child is None:
+            return None
+        return self.get_move(best_child)
+
+    def advance(self, move):
+        """Move the root to the child for the given move, keeping its subtree and dropping the rest.
+        Call this for every move played, including the opponent's, to reuse the tree between moves.
+        """
+        if self.root_game is None:
+            return
+
+        new_root = -1
+        first_child = self.first_children[0]
+        for child in range(first_child, first_child + self.child_counts[0]):
+            if moves_match(self.get_move(child), move):
+                new_root = child
+                break
+
+        new_root_game = self.root_game.copy()
+        new_root_game.apply_move(move)
+
+        if new_root == -1:
+            self.set_root(new_root_game)
+            return
+
+        self.compact(new_root)
+        self.root_game = new_root_game
+        self.root_hash = new_root_game.get_position_hash()
+
+    def compact(self, new_root):
+        """Copy the subtree under new_root into fresh arrays so it becomes node 0.
+        """
+        parents = array("i", [-1])
+        first_children = array("i", [-1])
+        child_counts = array("i", [0])
+        visits = array("i", [self.visits[new_root]])
+        scores = array("d", [self.scores[new_root]])
+        priors = array("d", [1.0])
+        movers = bytearray([self.movers[new_root]])
+        moves = array("q", [-1])
+        overflow_moves = {}
+
+        # Copy one block of children at a time so they stay next to each other.
+        pending = [(new_root, 0)]
+        while pending:
+            old_node, new_node = pending.pop()
+            child_count = self.child_counts[old_node]
+            if child_count == 0:
+                continue
+
+            old_first_child = self.first_children[old_node]
+            first_children[new_node] = len(moves)
+            child_counts[new_node] = child_count
+            for old_child in range(old_first_child, old_first_child + child_count):
+                new_child = len(moves)
+                parents.append(new_node)
+                first_children.append(-1)
+                child_counts.append(0)
+                visits.append(self.visits[old_child])
+                scores.append(self.scores[old_child])
+                priors.append(self.priors[old_child])
+                movers.append(self.movers[old_child])
+                moves.append(self.moves[old_child])
+                if old_child in self.overflow_moves:
+                    overflow_moves[new_child] = self.overflow_moves[old_child]
+                pending.append((old_child, new_child))
+
+        self.parents = parents
+        self.first_children = first_children
+        self.child_counts = child_counts
+        self.visits = visits
+        self.scores = scores
+        self.priors = priors
+        self.movers = movers
+        self.moves = moves
+        self.overflow_moves = overflow_moves
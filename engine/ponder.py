@@ -0,0 +1,235 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+
+from engine.search import AlphaBetaSearch
+from engine.search import material_evaluation
+from engine.search import move_key
+
+# Depth used when a ponder search should run until it is stopped.
+UNLIMITED_DEPTH = 100
+
+# Ponder searches are started from a worker thread while other threads run. Forking a threaded
+# process can copy a lock some other thread holds, so the background process is spawned instead.
+PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+def ponder_worker(game, options, stop_event, keep_table_event, results):
+    """Runs in the background process. Searches the game until it is stopped or the depth is reached,
+    putting ("iteration", result) on the results queue after every depth, and ("searched", result) once the
+    search ends by itself. Ends with ("done", result, table) after it is stopped.
+    The table is only sent if keep_table_event is set, and then only the options["returned_entries"]
+    entries stored last, which come from the deepest iterations. Sending a whole table can take seconds.
+    """
+    searcher = AlphaBetaSearch(
+        evaluation = options["evaluation"],
+        max_table_entries = options["max_table_entries"],
+        use_symmetry = options["use_symmetry"],
+    )
+    finished = threading.Event()
+
+    def wait_for_stop():
+        stop_event.wait()
+        searcher.stop_until(finished.is_set)
+
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+
+    def send_iteration(result):
+        results.put(("iteration", result))
+
+    try:
+        result = searcher.search(game, depth=options["depth"], on_iteration=send_iteration)
+    finally:
+        finished.set()
+
+    # A search that ended by itself waits to hear whether its table is wanted.
+    if not stop_event.is_set():
+        results.put(("searched", result))
+        stop_event.wait()
+    table = None
+    if keep_table_event.is_set():
+        table = dict(itertools.islice(reversed(searcher.transposition_table.items()), options["returned_entries"]))
+    results.put(("done", result, table))
+
+class Ponderer(object):
+    """Thinks on the opponent's time.
+
+    After the engine moves, start is given the move it expects the opponent to play. The position after that
+    move is searched in a background process while the opponent thinks, so it never competes with the
+    game for the interpreter. The process is spawned, not forked, so start is safe to call from any thread. When the opponent moves, hit is called with the move they played:
+    if it was the expected move, the time already spent pondering counts toward the engine's move,
+    and the last entries of the ponder search's transposition table are copied into the searcher,
+    so any further searching starts warm. Any other move cancels the search.
+
+    Options:
+    searcher: the AlphaBetaSearch whose options are used for the ponder search. It receives the ponder search's
+        table on a hit, and searches on if the ponder search has no result yet. hit changes it, so only call hit
+        from the thread that owns it, or give the Ponderer a searcher of its own.
+    max_depth: the deepest the ponder search goes before waiting.
+    returned_entries: the most transposition table entries copied back on a hit.
+    stop_timeout: seconds to wait for the background process to stop before it is terminated.
+    """
+    def __init__(self, *args, **kwargs):
+        self.searcher = kwargs.get("searcher", None) or AlphaBetaSearch()
+        self.max_depth = kwargs.get("max_depth", UNLIMITED_DEPTH)
+        self.returned_entries = kwargs.get("returned_entries", 20000)
+        self.stop_timeout = kwargs.get("stop_timeout", 5.0)
+
+        self.process = None
+        self.results = None
+        self.stop_event = None
+        self.keep_table_event = None
+        self.ponder_game = None
+        self.expected_key = None
+        self.latest_result = None
+        self.started_at = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def is_pondering(self):
+        return self.process is not None
+
+    def start(self, game, expected_move):
+        """Start searching the position after the expected move, in the background.
+        Any ponder search already running is cancelled.
+        Returns False if there is nothing to ponder, because the expected move ends the game.
+        Raises an IllegalMoveException if the expected move is not legal.
+        """
+        self.cancel()
+
+        ponder_game = game.copy()
+        # Instrumentation holds wrapped methods, which can't be sent to the background process.
+        ponder_game.disable_instrumentation()
+        ponder_game.apply_move(expected_move)
+        if not ponder_game.has_any_move() or ponder_game.is_draw():
+            return False
+
+        options = {
+            "evaluation": getattr(self.searcher, "evaluation", material_evaluation),
+            "max_table_entries": self.searcher.max_table_entries,
+            "use_symmetry": self.searcher.use_symmetry,
+            "depth": self.max_depth,
+            "returned_entries": self.returned_entries,
+        }
+        self.results = PROCESS_CONTEXT.Queue()
+        self.stop_event = PROCESS_CONTEXT.Event()
+        self.keep_table_event = PROCESS_CONTEXT.Event()
+        self.process = PROCESS_CONTEXT.Process(
+            target = ponder_worker,
+            args = (ponder_game, options, self.stop_event, self.keep_table_event, self.results),
+            daemon = True,
+        )
+        self.process.start()
+
+        self.ponder_game = ponder_game
+        self.expected_key = move_key(expected_move)
+        self.latest_result = None
+        self.started_at = time.perf_counter()
+        return True
+
+    def hit(self, move, depth=None, seconds=None):
+        """The opponent played the given move. If it was the expected move, finish the ponder search:
+        wait until it reaches depth, or until it has searched for seconds in all, whichever comes first.
+        The time spent pondering counts, so a search that already reached depth or used up seconds
+        returns right away. With neither, the search stops right away with the deepest result it has.
+        Returns the search result, in the same format as AlphaBetaSearch.search,
+        or None if the move was not the expected one.
+        """
+        if not self.is_pondering() or move_key(move) != self.expected_key:
+            if self.is_pondering():
+                self.misses += 1
+            self.cancel()
+            return None
+
+        self.hits += 1
+        deadline = self.started_at + seconds if seconds is not None else None
+        while depth is not None or deadline is not None:
+            if depth is not None and self.latest_result is not None and self.latest_result["depth"] >= depth:
+                break
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+            try:
+                message = self.results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            self.latest_result = message[1]
+            if message[0] == "searched":
+                break
+
+        game = self.ponder_game
+        table = self.stop(keep_table=True)
+        if table:
+            # Keep whichever entry was searched deeper.
+            searcher_table = self.searcher.transposition_table
+            for position_hash, entry in table.items():
+                old_entry = searcher_table.get(position_hash, None)
+                if old_entry is None or old_entry[0] <= entry[0]:
+                    self.searcher.store(position_hash, *entry)
+
+        result = self.latest_result
+        self.latest_result = None
+        if result is None:
+            # The ponder search didn't finish a single depth. The table still helps.
+            if deadline is not None:
+                seconds = max(0.01, deadline - time.perf_counter())
+            result = self.searcher.search(game, depth=depth, seconds=seconds)
+        return result
+
+    def finish(self, message):
+        """Keep the final result from a done message. Returns its table.
+        """
+        if message[1] is not None:
+            self.latest_result = message[1]
+        self.process.join(self.stop_timeout)
+        self.process = None
+        return message[2]
+
+    def stop(self, keep_table=False):
+        """Stop the background search and wait for it to end.
+        Returns the ponder search's transposition table if keep_table is True and the search sent it.
+        """
+        if self.process is None:
+            return None
+
+        if keep_table:
+            self.keep_table_event.set()
+        self.stop_event.set()
+
+        # Read everything the process sends before joining, or it can block writing to the queue.
+        table = None
+        deadline = time.perf_counter() + self.stop_timeout
+        while self.process is not None:
+            try:
+                message = self.results.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                self.process.terminate()
+                self.process.join()
+                self.process = None
+                break
+            if message[0] == "done":
+                table = self.finish(message)
+            else:
+                self.latest_result = message[1]
+
+        self.results.close()
+        self.results = None
+        self.ponder_game = None
+        self.expected_key = None
+        return table
+
+    def cancel(self):
+        """Throw away any ponder search.
+        """
+        self.stop()
+        self.latest_result = None
+
+    def get_statistics(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+        }
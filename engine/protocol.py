@@ -0,0 +1,247 @@
+import sys
+import threading
+import time
+
+from components.checkerboard import CheckerGame
+from components.checkerboard import IllegalMoveException
+from engine.search import AlphaBetaSearch
+from texthandling.input import InvalidMoveException
+from texthandling.input import InvalidPositionException
+from texthandling.input import TextInput
+from texthandling.output import TextOutput
+
+# Depth used when a search should run until it is stopped.
+UNLIMITED_DEPTH = 100
+
+class EngineProtocol(object):
+    """Runs the engine as a long-lived process that reads commands from stdin and answers on stdout,
+    in the style of the UCI chess protocol. The searcher and its transposition table stay warm between moves.
+
+    Commands:
+    uci                          answers with the engine name and uciok
+    isready                      answers readyok, even while searching
+    newgame                      forgets the transposition table and goes back to the start position
+    position startpos [moves M...]
+    position fen FEN [moves M...]
+    go [depth N] [movetime MS] [wtime MS btime MS winc MS binc MS movestogo N] [infinite] [ponder]
+    stop                         stops the search and answers with the best move found
+    ponderhit                    the expected move was played, so a ponder search becomes a normal one
+    quit
+
+    While searching, an info line is written after every depth: info depth D score S nodes N time MS pv M...
+    The search ends with: bestmove M [ponder M]
+    An infinite or ponder search that ends by itself, for example by finding a win, holds its bestmove
+    until stop (or ponderhit, for a ponder search) arrives.
+    """
+    ENGINE_NAME = "terminal-checkers"
+
+    # Without a clock, assume this many moves are left to play.
+    DEFAULT_MOVES_TO_GO = 30
+
+    # Seconds a ponder search keeps going after ponderhit, if go gave neither movetime nor a clock.
+    DEFAULT_PONDER_HIT_SECONDS = 2.0
+
+    def __init__(self, *args, **kwargs):
+        self.input = kwargs.get("input", sys.stdin)
+        self.output = kwargs.get("output", sys.stdout)
+        self.size = kwargs.get("size", 8)
+        self.flying_kings = kwargs.get("flying_kings", False)
+        self.searcher = kwargs.get("searcher", None) or AlphaBetaSearch()
+
+        self.game = CheckerGame(size=self.size, flying_kings=self.flying_kings)
+        self.output_lock = threading.Lock()
+        self.search_thread = None
+        self.search_is_unlimited = False
+        # Set once the running search may send its bestmove.
+        self.bestmove_release = None
+        self.search_is_ponder = False
+
+        # Seconds to search once a ponder search gets a ponderhit.
+        self.ponder_seconds = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self):
+        """Read commands until quit or the end of the input.
+        At the end of the input, a search with a limit is allowed to finish.
+        """
+        for line in self.input:
+            if not self.handle_command(line):
+                self.stop_search()
+                return
+
+        if self.search_thread is not None and not self.search_is_unlimited:
+            self.search_thread.join()
+        self.stop_search()
+
+    def handle_command(self, line):
+        """Run one command. Returns False if the engine should quit.
+        """
+        words = line.split()
+        if not words:
+            return True
+
+        command = words[0]
+        if command == "uci":
+            self.send("id name {name}".format(name=self.ENGINE_NAME))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "newgame":
+            self.stop_search()
+            self.searcher.clear()
+            self.game = CheckerGame(size=self.size, flying_kings=self.flying_kings)
+        elif command == "position":
+            self.stop_search()
+            self.set_position(words[1:])
+        elif command == "go":
+            self.stop_search()
+            self.start_search(words[1:])
+        elif command == "stop":
+            self.stop_search()
+        elif command == "ponderhit":
+            self.ponder_hit()
+        elif command == "quit":
+            return False
+        else:
+            self.send("info string unknown command {command}".format(command=command))
+        return True
+
+    def set_position(self, words):
+        """Set up the game from "startpos" or "fen FEN", then play any moves after "moves".
+        Stops at the first move that can't be played.
+        """
+        if "moves" in words:
+            moves_index = words.index("moves")
+            move_strings = words[moves_index + 1:]
+            words = words[:moves_index]
+        else:
+            move_strings = []
+
+        game = CheckerGame(size=self.size, flying_kings=self.flying_kings)
+        if words[:1] == ["fen"]:
+            try:
+                position = TextInput.parse_fen(" ".join(words[1:]), self.size)
+                game.set_position(position["pieces"], position["turn"])
+            except (InvalidPositionException, KeyError) as error:
+                self.send("info string invalid position {error}".format(error=error))
+                return
+        elif words[:1] != ["startpos"]:
+            self.send("info string invalid position {words}".format(words=" ".join(words)))
+            return
+
+        for move_string in move_strings:
+            try:
+                game.apply_move(TextInput.parse_move(move_string, self.size))
+            except (InvalidMoveException, IllegalMoveException):
+                self.send("info string illegal move {move}".format(move=move_string))
+                break
+
+        self.game = game
+
+    def get_search_limits(self, words):
+        """Returns the depth and seconds to search for the words after "go", and whether this is a ponder search.
+        """
+        options = {}
+        flags = set()
+        index = 0
+        while index < len(words):
+            word = words[index]
+            if word in ("infinite", "ponder"):
+                flags.add(word)
+                index += 1
+                continue
+            try:
+                options[word] = int(words[index + 1])
+            except (IndexError, ValueError):
+                pass
+            index += 2
+
+        depth = options.get("depth", None)
+        seconds = None
+        if "movetime" in options:
+            seconds = options["movetime"] / 1000.0
+        elif "wtime" in options or "btime" in options:
+            # Spend an even share of the time left, plus the increment.
+            color_prefix = "w" if self.game.get_current_turn() == "White" else "b"
+            time_left = options.get(color_prefix + "time", 0) / 1000.0
+            increment = options.get(color_prefix + "inc", 0) / 1000.0
+            moves_to_go = options.get("movestogo", self.DEFAULT_MOVES_TO_GO)
+            seconds = max(0.01, min(time_left * 0.9, time_left / max(moves_to_go, 1) + increment))
+
+        is_ponder = "ponder" in flags
+        if "infinite" in flags or is_ponder:
+            # Ponder searches run until stop or ponderhit, then use the normal time.
+            if is_ponder and seconds is None:
+                seconds = self.DEFAULT_PONDER_HIT_SECONDS
+            self.ponder_seconds = seconds if is_ponder else None
+            return depth or UNLIMITED_DEPTH, None, is_ponder
+
+        if depth is None and seconds is None:
+            depth = 6
+        return depth, seconds, False
+
+    def start_search(self, words):
+        depth, seconds, is_ponder = self.get_search_limits(words)
+        is_infinite = "infinite" in words
+        self.search_is_unlimited = is_infinite or is_ponder
+        self.search_is_ponder = is_ponder and not is_infinite
+        game = self.game.copy()
+
+        # Searches that run until they are told to stop only answer once they are told.
+        bestmove_release = threading.Event()
+        if not self.search_is_unlimited:
+            bestmove_release.set()
+        self.bestmove_release = bestmove_release
+
+        def send_info(result):
+            self.send("info depth {depth} score {score} nodes {nodes} time {milliseconds} pv {pv}".format(
+                depth = result["depth"],
+                score = result["score"],
+                nodes = result["nodes"],
+                milliseconds = int(result["seconds"] * 1000),
+                pv = " ".join(TextOutput.format_move(move) for move in result["pv"]),
+            ))
+
+        def search():
+            result = self.searcher.search(game, depth=depth, seconds=seconds, on_iteration=send_info)
+            bestmove_release.wait()
+            if result is None:
+                self.send("bestmove none")
+                return
+
+            line = "bestmove " + TextOutput.format_move(result["move"])
+            if len(result["pv"]) > 1:
+                line += " ponder " + TextOutput.format_move(result["pv"][1])
+            self.send(line)
+
+        self.search_thread = threading.Thread(target=search, daemon=True)
+        self.search_thread.start()
+
+    def ponder_hit(self):
+        """The opponent played the expected move. Keep searching, but now against the clock.
+        """
+        if self.ponder_seconds is not None:
+            self.searcher.deadline = time.perf_counter() + self.ponder_seconds
+            self.search_is_unlimited = False
+        self.ponder_seconds = None
+
+        # It is a normal search now, so it answers as soon as it ends.
+        if self.search_is_ponder:
+            self.search_is_ponder = False
+            self.bestmove_release.set()
+
+    def stop_search(self):
+        """Stop any running search and wait for it to report its best move.
+        """
+        if self.search_thread is None:
+            return
+
+        self.bestmove_release.set()
+        search_thread = self.search_thread
+        self.searcher.stop_until(lambda: not search_thread.is_alive())
+        search_thread.join()
+        self.search_thread = None
@@ -0,0 +1,313 @@
+import time
+
+from components.symmetry import get_canonical_hash
+from components.symmetry import get_flip_table
+
+class SearchStoppedException(Exception):
+    pass
+
+# Scores are in hundredths of a man, from the point of view of the player to move.
+MAN_SCORE = 100
+KING_SCORE = 150
+ADVANCE_SCORE = 2
+WIN_SCORE = 100000
+
+# Scores this close to a win are wins in a number of plies.
+WIN_THRESHOLD = WIN_SCORE - 1000
+
+# Kinds of transposition table entries.
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+def material_evaluation(game):
+    """Score the board by counting pieces, with a small bonus for men closer to promotion.
+    Returns the score for the player to move.
+    """
+    board = game.board
+    rows = board.rows
+    coordinates_by_location = board.geometry.coordinates_by_location
+    score = 0
+    for location, checker in board.pieces_by_location.items():
+        if checker.is_king:
+            value = KING_SCORE
+        elif checker.color == "White":
+            value = MAN_SCORE + ADVANCE_SCORE * (coordinates_by_location[location][0] - 1)
+        else:
+            value = MAN_SCORE + ADVANCE_SCORE * (rows - coordinates_by_location[location][0])
+
+        if checker.color == "White":
+            score += value
+        else:
+            score -= value
+
+    if game.current_turn == "White":
+        return score
+    return -score
+
+def move_key(move):
+    """Returns a hashable key that identifies a move.
+    """
+    return (move["start"], move["end"], tuple(move.get("lands", ())))
+
+def flip_move_key(key, flip_table):
+    """Returns the key of the same move on the turned around board.
+    """
+    start, end, lands = key
+    return (flip_table[start], flip_table[end], tuple(flip_table[location] for location in lands))
+
+class AlphaBetaSearch(object):
+    """Chooses moves with an iterative deepening alpha-beta search.
+
+    Moves are made and taken back on a single copy of the game, so searching doesn't copy boards.
+    Positions already searched are remembered in a transposition table keyed by the position hash.
+    Once the table holds max_table_entries positions, the oldest entries are dropped.
+
+    With use_symmetry, positions with Black to move are stored under their color-flipped twin
+    (see components.symmetry), so a position and its twin share one entry.
+
+    Options:
+    evaluation: function(game) returning the score for the player to move.
+    max_table_entries: the most positions the transposition table will hold.
+    use_symmetry: share table entries between color-flipped positions.
+    """
+    # How many nodes to search between looking at the clock.
+    NODES_PER_CLOCK_CHECK = 1024
+
+    def __init__(self, *args, **kwargs):
+        self.evaluation = kwargs.get("evaluation", material_evaluation)
+        self.max_table_entries = kwargs.get("max_table_entries", 1000000)
+        self.use_symmetry = kwargs.get("use_symmetry", True)
+        self.transposition_table = {}
+
+        self.nodes = 0
+        self.deadline = None
+        self.stop_requested = False
+        self.root_best_move = None
+
+    def clear(self):
+        """Forget every position in the transposition table.
+        """
+        self.transposition_table = {}
+
+    def stop(self):
+        """Ask a running search to stop. It returns the result of the last depth it finished.
+        Safe to call from another thread.
+        """
+        self.stop_requested = True
+
+    def stop_until(self, is_finished, interval=0.01):
+        """Ask a running search to stop, and keep asking every interval seconds until is_finished() returns True.
+        A search clears the request when it starts, so one request isn't enough if it hadn't started yet.
+        """
+        while not is_finished():
+            self.stop()
+            time.sleep(interval)
+
+    def search(self, game, depth=None, seconds=None, on_iteration=None):
+        """Search the position, one depth at a time, until the depth is reached or the time runs out.
+        With neither depth nor seconds, searches to depth 6.
+        on_iteration is called with the result after each depth finishes.
+        Returns a dict, or None if there are no legal moves.
+        move: the best move
+        score: its score for the player to move
+        pv: the line of moves the search expects
+        nodes: the number of positions searched
+        depth: the deepest search that finished
+        seconds: the time spent searching
+        """
+        if depth is None and seconds is None:
+            depth = 6
+
+        start_time = time.perf_counter()
+        self.nodes = 0
+        self.stop_requested = False
+        self.deadline = start_time + seconds if seconds is not None else None
+
+        game = game.copy()
+        if not game.get_current_legal_moves():
+            return None
+
+        result = None
+        current_depth = 1
+        while depth is None or current_depth <= depth:
+            try:
+                score = self.search_node(game, current_depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0)
+            except SearchStoppedException:
+                break
+
+            pv = self.get_principal_variation(game, current_depth)
+            if not pv or move_key(pv[0]) != move_key(self.root_best_move):
+                pv = [self.root_best_move]
+            result = {
+                "move": pv[0],
+                "score": score,
+                "pv": pv,
+                "nodes": self.nodes,
+                "depth": current_depth,
+                "seconds": time.perf_counter() - start_time,
+            }
+            if on_iteration is not None:
+                on_iteration(result)
+
+            # There's no point searching deeper once a win or loss is certain.
+            if abs(score) >= WIN_THRESHOLD:
+                break
+            current_depth += 1
+
+        # Even if the first depth was cut short, return something playable.
+        if result is None:
+            legal_moves = self.order_moves(game.get_current_legal_moves(), None)
+            result = {
+                "move": legal_moves[0],
+                "score": 0,
+                "pv": [legal_moves[0]],
+                "nodes": self.nodes,
+                "depth": 0,
+            }
+
+        result["nodes"] = self.nodes
+        result["seconds"] = time.perf_counter() - start_time
+        return result
+
+    def check_clock(self):
+        if self.stop_requested:
+            raise SearchStoppedException()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchStoppedException()
+
+    def get_table_key(self, game):
+        """Returns the transposition table key for the position, and the flip table if moves
+        need to be turned around to match the stored entry, or None if they don't.
+        """
+        if not self.use_symmetry or game.current_turn == "White":
+            return game.get_position_hash(), None
+        return get_canonical_hash(game), get_flip_table(game.board.geometry)
+
+    def order_moves(self, legal_moves, best_key):
+        """Try the move the table remembers first, then the moves that jump the most pieces.
+        """
+        return sorted(
+            legal_moves,
+            key = lambda move: (move_key(move) != best_key, -len(move.get("jumps_over", ()))),
+        )
+
+    def search_node(self, game, depth, alpha, beta, ply):
+        """Returns the score of the position for the player to move, searching depth plies ahead.
+        """
+        self.nodes += 1
+        if self.nodes % self.NODES_PER_CLOCK_CHECK == 0:
+            self.check_clock()
+
+        if ply > 0 and game.is_draw():
+            return 0
+
+        legal_moves = game.get_current_legal_moves()
+
+        # A player who can't move has lost. Sooner losses are worse.
+        if not legal_moves:
+            return -WIN_SCORE + ply
+
+        if depth <= 0:
+            return self.evaluation(game)
+
+        # See if this position has already been searched deeply enough.
+        position_hash, flip_table = self.get_table_key(game)
+        entry = self.transposition_table.get(position_hash, None)
+        best_key = None
+        if entry is not None:
+            entry_depth, entry_score, entry_kind, best_key = entry
+            if flip_table is not None and best_key is not None:
+                best_key = flip_move_key(best_key, flip_table)
+            if entry_depth >= depth and ply > 0:
+                entry_score = self.score_from_table(entry_score, ply)
+                if entry_kind == EXACT:
+                    return entry_score
+                if entry_kind == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if entry_kind == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        for move in self.order_moves(legal_moves, best_key):
+            game.apply_move(move, validate=False)
+            try:
+                score = -self.search_node(game, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.undo_move()
+
+            if score > best_score:
+                best_score = score
+                best_key = move_key(move)
+                if ply == 0:
+                    self.root_best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            kind = UPPER_BOUND
+        elif best_score >= beta:
+            kind = LOWER_BOUND
+        else:
+            kind = EXACT
+        if flip_table is not None:
+            best_key = flip_move_key(best_key, flip_table)
+        self.store(position_hash, depth, self.score_to_table(best_score, ply), kind, best_key)
+        return best_score
+
+    def store(self, position_hash, depth, score, kind, best_key):
+        """Remember a searched position, dropping the oldest entry if the table is full.
+        """
+        table = self.transposition_table
+        if not position_hash in table and len(table) >= self.max_table_entries:
+            del table[next(iter(table))]
+        table[position_hash] = (depth, score, kind, best_key)
+
+    def score_to_table(self, score, ply):
+        """Wins are stored as plies from the stored position, not from the root.
+        """
+        if score >= WIN_THRESHOLD:
+            return score + ply
+        if score <= -WIN_THRESHOLD:
+            return score - ply
+        return score
+
+    def score_from_table(self, score, ply):
+        if score >= WIN_THRESHOLD:
+            return score - ply
+        if score <= -WIN_THRESHOLD:
+            return score + ply
+        return score
+
+    def get_principal_variation(self, game, depth):
+        """Follow the best moves in the transposition table from the given position.
+        Returns a list of moves.
+        """
+        pv = []
+        game = game.copy()
+        for ply in range(depth):
+            position_hash, flip_table = self.get_table_key(game)
+            entry = self.transposition_table.get(position_hash, None)
+            if entry is None or entry[3] is None:
+                break
+
+            best_key = entry[3]
+            if flip_table is not None:
+                best_key = flip_move_key(best_key, flip_table)
+
+            best_move = None
+            for legal_move in game.get_current_legal_moves():
+                if move_key(legal_move) == best_key:
+                    best_move = legal_move
+                    break
+            if best_move is None:
+                break
+
+            pv.append(best_move)
+            game.apply_move(best_move, validate=False)
+            if game.is_draw():
+                break
+        return pv
@@ -0,0 +1,236 @@
+from array import array
+
+from components.history import MoveHistory
+from engine.mcts import encode_tree_move
+
+# Proof and disproof numbers are capped here. A node with a proof number of INFINITY can't be proven.
+INFINITY = 1 << 40
+
+class ProofNumberSearch(object):
+    """Proves or disproves that the player to move can force a win, using proof-number search.
+
+    Each node counts how many leaves still need to be proven (the proof number) or disproven
+    (the disproof number) to settle it. The search always expands the leaf that helps most,
+    so narrow forcing lines are settled long before a full-width search would finish.
+
+    The tree is stored as flat arrays indexed by node number, like MonteCarloTreeSearch, with each move packed into an integer.
+    The search gives up once the tree holds max_nodes nodes.
+    Draws count as failing to win. So does going back to a position already on the line,
+    since a forced win never needs to repeat a position.
+
+    Options:
+    max_nodes: the most nodes the tree will hold.
+    max_plies: only look for wins within this many plies. None means no limit.
+    """
+    def __init__(self, *args, **kwargs):
+        self.max_nodes = kwargs.get("max_nodes", 1000000)
+        self.max_plies = kwargs.get("max_plies", None)
+        self.clear()
+
+    def clear(self):
+        """Forget the whole tree.
+        """
+        self.attacker = None
+
+        # Node 0 is the root.
+        self.parents = array("i", [-1])
+        self.first_children = array("i", [-1])
+        self.child_counts = array("i", [0])
+        self.proof_numbers = array("q", [1])
+        self.disproof_numbers = array("q", [1])
+        # 1 if the attacker is to move in the node, 0 if the defender is.
+        self.attacker_to_move = bytearray([1])
+        self.depths = array("i", [0])
+        # Moves packed by encode_tree_move. Moves that don't fit are -1, and kept whole in overflow_moves by node.
+        self.moves = array("q", [-1])
+        self.overflow_moves = {}
+
+    def get_node_count(self):
+        return len(self.moves)
+
+    def get_move(self, node):
+        """Returns the move leading to the node, as a dict.
+        """
+        code = self.moves[node]
+        if code == -1:
+            return self.overflow_moves[node]
+        return MoveHistory.decode_move(code)[0]
+
+    def solve(self, game):
+        """Search until the position is proven, disproven or the tree is full.
+        Returns a dict.
+        result: "win" if the player to move can force a win, "no win" if they can't, or "unknown".
+        line: the winning moves for both sides, if the result is "win".
+        nodes: the number of nodes in the tree.
+        """
+        self.clear()
+        game = game.copy()
+        self.attacker = game.get_current_turn()
+        self.evaluate(0, game)
+
+        while self.proof_numbers[0] != 0 and self.disproof_numbers[0] != 0:
+            applied_moves = self.select_most_proving_node(game)
+            node = applied_moves[-1] if applied_moves else 0
+
+            legal_moves = game.get_current_legal_moves()
+            if self.get_node_count() + len(legal_moves) > self.max_nodes:
+                break
+
+            self.expand(node, game, legal_moves)
+            self.update_ancestors(node)
+
+            for applied_node in applied_moves:
+                game.undo_move()
+
+        if self.proof_numbers[0] == 0:
+            result = "win"
+        elif self.disproof_numbers[0] == 0:
+            result = "no win"
+        else:
+            result = "unknown"
+
+        return {
+            "result": result,
+            "line": self.get_winning_line() if result == "win" else [],
+            "nodes": self.get_node_count(),
+        }
+
+    def select_most_proving_node(self, game):
+        """Walk down from the root to the leaf that matters most, making each move on the game.
+        The attacker picks the child that is cheapest to prove, the defender the one cheapest to disprove.
+        Returns the list of nodes walked through, not counting the root.
+        """
+        applied_moves = []
+        node = 0
+        while self.child_counts[node] > 0:
+            first_child = self.first_children[node]
+            last_child = first_child + self.child_counts[node]
+            if self.attacker_to_move[node]:
+                numbers = self.proof_numbers
+            else:
+                numbers = self.disproof_numbers
+
+            best_child = first_child
+            for child in range(first_child + 1, last_child):
+                if numbers[child] < numbers[best_child]:
+                    best_child = child
+
+            node = best_child
+            game.apply_move(self.get_move(node), validate=False)
+            applied_moves.append(node)
+        return applied_moves
+
+    def expand(self, node, game, legal_moves):
+        """Add a child for every legal move, and set its numbers.
+        """
+        child_attacker_to_move = 0 if self.attacker_to_move[node] else 1
+        child_depth = self.depths[node] + 1
+
+        self.first_children[node] = len(self.moves)
+        self.child_counts[node] = len(legal_moves)
+        for move in legal_moves:
+            child = len(self.moves)
+            self.parents.append(node)
+            self.first_children.append(-1)
+            self.child_counts.append(0)
+            self.proof_numbers.append(1)
+            self.disproof_numbers.append(1)
+            self.attacker_to_move.append(child_attacker_to_move)
+            self.depths.append(child_depth)
+            code = encode_tree_move(move)
+            if code == -1:
+                self.overflow_moves[child] = move
+            self.moves.append(code)
+
+            game.apply_move(move, validate=False)
+            self.evaluate(child, game)
+            game.undo_move()
+
+    def evaluate(self, node, game):
+        """Set the numbers of a new node. Finished games are proven or disproven right away.
+        """
+        if game.is_draw() or game.get_repetition_count() > 1:
+            self.set_numbers(node, INFINITY, 0)
+            return
+
+        if not game.has_any_move():
+            # The player to move has lost.
+            if self.attacker_to_move[node]:
+                self.set_numbers(node, INFINITY, 0)
+            else:
+                self.set_numbers(node, 0, INFINITY)
+            return
+
+        if self.max_plies is not None and self.depths[node] >= self.max_plies:
+            self.set_numbers(node, INFINITY, 0)
+            return
+
+        self.set_numbers(node, 1, 1)
+
+    def set_numbers(self, node, proof_number, disproof_number):
+        self.proof_numbers[node] = proof_number
+        self.disproof_numbers[node] = disproof_number
+
+    def update_ancestors(self, node):
+        """Recompute the numbers from the given node up to the root.
+        Stops early once a node's numbers don't change.
+        """
+        while node >= 0:
+            first_child = self.first_children[node]
+            last_child = first_child + self.child_counts[node]
+            child_proof_numbers = self.proof_numbers[first_child:last_child]
+            child_disproof_numbers = self.disproof_numbers[first_child:last_child]
+
+            # The attacker needs one child proven. The defender needs every child proven.
+            if self.attacker_to_move[node]:
+                proof_number = min(child_proof_numbers)
+                disproof_number = min(sum(child_disproof_numbers), INFINITY)
+            else:
+                proof_number = min(sum(child_proof_numbers), INFINITY)
+                disproof_number = min(child_disproof_numbers)
+
+            if proof_number == self.proof_numbers[node] and disproof_number == self.disproof_numbers[node] and node != 0:
+                return
+
+            self.set_numbers(node, proof_number, disproof_number)
+            node = self.parents[node]
+
+    def get_winning_line(self):
+        """Follow proven nodes from the root.
+        The attacker plays the quickest proven win. The defender holds out the longest.
+        Returns a list of moves.
+        """
+        proof_lengths = self.get_proof_lengths()
+        line = []
+        node = 0
+        while self.child_counts[node] > 0:
+            first_child = self.first_children[node]
+            children = range(first_child, first_child + self.child_counts[node])
+            if self.attacker_to_move[node]:
+                node = min(
+                    (child for child in children if self.proof_numbers[child] == 0),
+                    key = proof_lengths.__getitem__,
+                )
+            else:
+                node = max(children, key=proof_lengths.__getitem__)
+            line.append(self.get_move(node))
+        return line
+
+    def get_proof_lengths(self):
+        """Returns an array with how many plies the proven win below each node takes.
+        Nodes the attacker can't win from get INFINITY.
+        Children are always added after their parent, so going backwards finishes every child before its parent.
+        """
+        proof_lengths = array("q", bytes(8 * len(self.moves)))
+        for node in range(len(self.moves) - 1, -1, -1):
+            if self.child_counts[node] == 0:
+                continue
+
+            first_child = self.first_children[node]
+            children = range(first_child, first_child + self.child_counts[node])
+            if self.attacker_to_move[node]:
+                proven_lengths = [proof_lengths[child] for child in children if self.proof_numbers[child] == 0]
+                proof_lengths[node] = 1 + min(proven_lengths) if proven_lengths else INFINITY
+            else:
+                proof_lengths[node] = 1 + max(proof_lengths[child] for child in children)
+        return proof_lengths
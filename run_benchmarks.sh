@@ -0,0 +1,5 @@
+pushd "$(dirname ${BASH_SOURCE[0]})"
+python3 benchmarks.py "$@"
+status=$?
+popd
+exit $status
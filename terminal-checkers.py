@@ -1,128 +1,1025 @@
+import argparse
+import asyncio
+import codecs
+import concurrent.futures
+import functools
+import io
+import json
+import os
+import random
+import string
+import sys
+import time
+
+from components.broadcast import SpectatorBroadcast
+from components.checkerboard import CheckerGame
+from components.checkerboard import IllegalMoveException
+from components.movecache import MoveCache
+from components.positionstore import PositionStore
+from engine.analysis import analyze_positions
+from engine.analysis import parse_position_line
+from engine.ponder import Ponderer
+from engine.protocol import EngineProtocol
+from engine.search import AlphaBetaSearch
+from engine.solver import ProofNumberSearch
+from texthandling.input import InvalidLocationException
+from texthandling.input import InvalidMoveException
+from texthandling.input import InvalidPositionException
+from texthandling.input import TextInput
+from texthandling.output import TextOutput
+
 class CheckerboardState(object):
     """Model keeps track of the checker board.
 
     columns are labelled a to h (left to right)
     rows are labelled 8 to 1 (top to bottom)
+    Larger boards use more letters and numbers.
+
+    The contexts for each row are cached. Moving a piece or changing the selection
+    only clears the rows that were touched.
     """
     def __init__(self, *args, **kwargs):
-        super().__init__(**kwargs)
+        super().__init__()
+
+        self.game = kwargs.get("game", None) or CheckerGame()
+        self.selected_location = None
+
+        # Cached values, cleared when the board changes.
+        self.row_contexts = {}
+        self.legal_moves = None
+
+        # Map each row to the locations on it and the column index for each location.
+        board = self.game.board
+        self.rows = board.rows
+        self.columns = board.columns
+        self.locations_by_row = {}
+        self.row_by_location = {}
+        for location in range(1, board.geometry.squares + 1):
+            coordinates = board.location_to_coordinates(location)
+            self.locations_by_row.setdefault(coordinates["row"], []).append(
+                (location, coordinates["column"] - 1)
+            )
+            self.row_by_location[location] = coordinates["row"]
 
     def get_context_for_row(self, row_number):
         """Returns a dictionary of all of the information needed to draw one row on the board.
 
         Dictionary will have these keys:
-        row: integer, should be between 1 and 8
+        row: integer, should be between 1 and 8 (or the number of rows on larger boards)
         selected: column that is currently selected. Can be None.
-        pieces: an array up to 8 elements long. Can contain one of these strings.
+        pieces: an array up to 8 elements long (one per column). Can contain one of these strings.
             None - blank space
-            "red" - regular red piece
-            "red king" - kinged red piece
+            "white" - regular white piece
+            "white king" - kinged white piece
             "black" - regular black piece
             "black king" - kinged black piece
             "valid move" - Indicates the unit can move there
         """
+        context = self.row_contexts.get(row_number, None)
+        if context is not None:
+            return context
+
+        pieces = [None] * self.columns
+        selected = None
+        pieces_by_location = self.game.board.pieces_by_location
+        valid_move_ends = self.get_valid_move_ends()
+
+        for location, column_index in self.locations_by_row.get(row_number, []):
+            if location == self.selected_location:
+                selected = CheckerboardDisplay.COLUMN_NAMES[column_index]
+
+            checker = pieces_by_location.get(location, None)
+            if checker is not None:
+                piece_name = checker.get_color().lower()
+                if checker.is_king:
+                    piece_name += " king"
+                pieces[column_index] = piece_name
+            elif location in valid_move_ends:
+                pieces[column_index] = "valid move"
 
         context = {
             "row": row_number,
-            "selected": "h",
-            "pieces": ["red", None, "black", "valid move", "black king", "red king", None, "valid move", "red"],
+            "selected": selected,
+            "pieces": pieces,
         }
-
+        self.row_contexts[row_number] = context
         return context
 
+    def get_legal_moves(self):
+        """Returns the legal moves for the current turn, generating them at most once per position.
+        """
+        if self.legal_moves is None:
+            self.legal_moves = self.game.get_current_legal_moves()
+        return self.legal_moves
+
+    def get_valid_move_ends(self):
+        """Returns a set of locations the selected piece can move to.
+        """
+        if self.selected_location is None:
+            return set()
+
+        return set(
+            move["end"] for move in self.get_legal_moves() if move["start"] == self.selected_location
+        )
+
+    def get_rows_for_selection(self):
+        """Returns the rows showing the selected piece and where it can move.
+        """
+        if self.selected_location is None:
+            return set()
+
+        rows = set([self.row_by_location[self.selected_location]])
+        for location in self.get_valid_move_ends():
+            rows.add(self.row_by_location[location])
+        return rows
+
+    def select_location(self, location):
+        """Select the piece at the given location. Use None to clear the selection.
+        """
+        rows_to_clear = self.get_rows_for_selection()
+        self.selected_location = location
+        rows_to_clear |= self.get_rows_for_selection()
+        self.invalidate_rows(rows_to_clear)
+
+    def apply_move(self, move):
+        """Apply the move to the game and clear the selection.
+        Raises an IllegalMoveException if the move is not legal.
+        Returns the move that was applied.
+        """
+        applied_move = self.game.apply_move(move)
+
+        # Clear the rows with the old selection and every square the move touched.
+        rows_to_clear = self.get_rows_for_selection()
+        self.selected_location = None
+        self.legal_moves = None
+
+        touched_locations = [applied_move["start"], applied_move["end"]]
+        touched_locations += applied_move.get("jumps_over", [])
+        for location in touched_locations:
+            rows_to_clear.add(self.row_by_location[location])
+
+        self.invalidate_rows(rows_to_clear)
+        return applied_move
+
+    def invalidate_rows(self, rows=None):
+        """Forget the cached context for the given rows.
+        If rows is None, forget everything. Use this if the game was changed directly.
+        """
+        if rows is None:
+            self.row_contexts = {}
+            self.legal_moves = None
+            return
+
+        for row_number in rows:
+            self.row_contexts.pop(row_number, None)
+
 class CheckerboardDisplay(object):
     """Actually displays the checkerboard.
+
+    Each frame is rendered into a single buffer and written to the output in one call.
+    In diff mode, only the rows whose context changed since the last frame are repainted,
+    using ANSI escape codes to move the cursor to each row.
     """
+
+    # Column names, from left to right. Boards only use as many as they have columns.
+    COLUMN_NAMES = tuple(string.ascii_lowercase)
+
+    # Characters used to draw each type of piece.
+    PIECE_TO_CHARACTER = {
+        "red":"r",
+        "red king":"R",
+        "black":"b",
+        "black king":"B",
+        "white":"w",
+        "white king":"W",
+        "valid move": "!",
+    }
+
+    # ANSI escape codes used in diff mode.
+    CLEAR_SCREEN = "\x1b[H\x1b[2J"
+    MOVE_CURSOR = "\x1b[{line};1H"
+    CLEAR_TO_END_OF_LINE = "\x1b[K"
+
     def __init__(self, *args, **kwargs):
         super().__init__()
 
         self.board_state = kwargs.get("board_state", None)
 
+        # Boards are 8x8 unless the board state says otherwise.
+        self.rows = getattr(self.board_state, "rows", 8)
+        self.columns = getattr(self.board_state, "columns", 8)
+        self.row_label_width = len(str(self.rows))
+
+        # Where to write each frame. Defaults to the console.
+        self.output = kwargs.get("output", None) or sys.stdout
+
+        # If True, only repaint the rows that changed since the last frame.
+        self.diff_mode = kwargs.get("diff_mode", False)
+
+        # Remembers the contexts used to draw the last frame, ordered by screen line.
+        self.previous_row_contexts = None
+
+        # If True, record how long each frame took to draw and how many bytes it wrote.
+        self.record_frames = kwargs.get("record_frames", False)
+        self.frame_times = []
+        self.frame_sizes = []
+
     def draw_board(self):
         """Draw the given board.
         """
+        if not self.record_frames:
+            frame = self.render_frame()
+            self.output.write(frame)
+            self.output.flush()
+            return frame
+
+        start_time = time.perf_counter()
+        frame = self.render_frame()
+        self.output.write(frame)
+        self.output.flush()
+        self.frame_times.append(time.perf_counter() - start_time)
+        self.frame_sizes.append(len(frame.encode("utf-8")))
+        return frame
+
+    def render_frame(self):
+        """Returns the string needed to draw the next frame.
+        In diff mode, this only includes the rows that changed since the last frame.
+        """
+        # Rows start from 8 on black's side, 1 on the white's side
+        row_contexts = []
+        for row_number in range(self.rows,0,-1):
+            # If there is no board, there is no context.
+            context = None
+            if self.board_state:
+                context = self.board_state.get_context_for_row(row_number)
+            row_contexts.append((row_number, context))
+
+        if not self.diff_mode:
+            return self.render_full_frame(row_contexts)
 
-        # Print column names
-        self.draw_column_names()
+        # The first frame clears the screen and draws everything.
+        if self.previous_row_contexts is None:
+            self.previous_row_contexts = row_contexts
+            return self.CLEAR_SCREEN + self.render_full_frame(row_contexts)
 
-        # Rows start from 8 on white's side, 1 on the black's side
-        for row_number in range(8,0,-1):
-            # If there is no board, just print the row number
-            if not self.board_state:
-                print (row_number)
+        # Only draw the rows that changed. The column names take up the first line.
+        frame_buffer = []
+        for line_index, (row_number, context) in enumerate(row_contexts):
+            if context == self.previous_row_contexts[line_index][1]:
                 continue
 
-            # Ask for the context from the board state.
-            context = self.board_state.get_context_for_row(row_number)
-
-            # Add the row number.
-            row_display_buffer = "{row_number} ".format(row_number=row_number)
-
-            # For each column,
-            for column_index in range(0, 8):
-                column_index_to_name = {
-                    0: 'a',
-                    1: 'b',
-                    2: 'c',
-                    3: 'd',
-                    4: 'e',
-                    5: 'f',
-                    6: 'g',
-                    7: 'h',
-                }
-
-                column_name = column_index_to_name[column_index]
-                prev_column_name = column_index_to_name.get(column_index - 1, None)
-                column_border_shape = "|"
-                # Get the border shape based on whether this column was selected.
-                if context["selected"] == column_name:
-                    column_border_shape = "*"
-                elif prev_column_name and context["selected"] == prev_column_name:
-                    # We will also have to draw the left side of this column if the previous column was selected.
-                    column_border_shape = "*"
-
-                # Get the piece image based on the piece type.
-                piece_to_character = {
-                    "red":"r",
-                    "red king":"R",
-                    "black":"b",
-                    "black king":"B",
-                    "valid move": "!",
-                }
-
-                piece_graphic = " "
-                if len(context["pieces"]) > column_index:
-                    piece_graphic = piece_to_character.get(context["pieces"][column_index], " ")
-
-                column_string = "{border} {piece_graphic} ".format(
-                    border = column_border_shape,
-                    piece_graphic = piece_graphic
-                )
-
-                row_display_buffer += column_string
-
-                # If this is the final column, print the right side as well.
-                if column_index == 7:
-                    # Get the border shape based on whether this column was selected.
-                    if context["selected"] == column_name:
-                        row_display_buffer += '*'
-                    else:
-                        row_display_buffer += '|'
-
-
-            # Now, print the string.
-            print (row_display_buffer)
+            frame_buffer.append(self.MOVE_CURSOR.format(line=line_index + 2))
+            frame_buffer.append(self.render_row(row_number, context))
+            frame_buffer.append(self.CLEAR_TO_END_OF_LINE)
+
+        # Put the cursor back underneath the board.
+        if frame_buffer:
+            frame_buffer.append(self.MOVE_CURSOR.format(line=len(row_contexts) + 2))
+
+        self.previous_row_contexts = row_contexts
+        return "".join(frame_buffer)
+
+    def render_full_frame(self, row_contexts):
+        """Returns the string that draws the column names and every row.
+        """
+        frame_buffer = [self.render_column_names()]
+        for row_number, context in row_contexts:
+            frame_buffer.append(self.render_row(row_number, context))
+
+        return "\n".join(frame_buffer) + "\n"
+
+    def render_row(self, row_number, context):
+        """Returns the string that draws a single row.
+        If there is no context, just return the row number.
+        """
+        if context is None:
+            return str(row_number)
+
+        # Add the row number.
+        row_display_buffer = ["{row_number:>{width}} ".format(row_number=row_number, width=self.row_label_width)]
+
+        selected = context["selected"]
+        pieces = context["pieces"]
+        prev_column_name = None
+
+        # For each column,
+        for column_index, column_name in enumerate(self.COLUMN_NAMES[:self.columns]):
+            column_border_shape = "|"
+            # Get the border shape based on whether this column was selected.
+            if selected == column_name:
+                column_border_shape = "*"
+            elif prev_column_name and selected == prev_column_name:
+                # We will also have to draw the left side of this column if the previous column was selected.
+                column_border_shape = "*"
+
+            # Get the piece image based on the piece type.
+            piece_graphic = " "
+            if len(pieces) > column_index:
+                piece_graphic = self.PIECE_TO_CHARACTER.get(pieces[column_index], " ")
+
+            row_display_buffer.append(column_border_shape)
+            row_display_buffer.append(" ")
+            row_display_buffer.append(piece_graphic)
+            row_display_buffer.append(" ")
+
+            prev_column_name = column_name
+
+        # Print the right side as well. Get the border shape based on whether the final column was selected.
+        if selected == prev_column_name:
+            row_display_buffer.append('*')
+        else:
+            row_display_buffer.append('|')
+
+        return "".join(row_display_buffer)
+
+    def render_column_names(self):
+        return " " * (self.row_label_width + 3) + "   ".join(self.COLUMN_NAMES[:self.columns]) + " "
 
     def draw_column_names(self):
-        print ("    a   b   c   d   e   f   g   h ")
+        self.output.write(self.render_column_names() + "\n")
+        self.output.flush()
 
-if __name__ == '__main__':
-    #keyboard_input = input("What is this?")
-    #print ("I'm just echoing what you said: {echo}".format(echo=keyboard_input))
+def percentile(sorted_values, fraction):
+    """Returns the value at the given fraction (0 to 1) of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_render_benchmark(games=20, max_plies=80, diff_mode=False, seed=0):
+    """Replay scripted games and render every frame to memory instead of the console.
+    Each ply draws two frames: one after selecting the piece, one after moving it.
+    Returns a dict with frames per second, bytes per frame and the p50/p99 frame times in milliseconds.
+    """
+    # The replay is seeded so every run draws the same frames.
+    move_picker = random.Random(seed)
+    frame_times = []
+    frame_sizes = []
+
+    for game_number in range(games):
+        board_state = CheckerboardState()
+        checkerboard_display = CheckerboardDisplay(
+            board_state = board_state,
+            output = io.StringIO(),
+            diff_mode = diff_mode,
+            record_frames = True,
+        )
+        checkerboard_display.draw_board()
+
+        for ply in range(max_plies):
+            legal_moves = board_state.get_legal_moves()
+            if not legal_moves:
+                break
+            move = move_picker.choice(legal_moves)
 
-    checkerboard_state = CheckerboardState()
+            board_state.select_location(move["start"])
+            checkerboard_display.draw_board()
 
-    checkerboard_display = CheckerboardDisplay(
-        board_state = checkerboard_state
+            board_state.apply_move(move)
+            checkerboard_display.draw_board()
+
+            # Don't let the in-memory sink grow forever.
+            checkerboard_display.output.seek(0)
+            checkerboard_display.output.truncate()
+
+        frame_times += checkerboard_display.frame_times
+        frame_sizes += checkerboard_display.frame_sizes
+
+    total_time = sum(frame_times)
+    sorted_times = sorted(frame_times)
+    return {
+        "diff_mode": diff_mode,
+        "frames": len(frame_times),
+        "frames_per_second": len(frame_times) / total_time if total_time else 0.0,
+        "bytes_per_frame": sum(frame_sizes) / len(frame_sizes) if frame_sizes else 0.0,
+        "p50_frame_ms": percentile(sorted_times, 0.50) * 1000,
+        "p99_frame_ms": percentile(sorted_times, 0.99) * 1000,
+    }
+
+def print_render_benchmark(results):
+    print ("Rendering benchmark ({mode} mode)".format(mode="diff" if results["diff_mode"] else "full"))
+    print ("  frames:           {frames}".format(**results))
+    print ("  frames/second:    {frames_per_second:.1f}".format(**results))
+    print ("  bytes/frame:      {bytes_per_frame:.1f}".format(**results))
+    print ("  p50 frame time:   {p50_frame_ms:.3f} ms".format(**results))
+    print ("  p99 frame time:   {p99_frame_ms:.3f} ms".format(**results))
+
+def read_games(lines):
+    """Group lines of moves into games. A blank line separates games.
+    Lines starting with # are comments.
+    Yields lists of (line number, move string) tuples.
+    """
+    game_lines = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line.startswith("#"):
+            continue
+        if not line:
+            if game_lines:
+                yield game_lines
+            game_lines = []
+            continue
+        game_lines.append((line_number, line))
+
+    if game_lines:
+        yield game_lines
+
+def replay_game(game_lines, size=8, flying_kings=False):
+    """Parse and apply every move to a new CheckerGame.
+    Returns the game and an error message, or None if every move was legal.
+    """
+    game = CheckerGame(size=size, flying_kings=flying_kings)
+    for line_number, move_string in game_lines:
+        try:
+            game.apply_move(TextInput.parse_move(move_string, size))
+        except InvalidMoveException:
+            return game, "line {line}: cannot parse move {move}".format(line=line_number, move=move_string)
+        except IllegalMoveException:
+            return game, "line {line}: illegal move {move}".format(line=line_number, move=move_string)
+
+    return game, None
+
+def summarize_game(game_number, game, error):
+    """Returns a one line description of the game.
+    """
+    counts = {
+        "White": [0, 0],
+        "Black": [0, 0],
+    }
+    for checker in game.board.pieces_by_location.values():
+        counts[checker.get_color()][0] += 1
+        if checker.is_king:
+            counts[checker.get_color()][1] += 1
+
+    summary = "game {number}: {plies} plies, {turn} to move, White {white} ({white_kings} kings), Black {black} ({black_kings} kings)".format(
+        number = game_number,
+        plies = game.get_ply_count(),
+        turn = game.get_current_turn(),
+        white = counts["White"][0],
+        white_kings = counts["White"][1],
+        black = counts["Black"][0],
+        black_kings = counts["Black"][1],
     )
-    checkerboard_display.draw_board()
+    result = game.get_result()
+    if result:
+        summary += ", result {result}".format(result=result)
+    if error:
+        summary += ", ERROR {error}".format(error=error)
+    return summary
+
+def run_batch(lines, summary_only=False, output=None, size=8, flying_kings=False, store=None):
+    """Replay every game in the lines without prompting or redrawing between moves.
+    Prints a summary or the final board for each game.
+    If store is a PositionStore, every position in every game is added to it.
+    Returns the number of games that had an invalid or illegal move.
+    """
+    output = output or sys.stdout
+    failed_games = 0
+
+    for game_number, game_lines in enumerate(read_games(lines), 1):
+        game, error = replay_game(game_lines, size=size, flying_kings=flying_kings)
+        if error:
+            failed_games += 1
+        if store is not None:
+            store.add_game(game)
+
+        output.write(summarize_game(game_number, game, error) + "\n")
+        if not summary_only:
+            CheckerboardDisplay(
+                board_state = CheckerboardState(game=game),
+                output = output,
+            ).draw_board()
+
+    output.flush()
+    return failed_games
+
+def solve_position(position_line, size=8, flying_kings=False, max_nodes=1000000, max_plies=None):
+    """Try to prove the player to move can force a win in the position, given as FEN or JSON.
+    Returns a dict with the result, the winning line as move strings and the number of nodes searched.
+    Raises a InvalidPositionException if the position can't be read.
+    """
+    position = parse_position_line(position_line, size)
+    game = CheckerGame(size=size, flying_kings=flying_kings)
+    try:
+        game.set_position(position["pieces"], position["turn"])
+    except (KeyError, TypeError) as error:
+        raise InvalidPositionException("Position is invalid, {error}".format(error=error))
+
+    solution = ProofNumberSearch(max_nodes=max_nodes, max_plies=max_plies).solve(game)
+    solution["line"] = [TextOutput.format_move(move) for move in solution["line"]]
+    return solution
+
+class TerminalClient(object):
+    """Plays a game in the terminal without ever waiting on the keyboard.
+
+    Everything runs on one asyncio event loop. Typed lines arrive through a reader on stdin, the clocks tick,
+    the engine searches in a worker thread and posts its evaluation after every depth, and spectators
+    are sent each move, all while the player is typing. The engine's thread runs one job at a time,
+    so a search that was stopped always ends before the next one starts. The board is drawn in diff mode, with a status area
+    under it. Every redraw saves and restores the cursor, so it never disturbs the line being typed.
+
+    Commands:
+    a move, like 11-15 or 22x15x8
+    a location, like 22 or c3, to select a piece and show where it can move
+    undo                         takes back the last move, or the last two against the engine
+    quit
+
+    Options:
+    board_state: the CheckerboardState to play in.
+    display: a CheckerboardDisplay in diff mode for the board state.
+    engine_color: "White" or "Black" for the engine to play that side, or None for two players.
+    searcher: the AlphaBetaSearch the engine uses.
+    engine_seconds: the most seconds the engine thinks about each move.
+    clock_seconds: each player's time for the game, or None for no clocks.
+    increment: seconds added to a player's clock after each of their moves.
+    ponderer: a Ponderer, to think on the player's time, with a searcher of its own. It is only used from the engine's thread.
+    broadcast: a SpectatorBroadcast following the game, closed when the client ends.
+    input: where to read commands. Defaults to stdin.
+    """
+    PROMPT = "> "
+
+    # Lines between the board and the prompt: the clocks, the engine's evaluation and the last message.
+    STATUS_LINES = 3
+
+    SAVE_CURSOR = "\x1b7"
+    RESTORE_CURSOR = "\x1b8"
+
+    # Seconds between clock updates.
+    TICK_SECONDS = 0.1
+
+    def __init__(self, *args, **kwargs):
+        self.board_state = kwargs.get("board_state", None) or CheckerboardState()
+        self.display = kwargs.get("display", None) or CheckerboardDisplay(board_state=self.board_state, diff_mode=True)
+        self.game = self.board_state.game
+        self.engine_color = kwargs.get("engine_color", None)
+        self.searcher = kwargs.get("searcher", None) or AlphaBetaSearch()
+        self.engine_seconds = kwargs.get("engine_seconds", 2.0)
+        self.increment = kwargs.get("increment", 0)
+        self.ponderer = kwargs.get("ponderer", None)
+        self.broadcast = kwargs.get("broadcast", None)
+        self.input = kwargs.get("input", None) or sys.stdin
+        self.output = self.display.output
+
+        clock_seconds = kwargs.get("clock_seconds", None)
+        self.clocks = None
+        if clock_seconds is not None:
+            self.clocks = {"White": float(clock_seconds), "Black": float(clock_seconds)}
+
+        self.loop = None
+        self.lines = None
+        self.input_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.input_buffer = ""
+        self.reader_fd = None
+        self.reader_task = None
+
+        self.engine_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.engine_task = None
+        self.turn_started = None
+        self.flagged_color = None
+        self.evaluation = ""
+        self.message = ""
+        self.last_status = None
+        self.finished = False
+
+    def get_remaining_seconds(self, color):
+        """Returns the time left on the color's clock, counting the turn in progress.
+        """
+        remaining = self.clocks[color]
+        if color == self.game.get_current_turn() and self.turn_started is not None:
+            remaining -= self.loop.time() - self.turn_started
+        return max(0.0, remaining)
+
+    def get_result(self):
+        """Returns "White", "Black" or "Draw" once the game is over, otherwise None.
+        """
+        if self.flagged_color is not None:
+            return self.game.get_opponent(self.flagged_color)
+        return self.game.get_result()
+
+    def is_engine_turn(self):
+        return self.engine_color == self.game.get_current_turn() and self.get_result() is None
+
+    def render_status(self):
+        """Returns the lines of the status area.
+        """
+        turn = self.game.get_current_turn()
+        result = self.get_result()
+        if result == "Draw":
+            state = "Draw"
+        elif result is not None:
+            state = "{result} wins".format(result=result)
+            if self.flagged_color is not None:
+                state += " on time"
+        else:
+            state = "{turn} to move".format(turn=turn)
+
+        if self.clocks is not None:
+            clocks = "White {white}  Black {black}  ".format(
+                white = format_clock(self.get_remaining_seconds("White")),
+                black = format_clock(self.get_remaining_seconds("Black")),
+            )
+        else:
+            clocks = ""
+        return [clocks + state, self.evaluation, self.message]
+
+    def redraw(self, board=True):
+        """Repaint whatever changed on the board and in the status area, then put the cursor back.
+        """
+        status = self.render_status()
+        if not board and status == self.last_status:
+            return
+
+        first_status_line = self.display.rows + 2
+        frame_buffer = [self.SAVE_CURSOR]
+        if board:
+            frame_buffer.append(self.display.render_frame())
+        for index, line in enumerate(status):
+            if self.last_status is not None and line == self.last_status[index]:
+                continue
+            frame_buffer.append(CheckerboardDisplay.MOVE_CURSOR.format(line=first_status_line + index))
+            frame_buffer.append(line)
+            frame_buffer.append(CheckerboardDisplay.CLEAR_TO_END_OF_LINE)
+        frame_buffer.append(self.RESTORE_CURSOR)
+
+        self.last_status = status
+        self.output.write("".join(frame_buffer))
+        self.output.flush()
+
+    def draw_prompt(self):
+        """Clear the prompt line after a line was entered, and leave the cursor after the prompt.
+        """
+        self.output.write(
+            CheckerboardDisplay.MOVE_CURSOR.format(line=self.display.rows + 2 + self.STATUS_LINES)
+            + CheckerboardDisplay.CLEAR_TO_END_OF_LINE
+            + self.PROMPT
+        )
+        self.output.flush()
+
+    def start_reading(self):
+        """Deliver typed lines to the lines queue, without blocking the event loop.
+        Where stdin can't be watched by the loop (on Windows, or when it is a file), a thread reads it instead.
+        None is queued at the end of the input.
+        """
+        try:
+            fd = self.input.fileno()
+            self.loop.add_reader(fd, self.read_input, fd)
+            self.reader_fd = fd
+        except (AttributeError, OSError, ValueError, NotImplementedError):
+            self.reader_task = asyncio.ensure_future(self.read_input_in_thread())
+
+    def read_input(self, fd):
+        """Reader callback: take whatever has been typed and queue each whole line.
+        """
+        data = os.read(fd, 4096)
+        if not data:
+            self.stop_reading()
+            if self.input_buffer:
+                self.lines.put_nowait(self.input_buffer)
+            self.lines.put_nowait(None)
+            return
+
+        self.input_buffer += self.input_decoder.decode(data)
+        *lines, self.input_buffer = self.input_buffer.split("\n")
+        for line in lines:
+            self.lines.put_nowait(line)
+
+    async def read_input_in_thread(self):
+        while True:
+            line = await self.loop.run_in_executor(None, self.input.readline)
+            if not line:
+                self.lines.put_nowait(None)
+                return
+            self.lines.put_nowait(line.rstrip("\n"))
+
+    def stop_reading(self):
+        if self.reader_fd is not None:
+            self.loop.remove_reader(self.reader_fd)
+            self.reader_fd = None
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+
+    async def tick_clocks(self):
+        """Update the clocks on screen, and end the game when one runs out.
+        """
+        while True:
+            await asyncio.sleep(self.TICK_SECONDS)
+            if self.get_result() is not None:
+                continue
+
+            color = self.game.get_current_turn()
+            if self.get_remaining_seconds(color) <= 0:
+                self.flagged_color = color
+                self.stop_engine()
+                self.cancel_pondering()
+            self.redraw(board=False)
+
+    async def run(self):
+        """Play until the player quits or the input ends.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.lines = asyncio.Queue()
+        self.start_reading()
+        if self.clocks is not None:
+            self.turn_started = self.loop.time()
+
+        self.redraw()
+        self.draw_prompt()
+        ticker = asyncio.ensure_future(self.tick_clocks()) if self.clocks is not None else None
+        try:
+            while not self.finished:
+                self.start_engine_if_needed()
+                line = await self.lines.get()
+                if line is None:
+                    break
+                self.handle_line(line.strip())
+                self.redraw()
+                self.draw_prompt()
+        finally:
+            self.finished = True
+            self.stop_reading()
+            self.stop_engine()
+            if ticker is not None:
+                ticker.cancel()
+            if self.ponderer is not None:
+                await self.loop.run_in_executor(self.engine_executor, self.ponderer.cancel)
+            self.engine_executor.shutdown(wait=False)
+            if self.broadcast is not None:
+                await self.broadcast.close()
+            self.output.write("\n")
+            self.output.flush()
+
+    def handle_line(self, line):
+        """Run one typed command.
+        """
+        self.message = ""
+        if not line:
+            return
+        if line in ("quit", "exit"):
+            self.finished = True
+            return
+        if line == "undo":
+            self.undo()
+            return
+        if self.get_result() is not None:
+            self.message = "The game is over. Type undo or quit."
+            return
+        if self.is_engine_turn():
+            self.message = "Wait for the engine to move."
+            return
+
+        size = self.game.board.geometry.size
+        if not "-" in line and not "x" in line.lower():
+            try:
+                self.board_state.select_location(TextInput.parse_position(line, size))
+            except InvalidLocationException:
+                self.message = "Not a location or a move: {line}".format(line=line)
+            return
+
+        try:
+            self.apply_move(TextInput.parse_move(line, size))
+        except InvalidMoveException:
+            self.message = "Not a move: {line}".format(line=line)
+        except IllegalMoveException:
+            self.message = "Illegal move: {line}".format(line=line)
+
+    def apply_move(self, move):
+        """Play a move, then charge its time to the player's clock.
+        Raises an IllegalMoveException if the move is not legal.
+        """
+        color = self.game.get_current_turn()
+        remaining = self.get_remaining_seconds(color) if self.clocks is not None else None
+        applied_move = self.board_state.apply_move(move)
+        if self.clocks is not None:
+            self.clocks[color] = remaining + self.increment
+            self.turn_started = self.loop.time()
+        return applied_move
+
+    def undo(self):
+        """Take back the last move, or the last move on each side against the engine.
+        """
+        self.stop_engine()
+        self.cancel_pondering()
+
+        plies = 1
+        if self.engine_color is not None and self.game.get_current_turn() != self.engine_color:
+            plies = 2
+        if self.game.takeback(plies) == 0:
+            self.message = "There is nothing to undo."
+            return
+
+        self.flagged_color = None
+        if self.clocks is not None:
+            self.turn_started = self.loop.time()
+        self.board_state.invalidate_rows()
+
+    def start_engine_if_needed(self):
+        if self.engine_task is None and self.is_engine_turn():
+            self.engine_task = asyncio.ensure_future(self.play_engine_move())
+
+    def stop_engine(self):
+        """Stop the engine's search. A move it finds afterwards is thrown away.
+        """
+        if self.engine_task is not None:
+            self.searcher.stop()
+            if self.ponderer is not None:
+                self.ponderer.searcher.stop()
+            self.engine_task.cancel()
+            self.engine_task = None
+
+    def cancel_pondering(self):
+        if self.ponderer is not None:
+            self.engine_executor.submit(self.ponderer.cancel)
+
+    def get_engine_seconds(self):
+        """Returns how long the engine should think, leaving plenty of its clock for later moves.
+        """
+        seconds = self.engine_seconds
+        if self.clocks is not None:
+            remaining = self.get_remaining_seconds(self.engine_color)
+            seconds = min(seconds, remaining / 20 + self.increment * 0.8)
+        return max(0.01, seconds)
+
+    def post_evaluation(self, result):
+        """Search callback, from the engine's thread: show the evaluation on the event loop.
+        """
+        self.loop.call_soon_threadsafe(self.show_evaluation, result)
+
+    def show_evaluation(self, result):
+        # A search stopped at the end can still report after the client is done drawing.
+        if self.finished:
+            return
+        self.evaluation = "Engine: depth {depth} score {score} pv {pv}".format(
+            depth = result["depth"],
+            score = result["score"],
+            pv = " ".join(TextOutput.format_move(move) for move in result["pv"]),
+        )
+        self.redraw(board=False)
+
+    def think(self, game, last_move, seconds):
+        """Runs on the engine's thread. Returns the search result for the game.
+        If the ponderer guessed the last move, its search is used instead of starting over.
+        """
+        result = None
+        if self.ponderer is not None and last_move is not None:
+            result = self.ponderer.hit(last_move, seconds=seconds)
+        if result is None:
+            result = self.searcher.search(game, seconds=seconds, on_iteration=self.post_evaluation)
+        return result
+
+    async def play_engine_move(self):
+        """Find and play the engine's move, without holding up the event loop.
+        """
+        ply_count = self.game.get_ply_count()
+        last_move = self.game.history.get_move(ply_count - 1) if ply_count > 0 else None
+        try:
+            result = await self.loop.run_in_executor(
+                self.engine_executor,
+                functools.partial(self.think, self.game.copy(), last_move, self.get_engine_seconds()),
+            )
+        except asyncio.CancelledError:
+            return
+
+        # The game may have changed while the engine was thinking.
+        self.engine_task = None
+        if result is None or self.game.get_ply_count() != ply_count or self.get_result() is not None:
+            return
+
+        self.show_evaluation(result)
+        self.apply_move(result["move"])
+        if self.ponderer is not None and len(result["pv"]) > 1 and self.get_result() is None:
+            self.engine_executor.submit(self.ponderer.start, self.game.copy(), result["pv"][1])
+        self.redraw()
+
+def format_clock(seconds):
+    """Returns the seconds as minutes and seconds, with tenths under ten seconds.
+    """
+    if seconds < 10:
+        return "{seconds:.1f}".format(seconds=seconds)
+    seconds = int(seconds)
+    return "{minutes}:{seconds:02d}".format(minutes=seconds // 60, seconds=seconds % 60)
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Play checkers in the terminal.")
+    parser.add_argument("--diff", action="store_true", help="Only repaint the rows that changed.")
+    parser.add_argument("--benchmark", action="store_true", help="Render scripted games to memory and report frame statistics.")
+    parser.add_argument("--games", type=int, default=20, help="Number of games to replay in benchmark mode.")
+    parser.add_argument("--plies", type=int, default=80, help="Maximum number of plies per benchmark game.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the benchmark's scripted moves.")
+    parser.add_argument("--moves", metavar="FILE", help="Replay moves from a file, one per line. Use - for stdin. Blank lines separate games.")
+    parser.add_argument("--summary", action="store_true", help="With --moves, only print a summary of each game.")
+    parser.add_argument("--store", metavar="DATABASE", help="With --moves, count every position of every game in this SQLite file.")
+    parser.add_argument("--size", type=int, default=8, help="Number of rows and columns on the board.")
+    parser.add_argument("--flying-kings", action="store_true", help="Kings move and jump any distance along a diagonal.")
+    parser.add_argument("--analyze", metavar="FILE", help="Analyze positions from a file, one FEN or JSON board per line. Use - for stdin. Writes JSON lines.")
+    parser.add_argument("--depth", type=int, default=None, help="With --analyze, search this many plies deep.")
+    parser.add_argument("--movetime", type=float, default=None, help="With --analyze, search each position for this many seconds. When playing, the most the engine thinks per move.")
+    parser.add_argument("--workers", type=int, default=1, help="With --analyze, number of worker processes.")
+    parser.add_argument("--engine", action="store_true", help="Run as an engine process, reading protocol commands from stdin.")
+    parser.add_argument("--solve", metavar="POSITION", help="Prove or disprove a forced win for the player to move, given as FEN or JSON.")
+    parser.add_argument("--max-nodes", type=int, default=1000000, help="With --solve, give up once the proof tree holds this many nodes.")
+    parser.add_argument("--max-plies", type=int, default=None, help="With --solve, only look for wins within this many plies.")
+    parser.add_argument("--engine-color", choices=["white", "black"], default=None, help="When playing, let the engine play this side.")
+    parser.add_argument("--clock", type=float, default=None, help="When playing, give each side this many seconds for the game.")
+    parser.add_argument("--increment", type=float, default=0, help="With --clock, seconds added after each move.")
+    parser.add_argument("--ponder", action="store_true", help="When playing, let the engine think on your time.")
+    parser.add_argument("--spectator-port", type=int, default=None, help="When playing, let spectators watch the game on this port.")
+    return parser.parse_args(arguments)
+
+async def play_in_terminal(arguments):
+    """Play a game against another player or the engine, with the options from the command line.
+    """
+    # Drawing, validating and hinting all ask for the same position's moves.
+    game = CheckerGame(size=arguments.size, flying_kings=arguments.flying_kings, move_cache=MoveCache())
+    board_state = CheckerboardState(game=game)
+    searcher = AlphaBetaSearch()
+
+    broadcast = None
+    if arguments.spectator_port is not None:
+        broadcast = SpectatorBroadcast(game)
+        await broadcast.start_server(port=arguments.spectator_port)
+
+    engine_color = arguments.engine_color.capitalize() if arguments.engine_color else None
+    client = TerminalClient(
+        board_state = board_state,
+        display = CheckerboardDisplay(board_state=board_state, diff_mode=True),
+        engine_color = engine_color,
+        searcher = searcher,
+        engine_seconds = arguments.movetime or 2.0,
+        clock_seconds = arguments.clock,
+        increment = arguments.increment,
+        # The ponderer merges tables into its searcher on a hit, so it gets its own.
+        ponderer = Ponderer(searcher=AlphaBetaSearch()) if arguments.ponder and engine_color else None,
+        broadcast = broadcast,
+    )
+    await client.run()
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+
+    if arguments.benchmark:
+        print_render_benchmark(
+            run_render_benchmark(
+                games = arguments.games,
+                max_plies = arguments.plies,
+                diff_mode = arguments.diff,
+                seed = arguments.seed,
+            )
+        )
+        sys.exit(0)
+
+    if arguments.moves:
+        batch_options = {
+            "summary_only": arguments.summary,
+            "size": arguments.size,
+            "flying_kings": arguments.flying_kings,
+            "store": PositionStore(arguments.store) if arguments.store else None,
+        }
+        try:
+            if arguments.moves == "-":
+                failed_games = run_batch(sys.stdin, **batch_options)
+            else:
+                with open(arguments.moves) as move_file:
+                    failed_games = run_batch(move_file, **batch_options)
+        finally:
+            if batch_options["store"] is not None:
+                batch_options["store"].close()
+        sys.exit(1 if failed_games else 0)
+
+    if arguments.analyze:
+        analysis_options = {
+            "output": sys.stdout,
+            "depth": arguments.depth,
+            "seconds": arguments.movetime,
+            "workers": arguments.workers,
+            "size": arguments.size,
+            "flying_kings": arguments.flying_kings,
+        }
+        if arguments.analyze == "-":
+            failed_positions = analyze_positions(sys.stdin, **analysis_options)
+        else:
+            with open(arguments.analyze) as position_file:
+                failed_positions = analyze_positions(position_file, **analysis_options)
+        sys.exit(1 if failed_positions else 0)
+
+    if arguments.engine:
+        EngineProtocol(size=arguments.size, flying_kings=arguments.flying_kings).run()
+        sys.exit(0)
+
+    if arguments.solve:
+        try:
+            solution = solve_position(
+                arguments.solve,
+                size = arguments.size,
+                flying_kings = arguments.flying_kings,
+                max_nodes = arguments.max_nodes,
+                max_plies = arguments.max_plies,
+            )
+        except InvalidPositionException as error:
+            print (error)
+            sys.exit(2)
+        print (json.dumps(solution))
+        sys.exit(0 if solution["result"] == "win" else 1)
+
+    asyncio.run(play_in_terminal(arguments))
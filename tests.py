@@ -1,12 +1,65 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from unittest import TestCase
+from unittest import skipIf
 from unittest.mock import MagicMock
 
 from texthandling.input import TextInput
 from texthandling.input import InvalidLocationException
+from texthandling.input import InvalidMoveException
+from texthandling.input import InvalidPositionException
+from texthandling.output import TextOutput
 
 from components.checkerboard import Checker
 from components.checkerboard import Checkerboard
 from components.checkerboard import CheckerGame
+from components.checkerboard import IllegalMoveException
+from components.broadcast import SpectatorBroadcast
+from components.broadcast import read_frame
+from components.instrumentation import Instrumentation
+from components.journal import GameJournal
+from components.memory import get_deep_size
+from components.memory import get_game_memory
+from components.memory import get_search_memory
+from components.memory import measure_allocations
+from components.movecache import MoveCache
+from components.positionstore import PositionStore
+from components.symmetry import canonicalize
+from components.symmetry import flip_move
+from components.symmetry import get_canonical_hash
+from components.symmetry import get_flip_table
+from components.symmetry import pack_canonical_board
+
+from benchmarks import find_regressions
+from benchmarks import load_baseline
+from benchmarks import load_terminal_module
+from benchmarks import main as run_benchmark_main
+from benchmarks import save_baseline
+
+from engine.analysis import analyze_positions
+from engine.mcts import MonteCarloTreeSearch
+from engine.ponder import Ponderer
+from engine.protocol import EngineProtocol
+from engine.search import AlphaBetaSearch
+from engine.solver import ProofNumberSearch
+
+# NumPy is only needed for batched playouts.
+try:
+    import numpy
+    from engine.batch import BatchPlayout
+except ImportError:
+    numpy = None
+
+terminal_checkers = load_terminal_module()
 
 class TextInputTest(TestCase):
     """Confirm you can interpret and understand text commands.
@@ -88,6 +141,74 @@ class TextInputTest(TestCase):
                     )
                 )
 
+    def test_parse_move(self):
+        """Confirm you understand simple moves and jumps.
+        """
+        self.assertEqual(TextInput.parse_move("11-15"), {"start": 11, "end": 15})
+        self.assertEqual(TextInput.parse_move("a1-b2"), {"start": 29, "end": 25})
+        self.assertEqual(
+            TextInput.parse_move("22x15X8"),
+            {"start": 22, "end": 8, "lands": [15, 8]}
+        )
+
+        for string_move in ["", "11", "11-15-18", "11-z9", "33-28", "x"]:
+            exception_raised = False
+            try:
+                TextInput.parse_move(string_move)
+            except InvalidMoveException:
+                exception_raised = True
+            self.assertTrue(exception_raised, "InvalidMoveException was not raised while testing: {move}".format(move=string_move))
+
+    def test_parse_moves(self):
+        """Confirm you can parse a list of moves at once.
+        """
+        moves = TextInput.parse_moves(["11-15", "C3-d4", "22x15x8"])
+        self.assertEqual(
+            moves,
+            [
+                {"start": 11, "end": 15},
+                {"start": 22, "end": 18},
+                {"start": 22, "end": 8, "lands": [15, 8]},
+            ]
+        )
+
+        exception_raised = False
+        try:
+            TextInput.parse_moves(["11-15", "11-99"])
+        except InvalidMoveException as exception:
+            exception_raised = True
+            self.assertTrue("Move 1" in str(exception))
+        self.assertTrue(exception_raised, "InvalidMoveException was not raised for 11-99")
+
+    def test_parse_fen(self):
+        """Confirm you can read a position in FEN, with kings and ranges.
+        """
+        position = TextInput.parse_fen('[FEN "B:W21,K30:BK1,2-4."]')
+        self.assertEqual(position["turn"], "Black")
+        self.assertEqual(
+            position["pieces"],
+            {
+                21: {"color": "white", "type": "man"},
+                30: {"color": "white", "type": "king"},
+                1: {"color": "black", "type": "king"},
+                2: {"color": "black", "type": "man"},
+                3: {"color": "black", "type": "man"},
+                4: {"color": "black", "type": "man"},
+            }
+        )
+
+        game = CheckerGame()
+        game.set_position(position["pieces"], position["turn"])
+        self.assertEqual(TextOutput.format_fen(game), "B:W21,K30:BK1,2,3,4")
+
+        for string_position in ["", "X:W21", "W:W21:B21", "W:W40", "W:Q21", "W:W12-1", "W:W1-2-3"]:
+            exception_raised = False
+            try:
+                TextInput.parse_fen(string_position)
+            except InvalidPositionException:
+                exception_raised = True
+            self.assertTrue(exception_raised, "InvalidPositionException was not raised while testing: {fen}".format(fen=string_position))
+
 class CheckerTest(TestCase):
     """Check the Checker's model and controller actions.
     """
@@ -335,6 +456,65 @@ class CheckerboardTest(TestCase):
         self.assertEqual(all_piece_locations[11]["color"], "White")
         self.assertEqual(all_piece_locations[11]["type"], "Man")
 
+class LargeCheckerboardTest(TestCase):
+    """Check boards larger than 8x8.
+    """
+    def setUp(self):
+        self.board = Checkerboard(size=10)
+
+    def test_dimensions(self):
+        """Confirm the board uses the given size.
+        """
+        self.assertEqual(self.board.columns, 10)
+        self.assertEqual(self.board.rows, 10)
+        self.assertEqual(self.board.geometry.squares, 50)
+
+    def test_checker_locations(self):
+        """Each side starts with 4 full rows.
+        """
+        all_piece_locations = self.board.get_all_pieces_by_location()
+        self.assertEqual(len(all_piece_locations), 40)
+
+        for loc in range(1, 20+1):
+            self.assertEqual(all_piece_locations[loc]["color"], "Black")
+        for loc in range(31, 50+1):
+            self.assertEqual(all_piece_locations[loc]["color"], "White")
+
+    def test_coordinates_round_trip(self):
+        """Locations and coordinates convert back and forth.
+        """
+        self.assertEqual(self.board.location_to_coordinates(1), {"row": 10, "column": 2})
+        self.assertEqual(self.board.location_to_coordinates(50), {"row": 1, "column": 9})
+
+        for loc in range(1, 50+1):
+            coords = self.board.location_to_coordinates(loc)
+            self.assertEqual(self.board.coordinates_to_location(coords), loc)
+
+        self.assertIsNone(self.board.coordinates_to_location({"row": 1, "column": 2}))
+        self.assertIsNone(self.board.coordinates_to_location({"row": 11, "column": 1}))
+
+    def test_opening_moves(self):
+        """White's front row has 9 moves at the start.
+        """
+        game = CheckerGame(size=10)
+        self.assertEqual(len(game.get_current_legal_moves()), 9)
+
+    def test_parse_location(self):
+        """Text input understands the larger board.
+        """
+        self.assertEqual(TextInput.parse_location("i1", size=10), {"row": 1, "column": 9, "position": 50})
+        self.assertEqual(TextInput.parse_location("B10", size=10), {"row": 10, "column": 2, "position": 1})
+        self.assertEqual(TextInput.parse_move("32-28", size=10), {"start": 32, "end": 28})
+        self.assertEqual(TextInput.parse_position(" i1 ", size=10), 50)
+        self.assertEqual(TextInput.parse_chess_position("i1", size=10), {"row": 1, "column": 9})
+
+        exception_raised = False
+        try:
+            TextInput.parse_location("50")
+        except InvalidLocationException:
+            exception_raised = True
+        self.assertTrue(exception_raised, "InvalidLocationException was not raised for 50 on an 8x8 board")
+
 class CheckerGameTest(TestCase):
     """Check the CheckerGame's model and controller actions.
     """
@@ -492,6 +672,431 @@ class CheckerGameTest(TestCase):
 
             # Both lists have the same contents.
 
+class ApplyMoveTests(TestCase):
+    """Confirm moves change the board, the turn and the move history.
+    """
+
+    def setUp(self):
+        self.game = CheckerGame()
+
+    def test_apply_simple_move(self):
+        """A simple move relocates the piece and ends the turn.
+        """
+        self.game.apply_move({"start": 22, "end": 18})
+
+        self.assertIsNone(self.game.board.get_piece(22))
+        self.assertEqual(self.game.board.get_piece(18)["color"], "White")
+        self.assertEqual(self.game.get_current_turn(), "Black")
+        self.assertEqual(self.game.get_move_history(), [{"start": 22, "end": 18}])
+
+    def test_illegal_move_raises(self):
+        """Illegal moves raise an exception and leave the game alone.
+        """
+        exception_raised = False
+        try:
+            self.game.apply_move({"start": 22, "end": 14})
+        except IllegalMoveException:
+            exception_raised = True
+        self.assertTrue(exception_raised, "IllegalMoveException was not raised while moving 22 to 14")
+
+        self.assertEqual(self.game.board.get_piece(22)["color"], "White")
+        self.assertEqual(self.game.get_current_turn(), "White")
+        self.assertEqual(self.game.get_move_history(), [])
+
+    def test_jump_captures_and_promotes(self):
+        """Jumping removes the jumped piece. Reaching the far row creates a king.
+        """
+        self.game.board.arrange_board({
+            11: {
+                "color": "white",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+
+        applied_move = self.game.apply_move({"start": 11, "end": 4, "lands": [4]})
+
+        self.assertEqual(applied_move["jumps_over"], [8])
+        self.assertIsNone(self.game.board.get_piece(8))
+        self.assertEqual(self.game.board.get_piece(4)["type"], "King")
+
+    def test_undo_move(self):
+        """Taking back a jump puts back the captured piece and the man that was promoted.
+        """
+        self.game.board.arrange_board({
+            11: {
+                "color": "white",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+        pieces_before = self.game.board.get_all_pieces_by_location()
+        hash_before = self.game.get_position_hash()
+
+        self.game.apply_move({"start": 11, "end": 4, "lands": [4]})
+        self.assertEqual(self.game.undo_move()["end"], 4)
+
+        self.assertEqual(self.game.board.get_all_pieces_by_location(), pieces_before)
+        self.assertEqual(self.game.get_position_hash(), hash_before)
+        self.assertEqual(self.game.board.locations_by_color, {"White": {11}, "Black": {8}})
+        self.assertEqual(self.game.get_current_turn(), "White")
+        self.assertEqual(self.game.get_move_history(), [])
+        self.assertIsNone(self.game.undo_move())
+
+    def test_move_type_must_match(self):
+        """A move written as a simple move never matches a jump, and a jump never matches a simple move.
+        """
+        self.game.board.arrange_board({
+            11: {
+                "color": "white",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+            30: {
+                "color": "white",
+                "type" : "man",
+            },
+        })
+
+        self.assertIsNone(self.game.find_legal_move(TextInput.parse_move("11-4")))
+        self.assertEqual(self.game.find_legal_move(TextInput.parse_move("11x4"))["jumps_over"], [8])
+        self.assertEqual(self.game.find_legal_move({"start": 11, "end": 4, "jumps_over": [8]})["lands"], [4])
+
+        self.game.board.arrange_board({
+            22: {
+                "color": "white",
+                "type" : "man",
+            },
+        })
+        self.assertIsNone(self.game.find_legal_move(TextInput.parse_move("22x18")))
+        self.assertIsNotNone(self.game.find_legal_move(TextInput.parse_move("22-18")))
+
+class MoveCacheTests(TestCase):
+    """Confirm legal moves are remembered per position and the cache stays bounded.
+    """
+
+    def test_repeated_positions_hit(self):
+        """Asking again in the same position is a hit, and the moves match generating them fresh.
+        """
+        move_cache = MoveCache()
+        game = CheckerGame(move_cache=move_cache)
+
+        first_moves = game.get_current_legal_moves()
+        second_moves = game.get_current_legal_moves()
+        game.apply_move({"start": 22, "end": 18})
+        game.undo_move()
+        third_moves = game.get_current_legal_moves()
+
+        self.assertEqual(first_moves, CheckerGame().get_current_legal_moves())
+        self.assertEqual(second_moves, first_moves)
+        self.assertEqual(third_moves, first_moves)
+        # Checking the applied move was a hit too.
+        self.assertEqual(move_cache.hits, 3)
+        self.assertEqual(move_cache.misses, 1)
+        self.assertEqual(move_cache.get_hit_rate(), 0.75)
+
+    def test_rules_are_part_of_the_key(self):
+        """Games with different rules don't share moves.
+        """
+        move_cache = MoveCache()
+        position = TextInput.parse_fen("W:WK29:B1")
+        for flying_kings in [False, True]:
+            game = CheckerGame(flying_kings=flying_kings, move_cache=move_cache)
+            game.set_position(position["pieces"], position["turn"])
+            game.get_current_legal_moves()
+
+        self.assertEqual(move_cache.hits, 0)
+        self.assertEqual(len(move_cache), 2)
+
+    def test_least_recently_used_is_dropped(self):
+        """Once full, the entry used longest ago is dropped.
+        """
+        move_cache = MoveCache(max_entries=2)
+        move_cache.put("a", [])
+        move_cache.put("b", [])
+        move_cache.get("a")
+        move_cache.put("c", [])
+
+        self.assertEqual(list(move_cache.entries), ["a", "c"])
+        self.assertEqual(move_cache.get_statistics()["evictions"], 1)
+
+    def test_search_leaves_cache_alone(self):
+        """Searching a copy of the game doesn't use or fill the original game's cache.
+        """
+        move_cache = MoveCache()
+        game = CheckerGame(move_cache=move_cache)
+        game.get_current_legal_moves()
+        statistics = move_cache.get_statistics()
+
+        AlphaBetaSearch().search(game.copy(), depth=3)
+        AlphaBetaSearch().search(game, depth=3)
+
+        self.assertEqual(move_cache.get_statistics(), statistics)
+        self.assertEqual(game.copy().move_cache, None)
+        self.assertTrue(game.copy(move_cache=move_cache).move_cache is move_cache)
+
+class MoveHistoryTests(TestCase):
+    """Confirm the packed history gives back the same moves and positions.
+    """
+
+    def play_random_moves(self, game, plies, seed=0):
+        move_picker = random.Random(seed)
+        played = []
+        for ply in range(plies):
+            legal_moves = game.get_current_legal_moves()
+            if not legal_moves:
+                break
+            played.append(game.apply_move(move_picker.choice(legal_moves)))
+        return played
+
+    def test_moves_round_trip(self):
+        """Moves come back the same, including jumps too long to pack.
+        """
+        game = CheckerGame()
+        for move in [
+            {"start": 22, "end": 18},
+            {"start": 22, "jumps_over": [18, 11, 12], "lands": [15, 8, 3], "end": 3},
+            {"start": 29, "jumps_over": [25, 18, 10, 6], "lands": [22, 15, 6, 2], "end": 2},
+        ]:
+            game.history.append(move, [False] * len(move.get("jumps_over", [])), False, True)
+            self.assertEqual(game.history.get_move(len(game.history) - 1), move)
+        self.assertEqual(list(game.history.overflow_moves), [2])
+
+    def test_pack_board(self):
+        """A packed board unpacks to the same pieces and hash.
+        """
+        board = Checkerboard()
+        board.move_piece(22, 18)
+        board.promote_piece(18)
+
+        packed_board = board.pack()
+        new_board = Checkerboard()
+        new_board.unpack(packed_board)
+
+        self.assertEqual(len(packed_board), 16)
+        self.assertEqual(new_board.get_all_pieces_by_location(), board.get_all_pieces_by_location())
+        self.assertEqual(new_board.get_position_hash(), board.get_position_hash())
+
+    def test_seek_matches_replay(self):
+        """Seeking to any ply gives the same position as replaying the moves from the start.
+        """
+        game = CheckerGame(checkpoint_interval=8)
+        played = self.play_random_moves(game, 60)
+
+        for ply in [0, 5, 8, 17, 31, len(played) - 1, len(played)]:
+            replayed_game = CheckerGame()
+            for move in played[:ply]:
+                replayed_game.apply_move(move)
+
+            sought_game = game.position_at(ply)
+            self.assertEqual(sought_game.board.get_all_pieces_by_location(), replayed_game.board.get_all_pieces_by_location())
+            self.assertEqual(sought_game.get_position_hash(), replayed_game.get_position_hash())
+            self.assertEqual(sought_game.get_current_turn(), replayed_game.get_current_turn())
+            self.assertEqual(sought_game.get_move_history(), played[:ply])
+            self.assertEqual(sought_game.get_plies_without_progress(), replayed_game.get_plies_without_progress())
+
+        self.assertEqual(game.get_ply_count(), len(played))
+
+    def test_takeback_then_continue(self):
+        """Taking back moves drops them, and play can continue from there.
+        """
+        game = CheckerGame(checkpoint_interval=4)
+        played = self.play_random_moves(game, 30)
+
+        self.assertEqual(game.takeback(10), 10)
+        self.assertEqual(game.get_move_history(), played[:-10])
+        self.assertEqual(game.get_position_hash(), game.position_hashes[-1])
+
+        self.play_random_moves(game, 10, seed=1)
+        self.assertEqual(game.get_move_history()[:len(played) - 10], played[:-10])
+        ply_count = game.get_ply_count()
+        self.assertEqual(game.takeback(100), ply_count)
+        self.assertEqual(game.board.get_all_pieces_by_location(), CheckerGame().board.get_all_pieces_by_location())
+
+class SymmetryTests(TestCase):
+    """Confirm positions with Black to move match their color-flipped twins.
+    """
+
+    def get_twin(self, game):
+        canonical = canonicalize(game)
+        twin = CheckerGame()
+        twin.set_position(canonical["pieces"], canonical["turn"])
+        return twin
+
+    def test_flip_twice_is_identity(self):
+        """Flipping a location twice gives it back, and the corners swap.
+        """
+        geometry = CheckerGame().board.geometry
+        flip_table = get_flip_table(geometry)
+
+        self.assertEqual(flip_table[1], 32)
+        self.assertEqual(flip_table[5], 28)
+        for location in range(1, geometry.squares + 1):
+            self.assertEqual(flip_table[flip_table[location]], location)
+
+    def test_canonical_hash_matches_twin(self):
+        """A position with Black to move hashes like its White to move twin.
+        """
+        game = CheckerGame()
+        self.assertEqual(get_canonical_hash(game), game.get_position_hash())
+
+        game.apply_move({"start": 22, "end": 18})
+        twin = self.get_twin(game)
+
+        self.assertEqual(twin.get_current_turn(), "White")
+        self.assertEqual(get_canonical_hash(game), twin.get_position_hash())
+        self.assertNotEqual(get_canonical_hash(game), game.get_position_hash())
+        self.assertEqual(pack_canonical_board(game), twin.board.pack())
+
+    def test_flipped_moves_are_legal_in_twin(self):
+        """Every legal move, flipped, is a legal move in the twin, and there are no others.
+        """
+        game = CheckerGame()
+        position = TextInput.parse_fen("B:W18,22,K30:B14,K3")
+        game.set_position(position["pieces"], position["turn"])
+        twin = self.get_twin(game)
+        geometry = game.board.geometry
+
+        flipped_moves = [flip_move(move, geometry) for move in game.get_current_legal_moves()]
+
+        self.assertEqual(len(flipped_moves), len(twin.get_current_legal_moves()))
+        for move in flipped_moves:
+            self.assertTrue(move in twin.get_current_legal_moves())
+
+    def test_search_shares_entries_between_twins(self):
+        """Searching a position fills the table for its twin, and the twin's best move comes back flipped.
+        """
+        game = CheckerGame()
+        position = TextInput.parse_fen("W:W18,K30:B15,8")
+        game.set_position(position["pieces"], position["turn"])
+        flipped_position = TextInput.parse_fen("B:W25,18:B15,K3")
+        flipped_game = CheckerGame()
+        flipped_game.set_position(flipped_position["pieces"], flipped_position["turn"])
+        self.assertEqual(get_canonical_hash(flipped_game), game.get_position_hash())
+
+        search = AlphaBetaSearch()
+        search.search(game, depth=4)
+        table_size = len(search.transposition_table)
+        result = search.search(flipped_game, depth=4)
+
+        self.assertEqual(TextOutput.format_move(result["move"]), "15x22x29")
+        self.assertTrue(result["score"] > 0)
+        self.assertEqual(len(search.transposition_table), table_size)
+
+class MemoryTests(TestCase):
+    """Confirm memory reports count each object once and grow with what they hold.
+    """
+
+    def test_deep_size_counts_shared_objects_once(self):
+        """An object referred to twice is counted once, and excluded objects aren't counted.
+        """
+        shared_list = list(range(1000, 1100))
+        single_size = get_deep_size([shared_list])
+
+        self.assertTrue(get_deep_size([shared_list, shared_list]) < single_size + get_deep_size(1000))
+        self.assertEqual(get_deep_size([shared_list], exclude=(shared_list,)), get_deep_size([None]))
+
+    def test_game_memory_grows_with_history(self):
+        """Moves and position hashes grow as moves are played, and the shared move cache is left out.
+        """
+        game = CheckerGame(move_cache=MoveCache())
+        start_memory = get_game_memory(game)
+        for move in TextInput.parse_moves(["22-18", "11-15", "18x11", "8x15"]):
+            game.apply_move(move)
+        memory = get_game_memory(game)
+
+        self.assertEqual(memory["plies"], 4)
+        self.assertTrue(memory["moves"] > start_memory["moves"])
+        self.assertTrue(memory["position_hashes"] > start_memory["position_hashes"])
+        self.assertTrue(memory["total"] >= memory["board"] + memory["moves"] + memory["checkpoints"])
+
+        # The shared move cache is left out.
+        self.assertEqual(get_game_memory(game)["total"], memory["total"])
+        self.assertTrue(get_deep_size(game) > memory["total"])
+
+    def test_search_and_allocations(self):
+        """Allocations are measured around a search, and the transposition table is reported.
+        """
+        search = AlphaBetaSearch()
+        measurement = measure_allocations(search.search, CheckerGame(), depth=3)
+        memory = get_search_memory(search)
+
+        self.assertEqual(measurement["result"]["depth"], 3)
+        self.assertTrue(measurement["peak"] >= measurement["allocated"] > 0)
+        self.assertEqual(memory["entries"], len(search.transposition_table))
+        self.assertTrue(memory["bytes_per_entry"] > 0)
+
+class PositionStoreTests(TestCase):
+    """Confirm the position store merges repeated positions and their results.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "positions.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play(self, move_strings):
+        game = CheckerGame()
+        for move in TextInput.parse_moves(move_strings):
+            game.apply_move(move)
+        return game
+
+    def test_games_share_positions(self):
+        """Positions repeated across games share a row that adds up their results, and survive reopening.
+        """
+        store = PositionStore(self.path, batch_size=3)
+        store.add_game(self.play(["22-18", "11-15"]), "White")
+        store.add_game(self.play(["22-18", "9-14"]), "Black")
+        store.add_game(self.play(["21-17"]), "Draw")
+
+        start = store.get(CheckerGame())
+        self.assertEqual(start["occurrences"], 3)
+        self.assertEqual((start["wins"], start["draws"], start["losses"]), (1, 1, 1))
+        self.assertEqual(start["board"], CheckerGame().board.pack())
+
+        # Black was to move after 22-18, so Black's win is a win for the player to move.
+        after_first_move = store.get(self.play(["22-18"]))
+        self.assertEqual(after_first_move["occurrences"], 2)
+        self.assertEqual((after_first_move["wins"], after_first_move["losses"]), (1, 1))
+        self.assertEqual(after_first_move["turn"], "White")
+
+        self.assertEqual(store.get_position_count(), 5)
+        self.assertEqual(store.get(self.play(["24-20"])), None)
+        store.close()
+
+        # Everything was written, and reading back in bulk finds it all.
+        store = PositionStore(self.path)
+        positions = list(store.iterate_positions(fetch_size=2))
+        self.assertEqual(len(positions), 5)
+        self.assertEqual(len(store.get_many(position["hash"] for position in positions)), 5)
+        self.assertEqual(sorted(position["occurrences"] for position in store.iterate_positions(min_occurrences=2)), [2, 3])
+        store.close()
+
+    def test_without_symmetry(self):
+        """Without symmetry, a position with Black to move is stored as it is.
+        """
+        store = PositionStore(self.path, use_symmetry=False)
+        game = self.play(["22-18"])
+        store.add_position(game)
+
+        position = store.get(game)
+        self.assertEqual(position["hash"], game.get_position_hash())
+        self.assertEqual(position["turn"], "Black")
+        self.assertEqual(position["board"], game.board.pack())
+        self.assertEqual((position["occurrences"], position["wins"]), (1, 0))
+        store.close()
+
 class JumpingPieceTests(TestCase):
     # Verifies the board can detect jumps.
     # S = Start point
@@ -951,3 +1556,1283 @@ class JumpingPieceTests(TestCase):
         self.assertEqual(len(expected_moves), len(legal_moves))
         for expected_move in expected_moves:
             self.assertTrue(expected_move in legal_moves)
+
+class InstrumentationTests(TestCase):
+    """Confirm the move generation primitives can be counted per game.
+    """
+
+    def setUp(self):
+        self.game = CheckerGame()
+
+    def test_counts_calls_and_recursion(self):
+        """Counts include recursive jumps, and only the instrumented game is counted.
+        """
+        # S jumps twice: over 15, then over 7 or 8.
+        self.game.board.arrange_board({
+            18: {
+                "color": "white",
+                "type" : "man",
+            },
+            15: {
+                "color": "black",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+            7: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+        instrumentation = self.game.enable_instrumentation()
+        self.game.get_current_legal_moves()
+        CheckerGame().get_current_legal_moves()
+
+        counts = instrumentation.to_dict()
+        self.assertEqual(counts["CheckerGame.get_current_legal_moves"]["calls"], 1)
+        self.assertEqual(counts["CheckerGame.get_legal_moves_for_checker"]["primitive_calls"], 1)
+        self.assertEqual(counts["CheckerGame.get_legal_moves_for_checker"]["max_depth"], 3)
+        self.assertEqual(counts["CheckerGame.generate_legal_moves"]["calls"], 1)
+
+    def test_flying_king_jumps_are_counted(self):
+        """The flying king recursion is counted with its depth.
+        """
+        game = CheckerGame(flying_kings=True)
+        game.board.arrange_board({
+            28: {
+                "color": "white",
+                "type" : "king",
+            },
+            24: {
+                "color": "black",
+                "type" : "man",
+            },
+            15: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+        instrumentation = game.enable_instrumentation()
+        game.get_current_legal_moves()
+
+        counts = instrumentation.to_dict()
+        self.assertEqual(counts["CheckerGame.get_flying_king_jumps"]["primitive_calls"], 1)
+        self.assertTrue(counts["CheckerGame.get_flying_king_jumps"]["max_depth"] >= 3)
+
+    def test_search_on_copies_is_counted(self):
+        """A search works on copies of the game, and its moves and move generation are still counted.
+        """
+        instrumentation = self.game.enable_instrumentation()
+        AlphaBetaSearch().search(self.game, depth=3)
+        MonteCarloTreeSearch(max_playout_plies=10, seed=0).search(self.game, iterations=20)
+
+        counts = instrumentation.to_dict()
+        for name in ["generate_legal_moves", "get_legal_moves_for_checker", "apply_move", "undo_move"]:
+            self.assertTrue(counts["CheckerGame." + name]["calls"] > 0, name)
+        self.assertEqual(self.game.get_ply_count(), 0)
+        self.assertIs(self.game.copy().instrumentation, instrumentation)
+
+    def test_disable_restores_methods(self):
+        """Disabling instrumentation stops the counting.
+        """
+        instrumentation = self.game.enable_instrumentation(Instrumentation())
+        self.game.disable_instrumentation()
+        self.game.get_current_legal_moves()
+
+        self.assertEqual(instrumentation.to_dict()["CheckerGame.get_current_legal_moves"]["calls"], 0)
+        self.assertFalse("get_current_legal_moves" in self.game.__dict__)
+
+
+class FlyingKingTests(TestCase):
+    """Kings that can move and jump any distance along a diagonal.
+    """
+
+    def setUp(self):
+        self.game = CheckerGame(flying_kings=True)
+
+    def test_king_moves_any_distance(self):
+        """A king in the corner can slide along the whole diagonal.
+        """
+        self.game.board.arrange_board({
+            29: {
+                "color": "white",
+                "type" : "king",
+            },
+        })
+
+        legal_moves = self.game.get_current_legal_moves()
+        self.assertEqual(
+            sorted(move["end"] for move in legal_moves),
+            [4, 8, 11, 15, 18, 22, 25]
+        )
+
+        # Regular kings only move one square.
+        regular_game = CheckerGame()
+        regular_game.board.arrange_board({
+            29: {
+                "color": "white",
+                "type" : "king",
+            },
+        })
+        self.assertEqual(regular_game.get_current_legal_moves(), [{"start": 29, "end": 25}])
+
+    def test_king_jumps_from_a_distance(self):
+        """A king can jump a distant piece and land on any empty square beyond it.
+        """
+        self.game.board.arrange_board({
+            29: {
+                "color": "white",
+                "type" : "king",
+            },
+            15: {
+                "color": "black",
+                "type" : "man",
+            },
+            4: {
+                "color": "white",
+                "type" : "man",
+            },
+        })
+
+        legal_moves = self.game.get_current_legal_moves()
+
+        expected_moves = [
+            {
+                "start": 29,
+                "jumps_over": [15],
+                "lands": [11],
+                "end": 11,
+            },
+            {
+                "start": 29,
+                "jumps_over": [15],
+                "lands": [8],
+                "end": 8,
+            },
+        ]
+        self.assertEqual(len(expected_moves), len(legal_moves))
+        for expected_move in expected_moves:
+            self.assertTrue(expected_move in legal_moves)
+
+        # Applying the move removes the jumped piece.
+        self.game.apply_move({"start": 29, "end": 8, "lands": [8]})
+        self.assertIsNone(self.game.board.get_piece(15))
+        self.assertEqual(self.game.board.get_piece(8)["type"], "King")
+
+    def test_king_jumps_each_piece_once(self):
+        """A king circling a group of pieces stops once every piece has been jumped.
+        """
+        pieces = {
+            28: {
+                "color": "white",
+                "type" : "king",
+            },
+        }
+        for location in [24, 15, 14, 22, 23]:
+            pieces[location] = {
+                "color": "black",
+                "type" : "man",
+            }
+
+        # A regular king has to go all the way around.
+        regular_game = CheckerGame()
+        regular_game.board.arrange_board(pieces)
+        legal_moves = regular_game.get_current_legal_moves()
+
+        self.assertEqual(len(legal_moves), 2)
+        for move in legal_moves:
+            self.assertEqual(sorted(move["jumps_over"]), [14, 15, 22, 23, 24])
+            self.assertEqual(move["end"], 19)
+
+        # A flying king can also stop early by landing past the group.
+        self.game.board.arrange_board(pieces)
+        legal_moves = self.game.get_current_legal_moves()
+
+        self.assertTrue(len(legal_moves) > 2)
+        for move in legal_moves:
+            self.assertEqual(len(move["jumps_over"]), len(set(move["jumps_over"])))
+
+    def test_occupancy_follows_moves(self):
+        """The occupancy bitmasks match the pieces after moves, captures, promotions and takebacks.
+        """
+        self.game.board.arrange_board({
+            29: {
+                "color": "white",
+                "type" : "king",
+            },
+            15: {
+                "color": "black",
+                "type" : "man",
+            },
+            6: {
+                "color": "white",
+                "type" : "man",
+            },
+        })
+        board = self.game.board
+        self.assertEqual(board.occupancy_by_color, board.compute_occupancy_by_color())
+        self.assertEqual(board.occupancy_by_color["Black"], 1 << 15)
+
+        self.game.apply_move({"start": 29, "end": 11, "lands": [11]})
+        self.assertEqual(board.occupancy_by_color, board.compute_occupancy_by_color())
+        self.assertEqual(board.occupancy_by_color["Black"], 0)
+
+        copied_board = board.copy()
+        self.game.undo_move()
+        self.assertEqual(board.occupancy_by_color, board.compute_occupancy_by_color())
+        self.assertEqual(board.occupancy_by_color["White"], (1 << 29) | (1 << 6))
+        self.assertEqual(copied_board.occupancy_by_color["White"], (1 << 11) | (1 << 6))
+
+class DrawDetectionTests(TestCase):
+    """Games between kings can be drawn by repetition or by the move limit.
+    """
+
+    def setUp(self):
+        self.game = CheckerGame()
+        self.game.board.arrange_board({
+            29: {
+                "color": "white",
+                "type" : "king",
+            },
+            4: {
+                "color": "black",
+                "type" : "king",
+            },
+        })
+
+    def shuffle_kings(self):
+        """Both kings step forward and back again.
+        """
+        for move in [(29, 25), (4, 8), (25, 29), (8, 4)]:
+            self.game.apply_move({"start": move[0], "end": move[1]})
+
+    def test_position_hash_follows_moves(self):
+        """The hash kept up to date by the board matches a fresh one.
+        """
+        game = CheckerGame()
+        for move in ["22-18", "11-15", "18x11", "8x15"]:
+            game.apply_move(TextInput.parse_move(move))
+            self.assertEqual(game.board.get_position_hash(), game.board.compute_position_hash())
+
+        # The turn is part of the game's hash.
+        self.assertNotEqual(game.get_position_hash(), CheckerGame().get_position_hash())
+
+    def test_threefold_repetition(self):
+        """The third time the same position comes up, the game is drawn.
+        """
+        self.shuffle_kings()
+        self.assertEqual(self.game.get_repetition_count(), 2)
+        self.assertFalse(self.game.is_draw())
+
+        self.shuffle_kings()
+        self.assertEqual(self.game.get_repetition_count(), 3)
+        self.assertEqual(self.game.get_draw_reason(), "repetition")
+
+    def test_move_limit(self):
+        """Moving kings without capturing eventually draws the game.
+        """
+        self.game.draw_move_limit = 1
+        self.game.apply_move({"start": 29, "end": 25})
+        self.assertFalse(self.game.is_draw())
+        self.game.apply_move({"start": 4, "end": 8})
+        self.assertEqual(self.game.get_draw_reason(), "move limit")
+
+        # Men moving resets the count.
+        game = CheckerGame(draw_move_limit=1)
+        game.apply_move({"start": 22, "end": 18})
+        game.apply_move({"start": 11, "end": 15})
+        self.assertFalse(game.is_draw())
+
+class GameOverTests(TestCase):
+    """A player with no pieces or no moves loses.
+    """
+
+    def setUp(self):
+        self.game = CheckerGame()
+
+    def test_new_game_is_not_over(self):
+        self.assertTrue(self.game.has_any_move())
+        self.assertIsNone(self.game.get_winner())
+        self.assertFalse(self.game.is_game_over())
+
+    def test_no_pieces_loses(self):
+        """Jumping the last piece wins the game.
+        """
+        self.game.board.arrange_board({
+            11: {
+                "color": "white",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+        self.assertEqual(self.game.board.get_piece_count("Black"), 1)
+
+        self.game.apply_move({"start": 11, "end": 4, "lands": [4]})
+        self.assertEqual(self.game.board.get_piece_count("Black"), 0)
+        self.assertEqual(self.game.get_winner(), "White")
+        self.assertEqual(self.game.get_result(), "White")
+
+    def test_no_moves_loses(self):
+        """A blocked player loses even though they have pieces.
+        """
+        # The White man on 32 is blocked by Black men on 28 and 27, and 23 stops the jump.
+        self.game.board.arrange_board({
+            32: {
+                "color": "white",
+                "type" : "man",
+            },
+            28: {
+                "color": "black",
+                "type" : "man",
+            },
+            27: {
+                "color": "black",
+                "type" : "man",
+            },
+            23: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+
+        self.assertFalse(self.game.has_any_move())
+        self.assertEqual(self.game.get_current_legal_moves(), [])
+        self.assertEqual(self.game.get_winner(), "Black")
+        self.assertTrue(self.game.has_any_move("Black"))
+
+class MonteCarloTreeSearchTests(TestCase):
+    """Confirm the Monte Carlo player finds moves and keeps its tree bounded.
+    """
+
+    def setUp(self):
+        self.game = CheckerGame()
+
+    def test_finds_winning_jump(self):
+        """Jumping the last Black piece wins immediately.
+        """
+        self.game.board.arrange_board({
+            11: {
+                "color": "white",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+            30: {
+                "color": "white",
+                "type" : "man",
+            },
+        })
+
+        for selection in ["uct", "puct"]:
+            search = MonteCarloTreeSearch(selection=selection, seed=0)
+            best_move = search.search(self.game, iterations=50)
+            self.assertEqual(best_move["jumps_over"], [8])
+
+    def test_tree_stays_bounded(self):
+        """The tree never holds more nodes than allowed.
+        """
+        search = MonteCarloTreeSearch(max_nodes=40, max_playout_plies=20, seed=0)
+        best_move = search.search(self.game, iterations=100)
+
+        self.assertTrue(best_move in self.game.get_current_legal_moves())
+        self.assertTrue(search.get_node_count() <= 40)
+        self.assertEqual(search.visits[0], 100)
+
+    def test_tree_reuse(self):
+        """Advancing keeps the statistics of the chosen move.
+        """
+        search = MonteCarloTreeSearch(max_playout_plies=20, seed=0)
+        best_move = search.search(self.game, iterations=60)
+        best_visits = max(statistic["visits"] for statistic in search.get_root_statistics())
+
+        search.advance(best_move)
+        self.game.apply_move(best_move)
+
+        self.assertEqual(search.visits[0], best_visits)
+        self.assertEqual(search.root_hash, self.game.get_position_hash())
+        self.assertTrue(search.search(self.game, iterations=10) in self.game.get_current_legal_moves())
+
+    def test_iterations_leave_root_alone(self):
+        """Moves played during an iteration are taken back, and the tree holds packed moves.
+        """
+        search = MonteCarloTreeSearch(max_playout_plies=20, seed=0)
+        search.search(self.game, iterations=30)
+
+        self.assertEqual(search.root_game.get_ply_count(), 0)
+        self.assertEqual(search.root_game.get_position_hash(), self.game.get_position_hash())
+        self.assertEqual(search.moves.typecode, "q")
+        for statistic in search.get_root_statistics():
+            self.assertTrue(statistic["move"] in self.game.get_current_legal_moves())
+
+class GameJournalTests(TestCase):
+    """Confirm journaled games come back after the process stops.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "game.journal")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play_random_moves(self, game, plies, seed=0):
+        move_picker = random.Random(seed)
+        for ply in range(plies):
+            legal_moves = game.get_current_legal_moves()
+            if not legal_moves:
+                break
+            game.apply_move(move_picker.choice(legal_moves))
+
+    def assertSameGame(self, first_game, second_game):
+        self.assertEqual(first_game.board.get_all_pieces_by_location(), second_game.board.get_all_pieces_by_location())
+        self.assertEqual(first_game.get_current_turn(), second_game.get_current_turn())
+        self.assertEqual(first_game.get_move_history(), second_game.get_move_history())
+        self.assertEqual(list(first_game.position_hashes), list(second_game.position_hashes))
+        self.assertEqual(first_game.last_irreversible_index, second_game.last_irreversible_index)
+
+    def test_resume_from_snapshot_and_tail(self):
+        """Resuming loads the latest snapshot and replays the moves and takebacks after it.
+        """
+        game = CheckerGame()
+        journal = GameJournal(self.path, game, sync_interval=4, snapshot_interval=10)
+        self.play_random_moves(game, 25)
+        game.takeback(3)
+        self.play_random_moves(game, 4, seed=1)
+        journal.close()
+
+        self.assertTrue(os.path.exists(self.path + GameJournal.SNAPSHOT_SUFFIX))
+        resumed_journal = GameJournal.resume(self.path)
+        self.assertSameGame(resumed_journal.game, game)
+
+        # The resumed journal keeps recording.
+        self.play_random_moves(resumed_journal.game, 3, seed=2)
+        resumed_journal.close()
+        final_journal = GameJournal.resume(self.path)
+        self.assertSameGame(final_journal.game, resumed_journal.game)
+        final_journal.close()
+
+    def test_replayed_moves_count_toward_snapshot(self):
+        """Moves replayed after the snapshot count, so the next snapshot comes on schedule.
+        """
+        game = CheckerGame()
+        journal = GameJournal(self.path, game, snapshot_interval=10)
+        self.play_random_moves(game, 16)
+        journal.close()
+
+        resumed_journal = GameJournal.resume(self.path, snapshot_interval=10)
+        self.assertEqual(resumed_journal.moves_since_snapshot, 6)
+
+
+        # The fourth new move is the tenth since the snapshot.
+        self.play_random_moves(resumed_journal.game, 4, seed=1)
+        self.assertEqual(resumed_journal.moves_since_snapshot, 0)
+        resumed_journal.close()
+
+    def test_torn_record_is_dropped(self):
+        """A record cut short by a crash is ignored, and new records are written after the last good one.
+        """
+        game = CheckerGame()
+        journal = GameJournal(self.path, game, snapshot_interval=None)
+        self.play_random_moves(game, 6)
+        journal.close()
+
+        with open(self.path, "ab") as journal_file:
+            journal_file.write(b"\x09\x00\x00\x00\x01")
+
+        resumed_journal = GameJournal.resume(self.path)
+        self.assertSameGame(resumed_journal.game, game)
+        self.assertEqual(os.path.getsize(self.path), resumed_journal.journal_file.tell())
+        resumed_journal.close()
+
+class SpectatorBroadcastTests(TestCase):
+    """Confirm spectators receive every move, and slow ones are dropped.
+    """
+
+    def test_spectators_follow_the_game(self):
+        """Every spectator gets the board, then one small frame per move.
+        """
+        async def watch():
+            game = CheckerGame()
+            broadcast = SpectatorBroadcast(game)
+            server = await broadcast.start_server()
+            port = server.sockets[0].getsockname()[1]
+
+            connections = [await asyncio.open_connection("127.0.0.1", port) for index in range(3)]
+            first_frames = [await read_frame(reader) for reader, writer in connections]
+            while len(broadcast.spectators) < 3:
+                await asyncio.sleep(0)
+
+            game.apply_move({"start": 22, "end": 18})
+            game.apply_move({"start": 11, "end": 15})
+            game.apply_move({"start": 18, "end": 11, "lands": [11]})
+            move_frames = [[await read_frame(reader) for move in range(3)] for reader, writer in connections]
+
+            await broadcast.close()
+            for reader, writer in connections:
+                writer.close()
+            return game, first_frames, move_frames
+
+        game, first_frames, move_frames = asyncio.run(watch())
+
+        for first_frame in first_frames:
+            self.assertEqual(first_frame["type"], "state")
+            self.assertEqual(first_frame["packed_board"], CheckerGame().board.pack())
+        for frames in move_frames:
+            self.assertEqual([frame["ply"] for frame in frames], [0, 1, 2])
+            self.assertEqual(frames[2]["captures"], [15])
+            self.assertFalse(frames[2]["promoted"])
+
+    def test_slow_spectator_is_dropped(self):
+        """A spectator that never takes its frames is disconnected once its queue is full.
+        """
+        class StuckWriter(object):
+            def __init__(self):
+                self.is_closed = False
+
+            def write(self, data):
+                pass
+
+            async def drain(self):
+                await asyncio.sleep(3600)
+
+            def close(self):
+                self.is_closed = True
+
+        async def watch():
+            game = CheckerGame()
+            broadcast = SpectatorBroadcast(game, max_queued_frames=2)
+            writer = StuckWriter()
+            broadcast.subscribe(writer)
+            await asyncio.sleep(0)
+
+            move_picker = random.Random(0)
+            for ply in range(4):
+                game.apply_move(move_picker.choice(game.get_current_legal_moves()))
+            await asyncio.sleep(0)
+            await broadcast.close()
+            return broadcast, writer
+
+        broadcast, writer = asyncio.run(watch())
+
+        self.assertEqual(broadcast.spectators_dropped, 1)
+        self.assertEqual(broadcast.spectators, [])
+        self.assertTrue(writer.is_closed)
+
+class CheckerboardStateTests(TestCase):
+    """Confirm the row cache only forgets the rows a change touches.
+    """
+
+    def setUp(self):
+        self.board_state = terminal_checkers.CheckerboardState()
+        self.contexts = {row: self.board_state.get_context_for_row(row) for row in range(1, 9)}
+
+    def get_uncached_rows(self):
+        return set(row for row in range(1, 9) if not row in self.board_state.row_contexts)
+
+    def test_select_location_clears_touched_rows(self):
+        """Selecting 22 clears its row and the row it can move to, and marks the valid moves.
+        """
+        self.board_state.select_location(22)
+
+        self.assertEqual(self.get_uncached_rows(), set([3, 4]))
+        self.assertEqual(self.board_state.get_context_for_row(3)["selected"], "c")
+        self.assertEqual(
+            self.board_state.get_context_for_row(4)["pieces"],
+            [None, "valid move", None, "valid move", None, None, None, None],
+        )
+        # Rows that weren't touched keep the same cached context.
+        self.assertTrue(self.board_state.get_context_for_row(6) is self.contexts[6])
+
+    def test_apply_move_clears_touched_rows(self):
+        """Moving 22-18 after selecting 22 clears the rows with the selection, the markers and the move.
+        """
+        self.board_state.select_location(22)
+        for row in range(1, 9):
+            self.board_state.get_context_for_row(row)
+        self.board_state.apply_move({"start": 22, "end": 18})
+
+        self.assertEqual(self.get_uncached_rows(), set([3, 4]))
+        self.assertEqual(self.board_state.get_context_for_row(4)["pieces"][3], "white")
+        self.assertFalse("valid move" in self.board_state.get_context_for_row(4)["pieces"])
+
+    def test_direct_changes_need_invalidate(self):
+        """Changing the game directly leaves the cache stale until invalidate_rows is called.
+        """
+        self.board_state.game.apply_move({"start": 22, "end": 18})
+
+        self.assertTrue(self.board_state.get_context_for_row(4) is self.contexts[4])
+        self.assertEqual(self.board_state.get_context_for_row(4)["pieces"][3], None)
+
+        self.board_state.invalidate_rows()
+        self.assertEqual(self.board_state.get_context_for_row(4)["pieces"][3], "white")
+
+class CheckerboardDisplayTests(TestCase):
+    """Confirm frames are written in one piece, and diff mode only repaints what changed.
+    """
+
+    def setUp(self):
+        self.board_state = terminal_checkers.CheckerboardState()
+        self.output = io.StringIO()
+
+    def test_full_frame_is_one_write(self):
+        """The column names and every row go out in a single write.
+        """
+        output = MagicMock()
+        display = terminal_checkers.CheckerboardDisplay(board_state=self.board_state, output=output)
+        display.draw_board()
+
+        self.assertEqual(output.write.call_count, 1)
+        frame = output.write.call_args[0][0]
+        self.assertEqual(len(frame.splitlines()), 9)
+        self.assertEqual(frame, display.render_frame())
+
+    def test_diff_mode_repaints_changed_rows(self):
+        """After 22-18, only rows 3 and 4 are repainted, on screen lines 7 and 6.
+        """
+        display = terminal_checkers.CheckerboardDisplay(board_state=self.board_state, output=self.output, diff_mode=True)
+        first_frame = display.draw_board()
+        self.assertTrue(first_frame.startswith(display.CLEAR_SCREEN))
+
+        self.board_state.apply_move({"start": 22, "end": 18})
+        frame = display.draw_board()
+
+        self.assertEqual(frame, "".join([
+            display.MOVE_CURSOR.format(line=6),
+            display.render_row(4, self.board_state.get_context_for_row(4)),
+            display.CLEAR_TO_END_OF_LINE,
+            display.MOVE_CURSOR.format(line=7),
+            display.render_row(3, self.board_state.get_context_for_row(3)),
+            display.CLEAR_TO_END_OF_LINE,
+            display.MOVE_CURSOR.format(line=10),
+        ]))
+
+    def test_unchanged_frame_is_empty(self):
+        """Nothing is sent when nothing changed.
+        """
+        display = terminal_checkers.CheckerboardDisplay(board_state=self.board_state, output=self.output, diff_mode=True)
+        display.draw_board()
+        written = self.output.getvalue()
+
+        self.assertEqual(display.draw_board(), "")
+        self.assertEqual(self.output.getvalue(), written)
+
+class BatchReplayTests(TestCase):
+    """Confirm games read from move files are split, replayed and summarized.
+    """
+    GAME_LINES = [
+        "# Two games, the second with an illegal move.",
+        "22-18",
+        "11-15",
+        "18x11",
+        "",
+        "",
+        "22-18",
+        "# Comments in the middle are skipped too.",
+        "18-14",
+    ]
+
+    def test_games_are_split_on_blank_lines(self):
+        """Blank lines separate games and comment lines are skipped, keeping the line numbers.
+        """
+        games = list(terminal_checkers.read_games(self.GAME_LINES))
+
+        self.assertEqual(games, [
+            [(2, "22-18"), (3, "11-15"), (4, "18x11")],
+            [(7, "22-18"), (9, "18-14")],
+        ])
+
+    def test_illegal_moves_fail_the_game(self):
+        """The replay stops at the illegal move, and the summary names it.
+        """
+        output = io.StringIO()
+        failed_games = terminal_checkers.run_batch(self.GAME_LINES, summary_only=True, output=output)
+
+        self.assertEqual(failed_games, 1)
+        self.assertEqual(output.getvalue().splitlines(), [
+            "game 1: 3 plies, Black to move, White 12 (0 kings), Black 11 (0 kings)",
+            "game 2: 1 plies, Black to move, White 12 (0 kings), Black 12 (0 kings), ERROR line 9: illegal move 18-14",
+        ])
+
+    def test_exit_status(self):
+        """The command exits with 1 if any game failed, and 0 otherwise.
+        """
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "terminal-checkers.py")
+        for lines, status in [(self.GAME_LINES, 1), (self.GAME_LINES[:4], 0)]:
+            process = subprocess.run(
+                [sys.executable, script, "--moves", "-", "--summary"],
+                input = "\n".join(lines) + "\n",
+                capture_output = True,
+                text = True,
+            )
+            self.assertEqual(process.returncode, status)
+
+class RenderBenchmarkTests(TestCase):
+    """Confirm the rendering benchmark runs and its percentiles handle small samples.
+    """
+
+    def test_percentile_edges(self):
+        """One sample is every percentile, and 0 and 1 give the smallest and largest values.
+        """
+        percentile = terminal_checkers.percentile
+        self.assertEqual(percentile([], 0.5), 0.0)
+        self.assertEqual(percentile([3.0], 0.0), 3.0)
+        self.assertEqual(percentile([3.0], 1.0), 3.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 0.0), 1.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 1.0), 4.0)
+
+    def test_benchmark_runs_in_both_modes(self):
+        """A short run draws the first frame and two frames per ply.
+        """
+        for diff_mode in [False, True]:
+            results = terminal_checkers.run_render_benchmark(games=1, max_plies=3, diff_mode=diff_mode)
+
+            self.assertEqual(results["diff_mode"], diff_mode)
+            self.assertEqual(results["frames"], 7)
+            self.assertTrue(results["bytes_per_frame"] > 0)
+            self.assertTrue(results["p99_frame_ms"] >= results["p50_frame_ms"])
+
+class BenchmarkTests(TestCase):
+    """Confirm benchmark results are compared against the baseline correctly.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "baseline.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_find_regressions(self):
+        """Only benchmarks slower than the threshold are reported, and new benchmarks are skipped.
+        """
+        baseline = {"fast": 1.0, "steady": 2.0, "slow": 4.0}
+        results = {"fast": 0.5, "steady": 2.2, "slow": 6.0, "new": 9.0}
+
+        self.assertEqual(find_regressions(results, baseline, 20.0), [("slow", 4.0, 6.0, 50.0)])
+        self.assertEqual(len(find_regressions(results, baseline, 5.0)), 2)
+        self.assertEqual(find_regressions(results, baseline, 60.0), [])
+
+    def test_baseline_round_trip(self):
+        """A saved baseline loads back with the same results, and a missing one loads as None.
+        """
+        self.assertIsNone(load_baseline(self.path))
+
+        save_baseline(self.path, {"board.peek": 0.25})
+        self.assertEqual(load_baseline(self.path), {"board.peek": 0.25})
+        with open(self.path) as baseline_file:
+            self.assertEqual(json.load(baseline_file)["python"], sys.version.split()[0])
+
+    def test_main_saves_then_compares(self):
+        """The first run saves the baseline. A later run fails against a much faster baseline.
+        """
+        arguments = ["--baseline", self.path, "--filter", "board.peek", "--repeat", "1", "--runs", "1"]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(run_benchmark_main(arguments), 0)
+        self.assertTrue(load_baseline(self.path)["board.peek"] > 0)
+
+        save_baseline(self.path, {"board.peek": 1e-12})
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(run_benchmark_main(arguments), 1)
+        self.assertTrue("REGRESSION board.peek" in output.getvalue())
+
+class ScriptedInput(object):
+    """Stands in for stdin. Each line is only read once its condition is true, so tests can wait for the engine.
+    """
+    def __init__(self, script):
+        self.script = list(script)
+
+    def readline(self):
+        if not self.script:
+            return ""
+        line, condition = self.script.pop(0)
+        deadline = time.perf_counter() + 5
+        while condition is not None and not condition() and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        return line + "\n"
+
+class FakeSearcher(object):
+    """Plays the first legal move, expecting the first reply.
+    With wait_for_stop, it keeps searching until it is stopped. on_search is called as each search starts.
+    """
+    def __init__(self, wait_for_stop=False, on_search=None):
+        self.wait_for_stop = wait_for_stop
+        self.on_search = on_search
+        self.started = threading.Event()
+        self.stopped = threading.Event()
+
+    def search(self, game, depth=None, seconds=None, on_iteration=None):
+        self.started.set()
+        if self.on_search is not None:
+            self.on_search()
+        if self.wait_for_stop:
+            self.stopped.wait(5)
+
+        move = game.get_current_legal_moves()[0]
+        pv = [move]
+        game.apply_move(move)
+        if game.get_current_legal_moves():
+            pv.append(game.get_current_legal_moves()[0])
+        result = {"move": move, "score": 0, "pv": pv, "nodes": 1, "depth": 1, "seconds": 0.0}
+        if on_iteration is not None:
+            on_iteration(result)
+        return result
+
+    def stop(self):
+        self.stopped.set()
+
+class FakePonderer(object):
+    """Records what the client asks of it. It never has a ponder result.
+    """
+    def __init__(self):
+        self.calls = []
+        self.searcher = FakeSearcher()
+
+    def start(self, game, expected_move):
+        self.calls.append(("start", TextOutput.format_move(expected_move)))
+
+    def hit(self, move, depth=None, seconds=None):
+        self.calls.append(("hit", TextOutput.format_move(move)))
+        return None
+
+    def cancel(self):
+        self.calls.append(("cancel", None))
+
+class TerminalClientTests(TestCase):
+    """Confirm the asyncio client plays moves, runs the engine and clocks, and stops cleanly.
+    """
+
+    def make_client(self, script, **kwargs):
+        board_state = terminal_checkers.CheckerboardState()
+        self.output = io.StringIO()
+        client = terminal_checkers.TerminalClient(
+            board_state = board_state,
+            display = terminal_checkers.CheckerboardDisplay(board_state=board_state, output=self.output, diff_mode=True),
+            input = ScriptedInput(script),
+            **kwargs
+        )
+        return client
+
+    def get_moves(self, client):
+        return [TextOutput.format_move(move) for move in client.game.get_move_history()]
+
+    def test_locations_and_moves(self):
+        """Locations select a piece, moves are played, and bad input is reported.
+        """
+        client = self.make_client([("22", None), ("zz", None), ("22-18", None), ("18-14", None)])
+        states = []
+        original_select_location = client.board_state.select_location
+
+        def select_location(location):
+            original_select_location(location)
+            states.append(client.board_state.get_valid_move_ends())
+        client.board_state.select_location = select_location
+
+        asyncio.run(client.run())
+
+        self.assertEqual(states, [set([17, 18])])
+        self.assertEqual(self.get_moves(client), ["22-18"])
+        self.assertTrue("Not a location or a move: zz" in self.output.getvalue())
+        self.assertTrue("Illegal move: 18-14" in self.output.getvalue())
+
+    def test_engine_replies_and_undo(self):
+        """The engine answers the player's move and starts pondering, and undo takes back both moves.
+        """
+        ponderer = FakePonderer()
+        client = self.make_client(
+            [("22-18", None), ("undo", lambda: client.game.get_ply_count() == 2)],
+            engine_color = "Black",
+            searcher = FakeSearcher(),
+            ponderer = ponderer,
+        )
+        moves_before_undo = []
+        original_undo = client.undo
+
+        def undo():
+            moves_before_undo.extend(self.get_moves(client))
+            original_undo()
+        client.undo = undo
+
+        asyncio.run(client.run())
+
+        self.assertEqual(moves_before_undo, ["22-18", "9-14"])
+        self.assertEqual(self.get_moves(client), [])
+        self.assertEqual(ponderer.calls[:3], [("hit", "22-18"), ("start", "18x9"), ("cancel", None)])
+        self.assertTrue("Engine: depth 1 score 0 pv 9-14 18x9" in self.output.getvalue())
+
+    def test_clock_runs_out(self):
+        """A player whose clock runs out loses, and moves are refused afterwards.
+        """
+        client = self.make_client(
+            [("22-18", lambda: client.flagged_color is not None)],
+            clock_seconds = 0.05,
+        )
+        client.TICK_SECONDS = 0.01
+
+        asyncio.run(client.run())
+
+        self.assertEqual(client.get_result(), "Black")
+        self.assertEqual(self.get_moves(client), [])
+        self.assertTrue("Black wins on time" in self.output.getvalue())
+        self.assertTrue("The game is over. Type undo or quit." in self.output.getvalue())
+
+    def test_end_of_input_stops_engine(self):
+        """At the end of the input, a running search is stopped and its move is thrown away.
+        """
+        searcher = FakeSearcher(wait_for_stop=True)
+        client = self.make_client([], engine_color="White", searcher=searcher)
+
+        asyncio.run(client.run())
+
+        self.assertTrue(searcher.stopped.is_set())
+        self.assertEqual(self.get_moves(client), [])
+        self.assertTrue(self.output.getvalue().endswith("\n"))
+
+    def test_undo_during_search_cancels_it(self):
+        """Taking back a move while the engine thinks stops the search and drops its move.
+        """
+        searcher = FakeSearcher(wait_for_stop=True)
+        client = self.make_client(
+            [("22-18", None), ("undo", searcher.started.is_set), ("", lambda: client.engine_task is None)],
+            engine_color = "Black",
+            searcher = searcher,
+        )
+
+        asyncio.run(client.run())
+
+        self.assertTrue(searcher.stopped.is_set())
+        self.assertEqual(self.get_moves(client), [])
+
+    def test_move_from_changed_game_is_dropped(self):
+        """A search result for a position the game has left is not played.
+        """
+        def play_elsewhere():
+            client.loop.call_soon_threadsafe(client.apply_move, {"start": 22, "end": 18})
+            time.sleep(0.05)
+
+        client = self.make_client(
+            [("", lambda: client.game.get_ply_count() == 1 and client.engine_task is None)],
+            engine_color = "White",
+            searcher = FakeSearcher(on_search=play_elsewhere),
+        )
+
+        asyncio.run(client.run())
+
+        self.assertEqual(self.get_moves(client), ["22-18"])
+
+class AlphaBetaSearchTests(TestCase):
+    """Confirm the alpha-beta search finds moves and analyzes position files.
+    """
+
+    def test_finds_winning_double_jump(self):
+        """Jumping both Black pieces wins immediately.
+        """
+        game = CheckerGame()
+        position = TextInput.parse_fen("W:W18,K30:B15,8")
+        game.set_position(position["pieces"], position["turn"])
+
+        result = AlphaBetaSearch().search(game, depth=4)
+
+        self.assertEqual(TextOutput.format_move(result["move"]), "18x11x4")
+        self.assertTrue(result["score"] > 0)
+        self.assertEqual(result["pv"][0], result["move"])
+        self.assertEqual(game.get_move_history(), [])
+
+    def test_table_stays_bounded(self):
+        """The transposition table never holds more positions than allowed.
+        """
+        search = AlphaBetaSearch(max_table_entries=50)
+        result = search.search(CheckerGame(), depth=5)
+
+        self.assertTrue(result["move"] in CheckerGame().get_current_legal_moves())
+        self.assertEqual(result["depth"], 5)
+        self.assertTrue(len(search.transposition_table) <= 50)
+
+    def test_stop_until_catches_a_late_start(self):
+        """A search that starts after the first stop request is still stopped.
+        """
+        search = AlphaBetaSearch()
+        results = []
+
+        def search_later():
+            time.sleep(0.05)
+            results.append(search.search(CheckerGame(), depth=100))
+
+        search_thread = threading.Thread(target=search_later)
+        search_thread.start()
+        search.stop_until(lambda: not search_thread.is_alive())
+        search_thread.join()
+
+        self.assertTrue(results[0]["depth"] < 100)
+
+    def test_analyze_positions_in_order(self):
+        """Every position gets a JSON line, in input order, including the ones that can't be read.
+        """
+        lines = [
+            "# Comments and blank lines are skipped.",
+            "W:W21-32:B1-12",
+            "",
+            '{"turn": "Black", "pieces": {"5": {"color": "black", "type": "king"}, "30": {"color": "white", "type": "man"}}}',
+            "not a position",
+        ]
+        output = io.StringIO()
+
+        failed_positions = analyze_positions(lines, output, depth=2)
+
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(failed_positions, 1)
+        self.assertEqual([result["line"] for result in results], [2, 4, 5])
+        self.assertEqual(results[0]["depth"], 2)
+        self.assertEqual(len(results[1]["pv"]), 2)
+        self.assertTrue("error" in results[2])
+
+class PondererTests(TestCase):
+    """Confirm pondering reuses the background search on a hit and throws it away on a miss.
+    """
+
+    def test_hit_returns_result_and_warms_table(self):
+        """The expected move gets the ponder search's result, and part of its table.
+        """
+        game = CheckerGame()
+        game.apply_move({"start": 22, "end": 18})
+        expected_move = {"start": 11, "end": 15}
+        searcher = AlphaBetaSearch()
+        ponderer = Ponderer(searcher=searcher, returned_entries=50)
+
+        self.assertTrue(ponderer.start(game, expected_move))
+        self.assertTrue(ponderer.is_pondering())
+        result = ponderer.hit({"start": 11, "end": 15}, depth=4)
+
+        game.apply_move(expected_move)
+        self.assertFalse(ponderer.is_pondering())
+        self.assertTrue(result["depth"] >= 4)
+        self.assertTrue(result["move"] in game.get_current_legal_moves())
+        self.assertTrue(0 < len(searcher.transposition_table) <= 50)
+        self.assertEqual(ponderer.get_statistics(), {"hits": 1, "misses": 0})
+
+    def test_time_spent_pondering_counts(self):
+        """A hit after pondering longer than the move time answers right away.
+        """
+        game = CheckerGame()
+        ponderer = Ponderer()
+        ponderer.start(game, {"start": 22, "end": 18})
+        while ponderer.latest_result is None:
+            ponderer.latest_result = ponderer.results.get()[1]
+        time.sleep(0.2)
+
+        start_time = time.perf_counter()
+        result = ponderer.hit({"start": 22, "end": 18}, seconds=0.1)
+
+        self.assertTrue(time.perf_counter() - start_time < 1.0)
+        self.assertTrue(result["depth"] >= 1)
+
+    def test_miss_cancels(self):
+        """Any other move stops the background process and leaves the table empty.
+        """
+        game = CheckerGame()
+        ponderer = Ponderer()
+        ponderer.start(game, {"start": 22, "end": 18})
+        process = ponderer.process
+
+        self.assertEqual(ponderer.hit({"start": 21, "end": 17}, depth=4), None)
+        self.assertFalse(ponderer.is_pondering())
+        self.assertFalse(process.is_alive())
+        self.assertEqual(len(ponderer.searcher.transposition_table), 0)
+        self.assertEqual(ponderer.get_statistics(), {"hits": 0, "misses": 1})
+
+class ProofNumberSearchTests(TestCase):
+    """Confirm the solver proves forced wins and gives up when the tree is full.
+    """
+
+    def set_position(self, fen):
+        game = CheckerGame()
+        position = TextInput.parse_fen(fen)
+        game.set_position(position["pieces"], position["turn"])
+        return game
+
+    def test_proves_forced_win(self):
+        """Two kings trap a lone king in the corner, and the line ends with Black out of pieces.
+        """
+        game = self.set_position("W:WK18,K27:BK4")
+
+        solution = ProofNumberSearch().solve(game)
+
+        self.assertEqual(solution["result"], "win")
+        self.assertEqual(len(solution["line"]) % 2, 1)
+        for move in solution["line"]:
+            game.apply_move(move)
+        self.assertEqual(game.get_winner(), "White")
+
+    def test_packed_moves_and_proof_lengths(self):
+        """The tree holds packed moves, and the winning line is as long as the root's proof length.
+        """
+        search = ProofNumberSearch()
+        solution = search.solve(self.set_position("W:WK18,K27:BK4"))
+
+        self.assertEqual(search.moves.typecode, "q")
+        self.assertEqual(search.get_proof_lengths()[0], len(solution["line"]))
+
+    def test_disproves_within_ply_limit(self):
+        """The same win can't be forced in three plies.
+        """
+        solution = ProofNumberSearch(max_plies=3).solve(self.set_position("W:WK18,K27:BK4"))
+
+        self.assertEqual(solution["result"], "no win")
+        self.assertEqual(solution["line"], [])
+
+    def test_tree_stays_bounded(self):
+        """The search gives up once the tree is full.
+        """
+        solution = ProofNumberSearch(max_nodes=100).solve(CheckerGame())
+
+        self.assertEqual(solution["result"], "unknown")
+        self.assertTrue(solution["nodes"] <= 100)
+
+class EngineProtocolTests(TestCase):
+    """Confirm the engine answers protocol commands.
+    """
+
+    def run_commands(self, commands):
+        output = io.StringIO()
+        EngineProtocol(input=io.StringIO("\n".join(commands) + "\n"), output=output).run()
+        return output.getvalue().splitlines()
+
+    def test_search_from_moves(self):
+        """The engine plays the moves, searches to the depth and reports the best move.
+        """
+        lines = self.run_commands(["uci", "isready", "position startpos moves 22-18 11-15", "go depth 3"])
+
+        self.assertEqual(lines[:3], ["id name terminal-checkers", "uciok", "readyok"])
+        self.assertTrue(lines[-2].startswith("info depth 3 "))
+        best_move = lines[-1].split()[1]
+
+        game = CheckerGame()
+        game.apply_move(TextInput.parse_move("22-18"))
+        game.apply_move(TextInput.parse_move("11-15"))
+        self.assertIsNotNone(game.find_legal_move(TextInput.parse_move(best_move)))
+
+    def test_stop_infinite_search(self):
+        """An infinite search keeps going until it is stopped, then reports the best move.
+        """
+        lines = self.run_commands(["position fen W:W18,K30:B15,8,K1", "go infinite", "stop", "quit"])
+
+        self.assertTrue(lines[-1].startswith("bestmove "))
+
+    def test_won_infinite_search_waits_for_stop(self):
+        """An infinite search that finds a win holds its best move until stop, and a ponder search until ponderhit.
+        """
+        searched = threading.Event()
+        searcher = AlphaBetaSearch()
+        search = searcher.search
+
+        def search_and_signal(*args, **kwargs):
+            result = search(*args, **kwargs)
+            searched.set()
+            return result
+
+        searcher.search = search_and_signal
+        output = io.StringIO()
+        protocol = EngineProtocol(output=output, searcher=searcher)
+        protocol.handle_command("position fen W:W18:B15")
+
+        for go_command, release_command in [("go infinite", "stop"), ("go ponder", "ponderhit")]:
+            searched.clear()
+            protocol.handle_command(go_command)
+            self.assertTrue(searched.wait(5))
+            time.sleep(0.05)
+            self.assertFalse("bestmove" in output.getvalue())
+
+            protocol.handle_command(release_command)
+            if protocol.search_thread is not None:
+                protocol.search_thread.join(5)
+            self.assertEqual(output.getvalue().splitlines()[-1], "bestmove 18x11")
+            output.seek(0)
+            output.truncate()
+
+    def test_ponder_hit_without_clock_uses_default_time(self):
+        """After ponderhit, a ponder search with no time given still answers on its own.
+        """
+        output = io.StringIO()
+        protocol = EngineProtocol(output=output)
+        protocol.DEFAULT_PONDER_HIT_SECONDS = 0.1
+        protocol.handle_command("position startpos")
+        protocol.handle_command("go ponder")
+        time.sleep(0.05)
+        self.assertFalse("bestmove" in output.getvalue())
+
+        protocol.handle_command("ponderhit")
+        protocol.search_thread.join(5)
+        self.assertFalse(protocol.search_thread.is_alive())
+        self.assertTrue(output.getvalue().splitlines()[-1].startswith("bestmove "))
+
+    def test_bad_commands(self):
+        """Bad positions and unknown commands are reported, and the engine keeps going.
+        """
+        lines = self.run_commands(["position fen Q:W99", "position startpos moves 22-99", "jump", "isready"])
+
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith("info string invalid position"))
+        self.assertEqual(lines[1], "info string illegal move 22-99")
+        self.assertEqual(lines[2], "info string unknown command jump")
+        self.assertEqual(lines[3], "readyok")
+
+@skipIf(numpy is None, "NumPy is not installed")
+class BatchPlayoutTests(TestCase):
+    """Confirm many random games can be played at once.
+    """
+
+    def setUp(self):
+        self.batch_playout = BatchPlayout(seed=0)
+
+    def test_move_masks_match_game(self):
+        """The first step of every move matches the game's legal moves.
+        """
+        game = CheckerGame()
+        for move in ["22-18", "11-15"]:
+            game.apply_move(TextInput.parse_move(move))
+
+        board, turn = self.batch_playout.encode_game(game)
+        simple, jumps = self.batch_playout.get_move_masks(
+            board[None].copy(),
+            numpy.array([turn], dtype=numpy.int8),
+            numpy.zeros(1, dtype=numpy.intp),
+        )
+
+        # The piece on 18 must jump over 15. Other pieces can still move normally.
+        legal_moves = game.get_current_legal_moves()
+        self.assertEqual(
+            [int(location) for location in numpy.nonzero(jumps[0].any(axis=0))[0]],
+            [move["start"] for move in legal_moves if "jumps_over" in move]
+        )
+        self.assertEqual(
+            int(simple.sum()),
+            len([move for move in legal_moves if not "jumps_over" in move])
+        )
+
+    def test_counts_results_per_position(self):
+        """A position where White can jump the last piece is always won.
+        """
+        winning_game = CheckerGame()
+        winning_game.board.arrange_board({
+            11: {
+                "color": "white",
+                "type" : "man",
+            },
+            8: {
+                "color": "black",
+                "type" : "man",
+            },
+        })
+
+        results = self.batch_playout.play([winning_game, CheckerGame()], games_per_position=50)
+
+        self.assertEqual(results[0], {"wins": 50, "draws": 0, "losses": 0})
+        self.assertEqual(sum(results[1].values()), 50)
+
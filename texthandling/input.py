@@ -1,134 +1,204 @@
+import string
+
+from components.geometry import BoardGeometry
+
 class InvalidLocationException(Exception):
     pass
 
+class InvalidMoveException(Exception):
+    pass
+
+class InvalidPositionException(Exception):
+    pass
+
+def build_location_tokens(size=8):
+    """Returns a dict mapping every string that names a playable square to its row, column and position.
+    Positions are written 1-32 on an 8x8 board. Squares are also written as columns and rows, like a1 or H8.
+    """
+    geometry = BoardGeometry.for_size(size)
+    location_tokens = {}
+
+    for position in range(1, geometry.squares + 1):
+        row, column = geometry.coordinates_by_location[position]
+
+        location = {
+            "row" : row,
+            "column" : column,
+            "position" : position,
+        }
+
+        location_tokens[str(position)] = location
+        column_character = string.ascii_lowercase[column - 1]
+        location_tokens[column_character + str(row)] = location
+        location_tokens[column_character.upper() + str(row)] = location
+
+    return location_tokens
+
+# Every valid location string, computed once per board size.
+LOCATION_TOKENS_BY_SIZE = {
+    8: build_location_tokens(8),
+}
+LOCATION_TOKENS = LOCATION_TOKENS_BY_SIZE[8]
+
+def get_location_tokens(size):
+    """Returns the location tokens for the given board size, building them the first time.
+    """
+    location_tokens = LOCATION_TOKENS_BY_SIZE.get(size, None)
+    if location_tokens is None:
+        location_tokens = build_location_tokens(size)
+        LOCATION_TOKENS_BY_SIZE[size] = location_tokens
+    return location_tokens
+
 class TextInput(object):
     @staticmethod
-    def parse_location(string_location):
-        """Tries to convert the location and return a dict.
-        Throws an InvalidLocationException if it can't interpret.
+    def parse_location(string_location, size=8):
+        """Given a string representing a checkers location, return a dict with the row and column.
+        Use size for boards larger than 8x8.
+        Raises a InvalidLocationException if it fails.
         """
-        try:
-            return TextInput.parse_chess_location(string_location)
-        except InvalidLocationException:
-            raise
+        location_tokens = LOCATION_TOKENS if size == 8 else get_location_tokens(size)
+        location = location_tokens.get(string_location, None)
+        if location is None:
+            # Give surrounding whitespace one more chance.
+            location = location_tokens.get(string_location.strip(), None)
+            if location is None:
+                raise InvalidLocationException("Location is invalid, {loc}".format(loc=string_location))
+
+        # Return a copy so callers can't change the table.
+        return dict(location)
 
     @staticmethod
-    def parse_location(string_location):
-        """Given a string representing a checkers location, return a dict with the row and column.
+    def parse_position(string_location, size=8):
+        """Given a string representing a checkers location, return the position (1-32 on an 8x8 board).
         Raises a InvalidLocationException if it fails.
         """
+        return TextInput.parse_location(string_location, size)["position"]
 
-        # Convert it into an integer. Raise an error if it fails.
-        try:
-            position = int(string_location)
-        except ValueError:
-            coords = TextInput.parse_chess_position(string_location)
-
-            # Make sure the coordinates are reachable on a checker board.
-            # If the column is 1 3 5 7 , then the row must be odd.
-            if coords['column'] % 2 == 1 and coords['row'] % 2 == 0:
-                raise InvalidLocationException
-            # If the column is 2 4 6 8 , then the row must be even.
-            if coords['column'] % 2 == 0 and coords['row'] % 2 == 1:
-                raise InvalidLocationException
-
-            # Calculate the position based on the row and column.
-            # Because chess and checkers counting row directions are reversed, count down from 8 and multiply by 4.
-            chess_position = (8 - coords['row']) * 4
-            # Subtract the column by 1, then Divide by 2 and add 1 again to get the column position on the row.
-            chess_position += ((coords['column'] - 1) / 2) + 1
-
-            return {
-                "row" : coords['row'],
-                "column" : coords['column'],
-                "position" : chess_position,
-            }
-
-        # position should be between 1 and 32 (inclusive)
-        if position < 1 or position > 32:
-            raise InvalidPositionException
-
-        # Position starts at 1, so subtract 1 to make the math easy.
-        math_position = position -1
-
-        # Mod by 4 to get the slot on the given row.
-        slot = (math_position % 4) + 1
-
-        # Divide by 4 to figure out how many rows from the top. (Row 8 is the highest row)
-        row = 8 - int(math_position / 4)
-
-        # If the row is even, the column is in the 2 * slot column
-        if row % 2 == 0:
-            column = 2 * slot
-        else:
-            # If the row is odd, the column is in the 2 * slot - 1 column
-            column = 2 * slot - 1
-
+    @staticmethod
+    def parse_chess_position(string_location, size=8):
+        """Given a string representing a location on a chess board, like b8, return a dict with the row and column.
+        Only playable squares are locations.
+        Raises a InvalidLocationException if it fails.
+        """
+        location = TextInput.parse_location(string_location, size)
         return {
-            "row" : row,
-            "column" : column,
-            "position" : position,
+            "column": location["column"],
+            "row": location["row"],
         }
 
     @staticmethod
-    def parse_chess_position(string_location):
-        """Given a string representing a location on a chess board, try to return the row and column.
-        Raises a InvalidLocationException if it fails.
+    def parse_move(string_move, size=8):
+        """Given a string representing a move, return a dict with the start, the end and the landings.
+        Simple moves use a dash (11-15). Jumps list every landing, separated by an x (22x15x8).
+        Use size for boards larger than 8x8.
+        Raises a InvalidMoveException if it fails.
         """
-        # The first character should be a letter.
-        try:
-            raw_column = string_location[0]
-        except IndexError:
-            raise InvalidLocationException
-
-        column_character_to_column = {
-            "a": 1,
-            "b": 2,
-            "c": 3,
-            "d": 4,
-            "e": 5,
-            "f": 6,
-            "g": 7,
-            "h": 8,
-
-            "A": 1,
-            "B": 2,
-            "C": 3,
-            "D": 4,
-            "E": 5,
-            "F": 6,
-            "G": 7,
-            "H": 8,
-
-            "1": 1,
-            "2": 2,
-            "3": 3,
-            "4": 4,
-            "5": 5,
-            "6": 6,
-            "7": 7,
-            "8": 8,
-        }
+        location_tokens = LOCATION_TOKENS if size == 8 else get_location_tokens(size)
 
-        column = None
-        try:
-            column = column_character_to_column[raw_column]
-        except KeyError:
-            raise InvalidLocationException
+        # Jumps use x, simple moves use -.
+        if "X" in string_move:
+            string_move = string_move.replace("X", "x")
 
-        # The remaining letters should be a number.
-        try:
-            raw_row = string_location[1:]
-        except IndexError:
-            raise InvalidLocationException
+        if "x" in string_move:
+            raw_locations = string_move.split("x")
+            is_jump = True
+        else:
+            raw_locations = string_move.split("-")
+            is_jump = False
+
+        # A move needs at least a start and an end. Simple moves only have those two.
+        location_count = len(raw_locations)
+        if location_count < 2 or (not is_jump and location_count != 2):
+            raise InvalidMoveException("Move is invalid, {move}".format(move=string_move))
+
+        positions = []
+        for raw_location in raw_locations:
+            location = location_tokens.get(raw_location, None)
+            if location is None:
+                location = location_tokens.get(raw_location.strip(), None)
+                if location is None:
+                    raise InvalidMoveException("Move is invalid, {move}".format(move=string_move))
+            positions.append(location["position"])
+
+        move = {
+            "start": positions[0],
+            "end": positions[-1],
+        }
+        if is_jump:
+            move["lands"] = positions[1:]
+        return move
 
-        try:
-            row = int(raw_row)
-        except ValueError:
-            raise InvalidLocationException
+    @staticmethod
+    def parse_moves(string_moves, size=8):
+        """Parse a list of move strings in one call. See parse_move.
+        Returns a list of move dicts in the same order.
+        Raises a InvalidMoveException that names the index of the first move it can't parse.
+        """
+        parse_move = TextInput.parse_move
+        moves = []
+        for index, string_move in enumerate(string_moves):
+            try:
+                moves.append(parse_move(string_move, size))
+            except InvalidMoveException:
+                raise InvalidMoveException("Move {index} is invalid, {move}".format(index=index, move=string_move))
+        return moves
+
+    @staticmethod
+    def parse_fen(string_position, size=8):
+        """Given a position in FEN, like W:W21,22,K30:B1-12, return a dict with the turn and the pieces.
+        The first letter is the color to move. Each color lists its locations, with K marking kings
+        and a dash marking a range of men. A [FEN "..."] tag and a trailing period are allowed.
+        The pieces are in the format Checkerboard.arrange_board takes.
+        Raises a InvalidPositionException if it fails.
+        """
+        location_tokens = LOCATION_TOKENS if size == 8 else get_location_tokens(size)
+
+        fen = string_position.strip()
+        if fen.startswith("[FEN") and fen.endswith("]"):
+            fen = fen[4:-1].strip().strip('"')
+        fen = fen.rstrip(".")
+
+        sections = fen.split(":")
+        turn = {"W": "White", "B": "Black"}.get(sections[0].strip().upper(), None)
+        if turn is None or len(sections) > 3:
+            raise InvalidPositionException("Position is invalid, {fen}".format(fen=string_position))
+
+        pieces = {}
+        for section in sections[1:]:
+            section = section.strip()
+            color = {"W": "white", "B": "black"}.get(section[:1].upper(), None)
+            if color is None:
+                raise InvalidPositionException("Position is invalid, {fen}".format(fen=string_position))
+
+            for token in section[1:].split(","):
+                token = token.strip()
+                if not token:
+                    continue
+
+                checker_type = "man"
+                if token[:1] in ("K", "k"):
+                    checker_type = "king"
+                    token = token[1:]
+
+                # A range like 1-12 stands for every location in between.
+                bounds = token.split("-")
+                try:
+                    positions = [location_tokens[bound.strip()]["position"] for bound in bounds]
+                except KeyError:
+                    raise InvalidPositionException("Position is invalid, {fen}".format(fen=string_position))
+                # Ranges run from the lower location up, so 12-1 is as invalid as 1-2-3.
+                if len(positions) > 2 or positions[0] > positions[-1]:
+                    raise InvalidPositionException("Position is invalid, {fen}".format(fen=string_position))
+
+                for position in range(positions[0], positions[-1] + 1):
+                    if position in pieces:
+                        raise InvalidPositionException("Location is used twice, {loc}".format(loc=position))
+                    pieces[position] = {
+                        "color": color,
+                        "type": checker_type,
+                    }
 
-        # Return a dict with the row and column.
         return {
-            "column": column,
-            "row": row,
+            "turn": turn,
+            "pieces": pieces,
         }
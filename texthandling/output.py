@@ -0,0 +1,26 @@
+class TextOutput(object):
+    @staticmethod
+    def format_move(move):
+        """Given a move dict, return it as a string that TextInput.parse_move understands.
+        Simple moves use a dash (11-15). Jumps list every landing, separated by an x (22x15x8).
+        """
+        if "lands" in move:
+            return "x".join(str(location) for location in [move["start"]] + list(move["lands"]))
+        return "{start}-{end}".format(start=move["start"], end=move["end"])
+
+    @staticmethod
+    def format_fen(game):
+        """Given a CheckerGame, return its position in FEN, like W:W21,22,K30:B1,2,3.
+        TextInput.parse_fen reads it back.
+        """
+        sections = {"White": [], "Black": []}
+        for location in sorted(game.board.pieces_by_location):
+            checker = game.board.pieces_by_location[location]
+            prefix = "K" if checker.is_king else ""
+            sections[checker.get_color()].append(prefix + str(location))
+
+        return "{turn}:W{white}:B{black}".format(
+            turn = game.get_current_turn()[0],
+            white = ",".join(sections["White"]),
+            black = ",".join(sections["Black"]),
+        )